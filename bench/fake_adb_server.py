@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+# Scripted adb server speaking the smart-socket protocol, for the benchmarks.
+import argparse
+import random
+import re
+import socket
+import struct
+import threading
+import time
+
+SCRIPT = re.compile(rb"\{ (?P<cmd>.*?)\n\} </dev/null\nprintf '\\n(?P<marker>\w+) %d\\n' \$\?; "
+                    rb"printf '\\n(?P=marker)\\n' >&2\n", re.S)
+
+MEDIA_CODECS = """<MediaCodecs><Encoders>
+<MediaCodec name="c2.fake.avc.encoder" type="video/avc"><Limit name="concurrent-instances" max="{n}" /></MediaCodec>
+<MediaCodec name="c2.fake.hevc.encoder" type="video/hevc"><Limit name="concurrent-instances" max="{n}" /></MediaCodec>
+<MediaCodec name="c2.android.avc.encoder" type="video/avc"><Limit name="concurrent-instances" max="16" /></MediaCodec>
+</Encoders></MediaCodecs>
+"""
+
+
+class FakeAdbServer:
+    def __init__(self, port: int, devices: int = 1, latency: float = 0.0, shell_latency: float = 0.0,
+                 connect_fail_rate: float = 0.0, shell_fail_rate: float = 0.0, sessions: int = 4,
+                 stale_connect: float = 0.0, restart: float = 0.1):
+        self.port = port
+        self.serials = [f"FAKE{i:04d}" for i in range(1, devices + 1)]
+        self.latency = latency
+        self.shell_latency = shell_latency
+        self.connect_fail_rate = connect_fail_rate
+        self.shell_fail_rate = shell_fail_rate
+        self.sessions = sessions
+        self.stale_connect = stale_connect
+        self.restart = restart
+        self.connected: set[str] = set()
+        self.tcp: set[int] = set()  # devices whose adbd was switched to TCP mode
+        self.offline: set[str] = set()
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.generation = 0
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("127.0.0.1", port))
+        self.sock.listen(128)
+        self.port = self.sock.getsockname()[1]
+
+    def serve_forever(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def start(self) -> "FakeAdbServer":
+        threading.Thread(target=self.serve_forever, name="fake-adb", daemon=True).start()
+        return self
+
+    def close(self):
+        self.sock.close()
+
+    @staticmethod
+    def _recv_exact(conn, size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    def _request(self, conn) -> str:
+        return self._recv_exact(conn, int(self._recv_exact(conn, 4), 16)).decode()
+
+    @staticmethod
+    def _okay(conn, payload: bytes | None = None):
+        conn.sendall(b"OKAY" + (b"" if payload is None else b"%04x" % len(payload) + payload))
+
+    @staticmethod
+    def _fail(conn, message: bytes):
+        conn.sendall(b"FAIL" + b"%04x" % len(message) + message)
+
+    def _devices(self) -> bytes:
+        with self.lock:
+            lines = [f"{s} {'offline' if s in self.offline else 'device'} usb:1-{i} product:fake "
+                     f"model:Fake_{i} device:fake transport_id:{i}" for i, s in enumerate(self.serials, 1)]
+            lines += [f"{s} device product:fake model:Fake device:fake transport_id:{100 + i}"
+                      for i, s in enumerate(sorted(self.connected))]
+        return ("\n".join(lines) + "\n").encode()
+
+    def _changed(self):
+        with self.changed:
+            self.generation += 1
+            self.changed.notify_all()
+
+    def _restart_adbd(self, serial: str):
+        # the transport drops while adbd restarts, then the device is back
+        with self.lock:
+            self.offline.add(serial)
+        self._changed()
+        time.sleep(self.restart)
+        with self.lock:
+            self.offline.discard(serial)
+        self._changed()
+
+    def _track(self, conn):
+        seen = -1
+        while True:
+            with self.changed:
+                while self.generation == seen:
+                    self.changed.wait()
+                seen = self.generation
+            devices = self._devices()
+            conn.sendall(b"%04x" % len(devices) + devices)
+
+    def _reachable(self, address: str) -> bool:
+        return 1 <= self._serial_index(address) <= len(self.serials)
+
+    def _serial_index(self, serial: str) -> int:
+        if serial in self.serials:
+            return self.serials.index(serial) + 1
+        octet = serial.split(":")[0].rsplit(".", 1)[-1]
+        return int(octet) - 49 if octet.isdigit() else 1
+
+    def shell(self, serial: str, cmd: str) -> tuple[int, bytes]:
+        time.sleep(self.shell_latency)
+        if self.shell_fail_rate and random.random() < self.shell_fail_rate:
+            return 1, b"error: injected failure\n"
+        index = self._serial_index(serial)
+        if "wlan0" in cmd:
+            return 0, f"3: wlan0: <UP>\n    inet 192.168.1.{49 + index}/24 brd 192.168.1.255\n".encode()
+        if cmd.startswith("getprop"):
+            props = {"ro.product.model": f"Fake {index}", "ro.serialno": self.serials[index - 1],
+                     "ro.build.fingerprint": "fake/fake/fake:14/UP1A/1:user/release-keys",
+                     "ro.build.version.sdk": "34"}
+            names = [part.split()[1] for part in cmd.split(";") if len(part.split()) > 1]
+            if names:
+                return 0, "".join(f"{props.get(name, '')}\n" for name in names).encode()
+            return 0, "".join(f"[{k}]: [{v}]\n" for k, v in props.items()).encode()
+        if "media_codecs" in cmd:
+            return 0, MEDIA_CODECS.format(n=self.sessions).encode()
+        if cmd.startswith("cmd package resolve-activity"):
+            return 0, f"priority=0 preferredOrder=0 match=0x108000\n{cmd.split()[-1]}/.MainActivity\n".encode()
+        if cmd.startswith("am start"):
+            return 0, f"Starting: Intent {{ cmp={cmd.split()[-1]} }}\n".encode()
+        if "/proc/net/wireless" in cmd:
+            return 0, (b" wlan0: 0000   60.  -55.  -256        0      0      0      0      0        0\n"
+                       b"mWifiInfo SSID: fake, Link speed: 866Mbps, RSSI: -55\n")
+        return 0, b""
+
+    def _interactive(self, conn, serial: str):
+        buffered = b""
+        while True:
+            packet_id, size = struct.unpack("<BI", self._recv_exact(conn, 5))
+            buffered += self._recv_exact(conn, size)
+            while m := SCRIPT.search(buffered):
+                buffered = buffered[m.end():]
+                code, out = self.shell(serial, m.group("cmd").decode())
+                out += b"\n" + m.group("marker") + b" %d\n" % code
+                err = b"\n" + m.group("marker") + b"\n"
+                conn.sendall(struct.pack("<BI", 1, len(out)) + out + struct.pack("<BI", 2, len(err)) + err)
+
+    def _handle(self, conn):
+        try:
+            request = self._request(conn)
+            time.sleep(self.latency)
+            if request == "host:version":
+                self._okay(conn, b"0029")
+            elif request == "host:devices-l":
+                self._okay(conn, self._devices())
+            elif request.startswith("host:connect:"):
+                address = request[len("host:connect:"):]
+                if not self._reachable(address):
+                    # nobody answers on that address any more: adb gives up after its connect timeout
+                    time.sleep(self.stale_connect)
+                    self._okay(conn, f"failed to connect to {address}: Connection timed out".encode())
+                elif self._serial_index(address) not in self.tcp:
+                    # adbd only listens on the network after tcpip
+                    self._okay(conn, f"failed to connect to {address}: Connection refused".encode())
+                elif self.connect_fail_rate and random.random() < self.connect_fail_rate:
+                    self._okay(conn, f"failed to connect to {address}".encode())
+                else:
+                    with self.lock:
+                        self.connected.add(address)
+                    self._changed()
+                    self._okay(conn, f"connected to {address}".encode())
+            elif request.startswith("host:disconnect:"):
+                address = request[len("host:disconnect:"):]
+                with self.lock:
+                    if address:
+                        self.connected.discard(address)
+                    else:
+                        self.connected.clear()
+                self._changed()
+                self._okay(conn, b"disconnected")
+            elif request in ("host:track-devices", "host:track-devices-l"):
+                self._okay(conn)
+                self._track(conn)
+            elif request == "host:kill":
+                self._okay(conn)
+            elif request.startswith("host:transport"):
+                serial = request.partition("host:transport:")[2] or self.serials[0]
+                self._okay(conn)
+                service = self._request(conn)
+                if service == "shell,v2,raw:":
+                    self._okay(conn)
+                    self._interactive(conn, serial)
+                elif service.startswith("shell,v2,raw:"):
+                    self._okay(conn)
+                    code, out = self.shell(serial, service[len("shell,v2,raw:"):])
+                    conn.sendall(struct.pack("<BI", 1, len(out)) + out + struct.pack("<BI", 3, 1) + bytes([code]))
+                elif service.startswith("tcpip:"):
+                    self._okay(conn)
+                    with self.lock:
+                        self.tcp.add(self._serial_index(serial))
+                    conn.sendall(f"restarting in TCP mode port: {service[6:]}\n".encode())
+                    threading.Thread(target=self._restart_adbd, args=(serial,), daemon=True).start()
+                else:
+                    self._fail(conn, b"unknown service")
+            else:
+                self._fail(conn, b"unknown host service")
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+
+class FakeAdbd:
+    """A phone with adb over Wi-Fi on: answers the CNXN handshake with an AUTH challenge."""
+
+    def __init__(self, host: str, port: int, reply: bytes | None = None):
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(16)
+        self.reply = reply if reply is not None else struct.pack(
+            "<6I", 0x48545541, 1, 0, 20, 0, 0x48545541 ^ 0xFFFFFFFF) + bytes(20)
+        self.connections = 0
+
+    def serve_forever(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            with conn:
+                try:
+                    conn.recv(64)
+                    conn.sendall(self.reply)
+                except OSError:
+                    pass
+
+    def start(self) -> "FakeAdbd":
+        threading.Thread(target=self.serve_forever, name="fake-adbd", daemon=True).start()
+        return self
+
+    def close(self):
+        self.sock.close()
+
+
+def main():
+    p = argparse.ArgumentParser(description="Fake adb server for benchmarks")
+    p.add_argument("--port", type=int, default=15037)
+    p.add_argument("--devices", type=int, default=1)
+    p.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    p.add_argument("--shell-latency", type=float, default=0.0, help="Seconds added to every shell command")
+    p.add_argument("--connect-fail-rate", type=float, default=0.0)
+    p.add_argument("--shell-fail-rate", type=float, default=0.0)
+    p.add_argument("--sessions", type=int, default=4, help="Hardware encoder concurrent-instances")
+    p.add_argument("--stale-connect", type=float, default=0.0,
+                   help="Seconds before a connect to an address with no device fails")
+    args = p.parse_args()
+    server = FakeAdbServer(args.port, args.devices, args.latency, args.shell_latency,
+                           args.connect_fail_rate, args.shell_fail_rate, args.sessions, args.stale_connect)
+    print(f"Fake adb server on 127.0.0.1:{server.port}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
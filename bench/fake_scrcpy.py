@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Stand-in for the scrcpy binary: prints the log lines the manager parses.
+#
+#   FAKE_SCRCPY_READY   seconds until the first texture (default 0.3)
+#   FAKE_SCRCPY_CRASH   probability of an encoder failure at startup (default 0)
+#   FAKE_SCRCPY_STOP    seconds spent shutting down after SIGTERM (default 0)
+import os
+import random
+import signal
+import sys
+import time
+
+ENCODERS = """[server] INFO: List of video encoders:
+    --video-codec=h264 --video-encoder=c2.fake.avc.encoder         (hw) [vendor]
+    --video-codec=h264 --video-encoder=c2.android.avc.encoder      (sw)
+    --video-codec=h264 --video-encoder=OMX.google.h264.encoder     (sw) (alias for c2.android.avc.encoder)
+    --video-codec=h265 --video-encoder=c2.fake.hevc.encoder        (hw) [vendor]
+    --video-codec=h265 --video-encoder=c2.android.hevc.encoder     (sw)
+[server] INFO: List of audio encoders:
+    --audio-codec=opus --audio-encoder=c2.android.opus.encoder     (sw)
+    --audio-codec=aac --audio-encoder=c2.android.aac.encoder       (sw)
+    --audio-codec=flac --audio-encoder=c2.android.flac.encoder     (sw)
+"""
+
+
+def main():
+    ready = float(os.environ.get("FAKE_SCRCPY_READY", 0.3))
+    crash = float(os.environ.get("FAKE_SCRCPY_CRASH", 0))
+    stop = float(os.environ.get("FAKE_SCRCPY_STOP", 0))
+
+    def on_term(signum, frame):
+        time.sleep(stop)
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, on_term)
+    print("scrcpy 3.1 <https://github.com/Genymobile/scrcpy>", flush=True)
+    if "--list-encoders" in sys.argv:
+        print(ENCODERS, end="", flush=True)
+        return
+    time.sleep(ready / 2)
+    if crash and random.random() < crash:
+        print("[server] ERROR: Could not open encoder: c2.fake.avc.encoder", flush=True)
+        sys.exit(1)
+    print("[server] INFO: Device: [Fake] fake Fake (Android 14)", flush=True)
+    if any(arg.startswith("--start-app") for arg in sys.argv):
+        print("[server] INFO: New display: 1080x2400/420 (id=2)", flush=True)
+    print("INFO: Renderer: opengl", flush=True)
+    time.sleep(ready / 2)
+    print("INFO: Texture: 1080x2400", flush=True)
+    while True:
+        time.sleep(1)
+        if "--print-fps" in sys.argv:
+            print("INFO: 60 fps", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# End-to-end timings of connect, launch, reload/all/dc/conn, shutdown and a cold
+# reconnect past a stale endpoint, against a scripted adb server and a fake scrcpy
+# binary, compared with bench/baseline.json.
+#
+#   python bench/run.py                     # 1, 5 and 20 windows, fail on regressions
+#   python bench/run.py --update-baseline   # store the medians as the new baseline
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import yaml
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+COMMANDS = ["reload", "all", "dc", "conn"]
+METRICS = ["connect", "launch", *COMMANDS, "shutdown", "stale"]
+STALE_SOCKET = "192.168.1.250:5555"
+
+
+class ScriptedPrompt:
+    def __init__(self, app, commands: list[str]):
+        self.app = app
+        self.commands = list(commands)
+        self.timings: dict[str, float] = {}
+        self._current = None
+        self._started = 0.0
+
+    def lap(self):
+        if self._current:
+            self.timings[self._current] = time.perf_counter() - self._started
+            self._current = None
+
+    def prompt(self, *args, **kwargs) -> str:
+        self.lap()
+        self._current = self.commands.pop(0)
+        # the loop runs the last command, then sees running is off
+        self.app.running = bool(self.commands)
+        self._started = time.perf_counter()
+        return self._current
+
+
+def write_config(path: Path, windows: int):
+    with open(ROOT / "config.exemple.yml", encoding="utf-8") as f:
+        data = yaml.safe_load(f)
+    data["App"]["apps_to_open"] = [f"com.fake.app{i}:App{i}" for i in range(1, windows)]
+    data["App"]["balance_cpus"] = False
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(data, f)
+
+
+def scenario(windows: int, work: Path) -> dict[str, float]:
+    from main import Scrcpy
+    from scrcpy.control import ControlClient
+
+    config = work / "config.yml"
+    write_config(config, windows)
+    app = Scrcpy(config)
+    app.args = argparse.Namespace(port=5555, config_dir=work, adb_backend="socket", fleet=False,
+                                  daemon=False, attach=False, socket=work / "scrcpy.sock",
+                                  discovery=False, subnet=[])
+    app._serve(app.args.socket)
+    timings = {}
+    try:
+        start = time.perf_counter()
+        device = app._connect_device(app.args.port, app.args.config_dir)
+        timings["connect"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        app._launch_all([device])
+        timings["launch"] = time.perf_counter() - start
+
+        # commands go through the control socket like the prompt's
+        client = ControlClient(app.args.socket)
+        app.session = ScriptedPrompt(app, COMMANDS)
+        app._interactive_loop(client)
+        client.close()
+        app.session.lap()
+        timings.update(app.session.timings)
+
+        start = time.perf_counter()
+        app._cleanup()
+        timings["shutdown"] = time.perf_counter() - start
+
+        # cold reconnect when the best known endpoint is a phone that left the network
+        for _ in range(5):
+            app.adb.history.attempt(STALE_SOCKET, True, 0.001)
+        start = time.perf_counter()
+        app._connect_device(app.args.port, app.args.config_dir)
+        timings["stale"] = time.perf_counter() - start
+        app.adb.disconnect()
+    finally:
+        app.control.stop()
+        app.supervisor.shutdown()
+        app.adaptive.stop()
+        app.telemetry.stop()
+        app.adb.close_sessions()
+        app.adb.tracker.stop()
+    return timings
+
+
+def run(args) -> dict[str, dict[str, float]]:
+    sys.path.insert(0, str(ROOT))
+    sys.path.insert(0, str(BENCH_DIR))
+    from fake_adb_server import FakeAdbServer
+
+    server = FakeAdbServer(0, latency=args.latency, shell_latency=args.shell_latency,
+                           connect_fail_rate=args.connect_fail_rate, sessions=args.sessions,
+                           stale_connect=args.stale_connect).start()
+    bin_dir = Path(tempfile.mkdtemp(prefix="scrcpy-bench-bin-"))
+    (bin_dir / "scrcpy").symlink_to(BENCH_DIR / "fake_scrcpy.py")
+    os.environ["ANDROID_ADB_SERVER_PORT"] = str(server.port)
+    os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ['PATH']}"
+    os.environ["FAKE_SCRCPY_READY"] = str(args.ready)
+    os.environ["FAKE_SCRCPY_CRASH"] = str(args.crash_rate)
+    os.environ["FAKE_SCRCPY_STOP"] = str(args.stop_delay)
+
+    results = {}
+    for windows in args.windows:
+        samples = []
+        for _ in range(args.repeat):
+            with tempfile.TemporaryDirectory(prefix="scrcpy-bench-") as work:
+                log = io.StringIO()
+                try:
+                    with contextlib.redirect_stdout(log):
+                        samples.append(scenario(windows, Path(work)))
+                except (Exception, SystemExit) as e:
+                    print(log.getvalue())
+                    raise SystemExit(f"{windows} window(s): scenario failed: {e!r}")
+        results[str(windows)] = {metric: round(statistics.median(s[metric] for s in samples), 4)
+                                 for metric in METRICS}
+        print(f"{windows:>3} window(s): " + "  ".join(f"{m} {results[str(windows)][m] * 1000:7.1f}ms"
+                                                     for m in METRICS))
+    server.close()
+    return results
+
+
+def parameters(args) -> dict:
+    return {"latency": args.latency, "shell_latency": args.shell_latency, "ready": args.ready,
+            "crash_rate": args.crash_rate, "connect_fail_rate": args.connect_fail_rate,
+            "stop_delay": args.stop_delay, "sessions": args.sessions, "stale_connect": args.stale_connect}
+
+
+def compare(results, baseline, tolerance: float, slack: float) -> list[str]:
+    regressions = []
+    for windows, metrics in results.items():
+        for metric, value in metrics.items():
+            base = baseline.get("results", {}).get(windows, {}).get(metric)
+            if base is not None and value > base * (1 + tolerance) + slack:
+                regressions.append(f"{windows} window(s) {metric}: {value * 1000:.1f}ms "
+                                   f"(baseline {base * 1000:.1f}ms)")
+    return regressions
+
+
+def main():
+    p = argparse.ArgumentParser(description="scrcpy manager end-to-end benchmarks")
+    p.add_argument("--windows", type=int, nargs="+", default=[1, 5, 20])
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--latency", type=float, default=0.002, help="Fake adb server delay per request (s)")
+    p.add_argument("--shell-latency", type=float, default=0.005, help="Fake device delay per shell command (s)")
+    p.add_argument("--ready", type=float, default=0.3, help="Fake scrcpy time to first frame (s)")
+    p.add_argument("--crash-rate", type=float, default=0.0, help="Fake scrcpy startup failure probability")
+    p.add_argument("--connect-fail-rate", type=float, default=0.0, help="adb connect failure probability")
+    p.add_argument("--stop-delay", type=float, default=0.0, help="Fake scrcpy shutdown time after SIGTERM (s)")
+    p.add_argument("--sessions", type=int, default=4, help="Fake hardware encoder session limit")
+    p.add_argument("--stale-connect", type=float, default=3.0,
+                   help="Fake adb connect timeout for an address with no device (s)")
+    p.add_argument("--baseline", type=Path, default=BENCH_DIR / "baseline.json")
+    p.add_argument("--update-baseline", action="store_true")
+    p.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown")
+    p.add_argument("--slack", type=float, default=0.05, help="Allowed absolute slowdown (s)")
+    args = p.parse_args()
+
+    results = run(args)
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"parameters": parameters(args), "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return
+    if not args.baseline.exists():
+        print("No baseline, run with --update-baseline first.")
+        return
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("parameters") != parameters(args):
+        print("Warning: baseline was recorded with different parameters.")
+    regressions = compare(results, baseline, args.tolerance, args.slack)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,80 @@
 # -*- coding: utf-8 -*-
 from scrcpy.enums import (AudioCodec, AudioSource, Bitrate, CameraSize, Orientation, VideoCodec)
-import yaml
+import copy
+import hashlib
+import json
+import os
 from pathlib import Path
 
+CACHE_VERSION = 1
+# generated argv depends on these as much as on config.yml
+ARGS_SOURCES = [Path(__file__), Path(__file__).parent / "scrcpy" / "options.py", Path(__file__).parent / "scrcpy" / "enums.py"]
+
+
+class ConfigCache:
+    def __init__(self, path: Path):
+        self.path = Path(path).with_name(f".{Path(path).name}.cache.json")
+        self.entry: dict = {}
+
+    @staticmethod
+    def _code() -> list[int]:
+        return [source.stat().st_mtime_ns for source in ARGS_SOURCES if source.exists()]
+
+    def load(self, path: Path) -> dict | None:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entry = json.load(f)
+            stat = os.stat(path)
+        except (OSError, ValueError):
+            return None
+        if entry.get("version") != CACHE_VERSION:
+            return None
+        if (entry.get("mtime_ns"), entry.get("size")) != (stat.st_mtime_ns, stat.st_size):
+            # touched or copied: same bytes are still a hit
+            if entry.get("sha1") != hashlib.sha1(Path(path).read_bytes()).hexdigest():
+                return None
+            entry["mtime_ns"], entry["size"] = stat.st_mtime_ns, stat.st_size
+        if entry.get("code") != self._code():
+            entry["args"] = {}
+        self.entry = entry
+        return entry["data"]
+
+    def store(self, path: Path, raw: bytes, data: dict):
+        stat = os.stat(path)
+        self.entry = {"version": CACHE_VERSION, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size,
+                      "sha1": hashlib.sha1(raw).hexdigest(), "code": self._code(), "data": data, "args": {}}
+        self.save()
+
+    def args(self, name: str | None) -> list[str] | None:
+        return self.entry.get("args", {}).get(name or "")
+
+    def put_args(self, name: str | None, args: list[str]):
+        if self.entry:
+            self.entry.setdefault("args", {})[name or ""] = args
+            self.save()
+
+    def save(self):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.entry, f)
+            os.replace(tmp, self.path)
+        except (OSError, TypeError, ValueError):
+            # read-only config dir or YAML that has no JSON form: just don't cache
+            self.entry = {}
+            try:
+                tmp.unlink()
+            except OSError:
+                pass
+
 
 class ScrcpyConfig:
     def __init__(self, path: Path = Path(__file__).parent / 'config.yml'):
+        self.cache = ConfigCache(path)
         data = self.load_config(path)
+        self.data = data
         self.port = data.get("port", "5555")
+        self.auto_reload = data.get("auto_reload", True)
 
         self.Window = self.WindowConfig(data.get("Window", {}))
         self.Device = self.DeviceConfig(data.get("Device", {}))
@@ -16,10 +83,35 @@ class ScrcpyConfig:
         self.Camera = self.CameraConfig(data.get("Camera", {}))
         self.Mouse = self.MouseConfig(data.get("Mouse", {}))
         self.App = self.AppConfig(data.get("App", {}))
+        self.Bandwidth = self.BandwidthConfig(data.get("Bandwidth", {}))
+        self.Adaptive = self.AdaptiveConfig(data.get("Adaptive", {}))
+        self.Telemetry = self.TelemetryConfig(data.get("Telemetry", {}))
+        self.Autotune = self.AutotuneConfig(data.get("Autotune", {}))
+        self.profiles: dict[str, dict] = data.get("Profiles") or {}
+        for alias, name in self.App.profiles.items():
+            if name not in self.profiles:
+                raise ValueError(f"Unknown profile '{name}' for {alias}")
+
+    def profile(self, name: str) -> "ScrcpyConfig":
+        if name not in self.profiles:
+            raise ValueError(f"Unknown profile '{name}'")
+        profile = self.profiles[name] or {}
+        config = copy.copy(self)
+        config.Window = self.WindowConfig({**(self.data.get("Window") or {}), **(profile.get("Window") or {})})
+        config.Video = self.VideoConfig({**(self.data.get("Video") or {}), **(profile.get("Video") or {})})
+        config.Audio = self.AudioConfig({**(self.data.get("Audio") or {}), **(profile.get("Audio") or {})})
+        return config
 
     def load_config(self, path: Path) -> dict:
-        with open(path, "r", encoding="utf-8") as f:
-            data = yaml.safe_load(f)
+        data = self.cache.load(path)
+        if data is not None:
+            return data
+        import yaml  # only needed on a cache miss
+
+        with open(path, "rb") as f:
+            raw = f.read()
+        data = yaml.load(raw, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+        self.cache.store(path, raw, data)
         return data
 
     class DeviceConfig:
@@ -52,6 +144,7 @@ class ScrcpyConfig:
             self.print_fps = data.get("print_fps", False)
             self.codec = VideoCodec.from_value(data.get("codec"))
             self.encoder = data.get("encoder", False)
+            self.auto_encoder = data.get("auto_encoder", True)
             self.lock_orientation = Orientation.from_value(data.get("lock_orientation"))
             self.orientation = Orientation.from_value(data.get("orientation"))
             self.crop = data.get("crop", False)
@@ -91,14 +184,86 @@ class ScrcpyConfig:
 
     Mouse: MouseConfig
 
+    class ResourceConfig:
+        def __init__(self, data: dict):
+            self.cpus = data.get("cpus", False)
+            self.nice = data.get("nice", False)
+            self.cpu_max = data.get("cpu_max", False)
+            self.memory_max = data.get("memory_max", False)
+
     class AppConfig:
         def __init__(self, data: dict):
-            apps_to_open: list[str] = data.get("apps_to_open", [])
+            apps_to_open: list[str | dict] = data.get("apps_to_open", [])
             self.apps_to_open: dict[str, str] = {}
-            for app in apps_to_open:
-                app, alias = app.split(":")
+            self.balance_cpus = data.get("balance_cpus", True)
+            self.cgroup_root = data.get("cgroup_root", False)
+            self.launch_concurrency = data.get("launch_concurrency", False)
+            self.tab_mode = data.get("tab_mode", False)
+            self.resources: dict[str, ScrcpyConfig.ResourceConfig] = {
+                "Main": ScrcpyConfig.ResourceConfig(data.get("resources") or {})}
+            self.priorities: dict[str, int] = {"Main": 0}
+            self.weights: dict[str, float] = {}
+            self.profiles: dict[str, str] = {"Main": data["profile"]} if data.get("profile") else {}
+            for index, app in enumerate(apps_to_open):
+                entry = app if isinstance(app, dict) else {}
+                if entry:
+                    app, alias = entry["app"], entry["alias"]
+                else:
+                    app, alias, *profile = app.split(":")
+                    entry = {"profile": profile[0]} if profile else {}
                 self.apps_to_open[alias] = app
+                self.resources[alias] = ScrcpyConfig.ResourceConfig(entry.get("resources") or {})
+                self.priorities[alias] = int(entry.get("priority", 100 + index))
+                self.weights[alias] = float(entry.get("weight", 1))
+                if entry.get("profile"):
+                    self.profiles[alias] = entry["profile"]
 
 
     App: AppConfig
 
+    class BandwidthConfig:
+        def __init__(self, data: dict):
+            self.budget = data.get("budget", False)
+            self.main_weight = data.get("main_weight", 3)
+            self.min_bitrate = data.get("min_bitrate", "1M")
+            self.scale_max_size = data.get("scale_max_size", False)
+            self.scale_fps = data.get("scale_fps", False)
+            self.tolerance = data.get("tolerance", 0.25)
+
+    Bandwidth: BandwidthConfig
+
+    class AdaptiveConfig:
+        def __init__(self, data: dict):
+            self.enabled = data.get("enabled", False)
+            self.interval = data.get("interval", 2)
+            self.target_fps = data.get("target_fps", False)
+            self.tolerance = data.get("tolerance", 0.2)
+            self.down_after = data.get("down_after", 3)
+            self.up_after = data.get("up_after", 15)
+            self.good_rssi = data.get("good_rssi", -67)
+            self.min_link_speed = data.get("min_link_speed", 54)
+            self.min_restart_interval = data.get("min_restart_interval", 30)
+            self.max_restarts_per_minute = data.get("max_restarts_per_minute", 4)
+
+    Adaptive: AdaptiveConfig
+
+    class TelemetryConfig:
+        def __init__(self, data: dict):
+            self.enabled = data.get("enabled", False)
+            self.port = data.get("port", 9464)
+            self.interval = data.get("interval", 2)
+            self.samples = data.get("samples", 300)
+
+    Telemetry: TelemetryConfig
+
+    class AutotuneConfig:
+        def __init__(self, data: dict):
+            self.enabled = data.get("enabled", True)
+            self.codecs = data.get("codecs", ["h264", "h265", "av1"])
+            self.bitrates = data.get("bitrates", ["4M", "8M", "16M"])
+            self.sizes = data.get("sizes", ["1280", "1920"])
+            self.duration = data.get("duration", 6)
+            self.tolerance = data.get("tolerance", 0.05)
+            self.min_fps = data.get("min_fps", 10)
+
+    Autotune: AutotuneConfig
@@ -1,204 +1,921 @@
 # -*- coding: utf-8 -*-
+import sys
+from scrcpy.startup import StartupProfile
+STARTUP = StartupProfile("--profile-startup" in sys.argv)  # before the other imports, to time them
 from config import ScrcpyConfig
 from scrcpy.options import ScrcpyOptions
 from scrcpy.adb_utils import AdbUtils, ADBError
+from scrcpy.fleet import Device, Fleet
+from scrcpy.race import Attempt, race
+from scrcpy.supervisor import Supervisor, WindowState
+from scrcpy.bandwidth import BandwidthPlanner, parse_rate
+from scrcpy.adaptive import AdaptiveController
+from scrcpy import autotune
+from scrcpy.launcher import CpuBalancer, Resources
+from scrcpy.scheduler import LaunchRequest, LaunchScheduler
+from scrcpy.telemetry import Telemetry
+from scrcpy.trace import Tracer, bind
+from scrcpy.config_watch import ConfigWatcher
+from scrcpy.control import ControlClient, ControlError, ControlServer, captured_output, parse_command
 import re
-from prompt_toolkit import PromptSession
-from prompt_toolkit.history import InMemoryHistory
 import argparse
+import os
 import re
 import signal
-import subprocess
+import threading
 import time
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+STARTUP.imported()
+
+KNOWN_ATTEMPTS = 3
+TABS = "Tabs"  # the tab mode window, its apps share one virtual display
 
 class Scrcpy:
-    def __init__(self):
+    def __init__(self, config_path: Path = Path(__file__).parent / 'config.yml'):
         self.args = None
-        self.config = ScrcpyConfig()
-        self.options = ScrcpyOptions(self.config)
-        self.adb = AdbUtils()
-        self.socket = ''
-        self.windows: dict[str, subprocess.Popen | None] = {}
+        self.config_path = config_path
+        with STARTUP.phase("config"):
+            self.config = ScrcpyConfig(config_path)
+            self.options = ScrcpyOptions(self.config)
+        self.adb: AdbUtils | None = None  # built once the port and config dir are known
+        self.fleet = Fleet()
+        self.supervisor = Supervisor()
+        self.balancer = CpuBalancer()
+        self.scheduler = LaunchScheduler(self.supervisor)
+        self.bandwidth = BandwidthPlanner(self.config)
+        self.shares: dict[str, int] = {}
+        self.profiles: dict[str, str] = {}
+        self.tuning: set[str] = set()
+        self.tune_lock = threading.Lock()
+        self.supervisor.listeners.append(self._on_window_state)
+        self.adaptive = AdaptiveController(self.config, self.adb, self.supervisor,
+                                           self._serial_of, self._restart_key)
+        self.telemetry = Telemetry(self.supervisor, int(self.config.Telemetry.samples),
+                                   float(self.config.Telemetry.interval))
+        self.tracer = Tracer()
+        self.tracer.listeners.append(self.telemetry.on_span)
+        self.commands_lock = threading.RLock()
+        self.watcher = ConfigWatcher(config_path, self._auto_reload)
+        self.control: ControlServer | None = None
+        self.supervisor.listeners.append(self._publish_state)
         self.running = True
-        self.session = PromptSession(history=InMemoryHistory())
+        self.session = None
         signal.signal(signal.SIGINT, self._handle_exit)
 
     def _handle_exit(self, signum, frame):
         print("\nInterrupted! Cleaning up...")
         self.running = False
         self._cleanup()
+        if self.control:
+            self.control.stop()
+        if self.adb:
+            self.adb.tracker.stop()
+            # os._exit below skips finalizers, the last connection to close checkpoints the WAL
+            self.adb.history.close()
+        if threading.current_thread() is not threading.main_thread():
+            # from a control request: SystemExit would only end that thread
+            sys.stdout.flush()
+            os._exit(0)
         exit(0)
 
-    def _cleanup(self):
-        for name, proc in self.windows.items():
-            if proc and proc.poll() is None:
-                proc.terminate()
-                try:
-                    proc.wait(5)
-                except subprocess.TimeoutExpired:
-                    proc.kill()
+    def _stop_windows(self, devices: list[Device]):
+        self.supervisor.stop_many([dev.key(alias) for dev in devices for alias in dev.windows])
+
+    def _cleanup(self, device: Device | None = None):
+        self._stop_windows([device] if device else list(self.fleet))
         if self.adb:
-            self.adb.disconnect()
-            print("ADB disconnected.")
+            if device:
+                self.adb.disconnect(device.socket)
+                print(f"ADB disconnected from {device.name}.")
+            else:
+                # only our own transports, the shared server may be driving other managers' phones
+                for dev in self.fleet:
+                    if dev.socket:
+                        self.adb.disconnect(dev.socket)
+                print("ADB disconnected.")
 
     def _parse_args(self):
         p = argparse.ArgumentParser(description="ADB over Wi-Fi utility")
         p.add_argument("--port", type=int, default=5555, help="ADB TCP port")
         p.add_argument("--config-dir", type=Path, default=Path(__file__).parent,
                        help="Directory to store last device info")
+        p.add_argument("--adb-backend", choices=["socket", "subprocess"], default="socket",
+                       help="Talk to the adb server directly or through the adb binary")
+        p.add_argument("--fleet", action="store_true",
+                       help="Connect every attached device and open a window set on each")
+        p.add_argument("--no-discovery", dest="discovery", action="store_false",
+                       help="Do not probe the local network for devices with adb over Wi-Fi on")
+        p.add_argument("--subnet", action="append", default=[],
+                       help="Network to probe instead of the local ones, e.g. 192.168.1.0/24 (repeatable)")
+        p.add_argument("--daemon", action="store_true",
+                       help="Run without a prompt, controlled through the JSON socket")
+        p.add_argument("--attach", action="store_true",
+                       help="Open a prompt on an already running manager")
+        p.add_argument("--socket", type=Path, default=None,
+                       help="Control socket path, defaults to <config-dir>/scrcpy.sock")
+        p.add_argument("--profile-startup", action="store_true",
+                       help="Print import and startup phase timings once the windows are up")
         return p.parse_args()
 
-    def _connect_device(self, port, config_dir):
-        self.adb = AdbUtils(port=port, config_dir=config_dir)
-        serial = ''
-
-        try:
-            last_socket, _ = self.adb.load_last_device()
-            if last_socket:
-                print(f"Trying last known device {last_socket}...")
-                if self.adb.connect_tcp(last_socket):
-                    print("Reconnected to last known device!")
-                    serial = last_socket
-                else:
-                    print("Could not reconnect, falling back to discovery.")
-
-            if not serial:
-                print("Discovering attached devices...")
-                self.adb.kill_server()
-                self.adb.disconnect()
-                serial = self.adb.get_device_serial() or ''
-                if not serial:
-                    print("No Wi-Fi device detected, trying USB...")
-                    serial = self.adb.check_usb_connection()
-                    self.adb.tcpip()
-
-            # Enable Wi-Fi and fetch IP
-            self.adb.shell(serial, "svc wifi enable")
-            ip = ''
+    def _wifi_socket(self, serial, port):
+        # Enable Wi-Fi and fetch IP
+        self.adb.shell(serial, "svc wifi enable")
+        ip = ''
+        with self.tracer.span("wifi_ip"):
             while not ip and self.running:
                 out = self.adb.shell(serial, "ip -f inet addr show wlan0")
                 m = re.search(r"inet (\d+\.\d+\.\d+\.\d+)", out)
                 if m:
                     ip = m.group(1)
-                else:
-                    time.sleep(0.5)
-
-            self.socket = f"{ip}:{port}"
-            print(f"Connecting to {self.socket}...")
-            if not self.adb.connect_tcp(self.socket):
-                raise ADBError("Could not connect over TCP")
-            print("Connected!")
-            return serial
-
+                elif self.adb.tracker.wait_gone(serial, 0.5):
+                    raise ADBError(f"{serial} went away while waiting for Wi-Fi")
+
+        socket = f"{ip}:{port}"
+        print(f"Connecting to {socket}...")
+        with self.tracer.span("tcp_connect"):
+            if not self.adb.connect_tcp(socket):
+                raise ADBError(f"Could not connect over TCP to {socket}")
+        return socket
+
+    def _register(self, serial, socket) -> Device:
+        device = self.fleet.add(serial, socket, self.adb.properties(serial))
+        self.adb.remember(serial, socket)
+        return device
+
+    def _adb_for(self, port, config_dir):
+        if self.adb is None or (self.adb.port, self.adb.config_dir) != (port, config_dir):
+            if self.adb:
+                self.adb.tracker.stop()
+            self.tracer.open(Path(config_dir) / "trace.log")
+            self.adb = AdbUtils(port=port, config_dir=config_dir, backend=self.args.adb_backend,
+                                tracer=self.tracer, subnets=self.args.subnet)
+            self.adb.tracker.listeners.append(self._publish_device)
+            self.adb.tracker.start()
+            self.adaptive.adb = self.adb
+        return self.adb
+
+    def _known_attempt(self, socket) -> Attempt:
+        def run(cancelled):
+            with self.tracer.span("last_device"):
+                if self.adb.connect_tcp(socket):
+                    return socket, False
+            if not cancelled.is_set():
+                self.adb.disconnect(socket)
+            return None
+
+        def undo(result, winner):
+            if result[0] != winner[0]:
+                self.adb.disconnect(result[0])
+        return Attempt(f"known {socket}", run, undo)
+
+    def _attached_attempt(self) -> Attempt:
+        def run(cancelled):
+            with self.tracer.span("discovery"):
+                entries = [(serial, state) for serial, state, _ in self.adb.device_list()]
+            # endpoints the server already has up, e.g. from another manager, before plain USB ones
+            for serial, state in sorted(entries, key=lambda e: ':' not in e[0]):
+                if state == "device":
+                    # a phone on the cable still has to be switched to TCP mode
+                    return serial, ':' not in serial
+            return None
+        return Attempt("attached", run)
+
+    def _discovery_attempt(self, tried) -> Attempt:
+        def run(cancelled):
+            known = self.adb.known_ips()
+            with self.tracer.span("subnet_scan") as span:
+                found = [s for s in self.adb.discovery.scan(known, cancelled) if s not in tried]
+                span.attrs["found"] = len(found)
+            # connecting would put the "Allow USB debugging?" prompt on phones that are not ours
+            strangers = [s for s in found if s.rsplit(":", 1)[0] not in known]
+            if strangers and not cancelled.is_set():
+                print(f"adb also answers on {', '.join(strangers)}, not ours so left alone "
+                      f"('adb connect' one to add it).")
+            for socket in [s for s in found if s not in strangers]:
+                if cancelled.is_set():
+                    return None
+                if self.adb.connect_tcp(socket):
+                    return socket, False
+                self.adb.disconnect(socket)
+            return None
+
+        def undo(result, winner):
+            if result[0] != winner[0]:
+                self.adb.disconnect(result[0])
+        return Attempt("scan", run, undo)
+
+    def _usb_attempt(self) -> Attempt:
+        def run(cancelled):
+            with self.tracer.span("usb"):
+                # restarting the server here would drop the connects still racing
+                serial = self.adb.check_usb_connection(cancelled=cancelled, restart_server=False)
+            return (serial, True) if serial else None
+        return Attempt("usb", run)
+
+    def _connect_device(self, port, config_dir) -> Device:
+        self._adb_for(port, config_dir)
+        try:
+            with self.tracer.trace("connect", mode="single"):
+                return self._connect_single(port)
         except ADBError as e:
             print(f"Error during connection: {e}")
             self._handle_exit(None, None)
 
-    def _wait_for_window(self, alias, timeout=5):
-        print(f"Waiting up to {timeout}s for window '{alias}' to appear...")
-        start = time.time()
-        proc = self.windows.get(alias)
-        while time.time() - start < timeout:
-            if proc is None:
-                break
-            # if process exited early, no window
-            if proc.poll() is not None:
-                break
-            # assume window is up if still running after half timeout
-            if time.time() - start > (timeout / 2):
-                break
-            time.sleep(0.5)
-        if proc is None or proc.poll() is not None:
-            print(f"Window '{alias}' did not start within {timeout}s. You can retry manually.")
+    def _connect_single(self, port) -> Device:
+        # fastest and most reliable endpoints first, see ConnectionHistory.score
+        known = self.adb.known_sockets()[:KNOWN_ATTEMPTS]
+        attempts = [self._known_attempt(socket) for socket in known[:1]]
+        attempts += [self._attached_attempt()]
+        attempts += [self._known_attempt(socket) for socket in known[1:]]
+        if self.args.discovery:
+            # phones already listening on the port, found without a cable
+            attempts += [self._discovery_attempt(set(known))]
+        attempts += [self._usb_attempt()]
+        print("Looking for a device: " + ", ".join(a.name for a in attempts) + "...")
+        with self.tracer.span("race"):
+            won = race(attempts)
+        if won is None:
+            errors = [f"{a.name}: {a.error}" for a in attempts if a.error]
+            raise ADBError("No device found" + (f" ({'; '.join(errors)})" if errors else ""))
+        attempt, (serial, usb) = won
+        print(f"Found {serial} ({attempt.name})")
+        if usb:
+            with self.tracer.span("tcpip"):
+                self.adb.tcpip(serial)
+
+        with self.tracer.span("wifi_connect"):
+            socket = self._wifi_socket(serial, port)
+        print("Connected!")
+        with self.tracer.span("register"):
+            return self._register(serial, socket)
+
+    def _bring_up(self, serial, state, port) -> Device | None:
+        try:
+            if ':' in serial:
+                if state != "device" and not self.adb.connect_tcp(serial):
+                    return None
+                return self._register(serial, serial)
+            self.adb.tcpip(serial)
+            return self._register(serial, self._wifi_socket(serial, port))
+        except ADBError as e:
+            print(f"Could not bring up {serial}: {e}")
+            return None
+
+    def _connect_fleet(self, port, config_dir) -> list[Device]:
+        self._adb_for(port, config_dir)
+        with self.tracer.trace("connect", mode="fleet"):
+            devices = self._connect_all(port)
+        return devices if devices is not None else [self._connect_device(port, config_dir)]
+
+    def _connect_all(self, port) -> list[Device] | None:
+        known = self.adb.known_devices()
+        if known:
+            with self.tracer.span("known_devices"), ThreadPoolExecutor() as execute:
+                list(execute.map(bind(self.adb.connect_tcp), known))
+
+        candidates = {}
+        for serial, state, _ in self.adb.device_list():
+            if state in ("device", "offline"):
+                candidates[serial] = state
+        # a phone attached over USB and already over TCP shows up twice, keep the TCP entry
+        seen = set()
+        for serial in sorted(candidates, key=lambda s: ':' not in s):
+            if candidates[serial] != "device":
+                continue
+            try:
+                serialno = self.adb.properties(serial).get("ro.serialno", serial)
+            except ADBError:
+                serialno = serial
+            if serialno in seen:
+                del candidates[serial]
+            seen.add(serialno)
+
+        if not candidates:
+            return None
+
+        print(f"Bringing up {len(candidates)} device(s)...")
+        with self.tracer.span("bring_up"), ThreadPoolExecutor() as execute:
+            devices = list(execute.map(bind(lambda s: self._bring_up(s, candidates[s], port)), candidates))
+        devices = [dev for dev in devices if dev]
+        for dev in devices:
+            print(f"Connected {dev.name} ({dev.socket})")
+        return devices
+
+    def _reconnect(self, device: Device) -> bool:
+        with self.tracer.trace("reconnect", device=device.name):
+            return self._reconnect_device(device)
+
+    def _reconnect_device(self, device: Device) -> bool:
+        print(f"Reconnecting {device.name}...")
+        if device.socket and self.adb.connect_tcp(device.socket):
+            device.connected = True
+        elif ':' not in device.serial and (device.serial, "device") in [
+                (serial, state) for serial, state, _ in self.adb.device_list()]:
+            try:
+                self.adb.tcpip(device.serial)
+                device.socket = self._wifi_socket(device.serial, self.args.port)
+                device.connected = True
+            except ADBError as e:
+                print(f"Could not reconnect {device.name}: {e}")
+        if device.connected:
+            self.adb.remember(device.serial, device.socket)
+        return device.connected
+
+    def _title(self, device, alias):
+        return device.key(alias) if self.args.fleet else None
+
+    def _window_args(self, device, alias, target, options, share=None):
+        options = ScrcpyOptions.override(options, self._tuned(device, alias))
+        # the profile's (or tune's) own settings are the ceiling the shares and the ladder start from
+        bitrate, max_size, fps = (options[options.index(flag) + 1] if flag in options else None
+                                  for flag in ("--video-bit-rate", "--max-size", "--max-fps"))
+        if share:
+            options = ScrcpyOptions.override(options, self.bandwidth.args_for(share, bitrate, max_size, fps))
+        if self.config.Adaptive.enabled:
+            base = parse_rate(bitrate) if bitrate else None
+            if share:
+                base = min(share, base) if base else share
+            options = ScrcpyOptions.override(options, self.adaptive.overrides(device.key(alias), base, max_size))
+        if self.config.Video.auto_encoder:
+            options = ScrcpyOptions.override(options, self.adb.encoder_overrides(device.serial, options))
+        if (self.config.Adaptive.enabled or self.config.Telemetry.enabled) and "--print-fps" not in options:
+            options = options + ["--print-fps"]
+        if alias == "Main":
+            return self.adb.scrcpy_args(device.serial, options, title=self._title(device, alias))
+        return self.adb.scrcpy_args(device.serial, options, app=target,
+                                    title=self._title(device, alias) or alias)
+
+    def _resources(self, device, alias):
+        app = self.config.App
+        config = app.resources.get(alias) or ScrcpyConfig.ResourceConfig({})
+        cgroup = None
+        if app.cgroup_root:
+            cgroup = Path(app.cgroup_root) / re.sub(r"[^\w.-]+", "_", device.key(alias))
+        # explicit cpus win, no need to take a slot from the balancer
+        cpus = self.balancer.get(device.key(alias)) if app.balance_cpus and config.cpus is False else None
+        return Resources.from_config(config, cgroup, cpus)
+
+    def _profile(self, device, alias):
+        return self.profiles.get(device.key(alias), self.config.App.profiles.get(alias))
+
+    def _tuned(self, device, alias):
+        # a window given a profile keeps it, the others launch with what autotune measured
+        if not self.config.Autotune.enabled or self._profile(device, alias):
+            return {}
+        return self.adb.tuning(device.serial) or {}
+
+    def _aliases(self):
+        apps = self.config.App.apps_to_open
+        if self.config.App.tab_mode and apps:
+            return ['Main', TABS]
+        return ['Main', *apps]
+
+    def _target(self, alias, device=None):
+        apps = self.config.App.apps_to_open
+        if alias == TABS:
+            # a respawned tab window comes back on the app it showed last
+            return apps.get(device.tab if device else None) or next(iter(apps.values()))
+        return None if alias == 'Main' else apps[alias]
+
+    def _codec(self, device, alias):
+        # what the window launches with: its profile or tune, then the encoder the device has
+        options = ScrcpyOptions.override(self.options.for_profile(self._profile(device, alias)),
+                                         self._tuned(device, alias))
+        if self.config.Video.auto_encoder:
+            options = ScrcpyOptions.override(options, self.adb.encoder_overrides(device.serial, options))
+        return options[options.index("--video-codec") + 1] if "--video-codec" in options else "h264"
+
+    def _launch_cap(self, device, aliases):
+        if self.config.App.launch_concurrency:
+            return int(self.config.App.launch_concurrency)
+        codecs = {self._codec(device, alias) for alias in aliases}
+        return min((self.adb.encoder_session_limit(device.serial, codec) or 1 for codec in codecs), default=1)
+
+    def _requests(self, windows, shares):
+        requests = []
+        for device, alias, target in windows:
+            key = device.key(alias)
+            if key in shares:
+                self.shares[key] = shares[key]
+            requests.append(LaunchRequest(key,
+                                          self._window_args(device, alias, target,
+                                                            self.options.for_profile(self._profile(device, alias)),
+                                                            shares.get(key)),
+                                          group=device.name,
+                                          priority=self.config.App.priorities.get(alias, 100),
+                                          resources=self._resources(device, alias)))
+        return requests
+
+    def _live_keys(self):
+        live = (WindowState.STARTING, WindowState.RUNNING, WindowState.BACKOFF)
+        return [key for key, window in list(self.supervisor.windows.items()) if window.state in live]
+
+    def _rebalance_requests(self, shares=None, skip=()):
+        if not self.bandwidth.enabled:
+            return []
+        shares = shares or self.bandwidth.shares(self._live_keys())
+        window_map = self.fleet.window_map()
+        stale = []
+        for key, share in shares.items():
+            if key in skip or key.lower() not in window_map:
+                continue
+            device, alias = window_map[key.lower()]
+            if alias not in self._aliases():
+                continue
+            if self.bandwidth.changed(self.shares.get(key), share):
+                stale.append((device, alias, self._target(alias, device)))
+        return self._requests(stale, shares)
+
+    def _rebalance(self, shares=None, skip=()):
+        requests = self._rebalance_requests(shares, skip)
+        if requests:
+            print(f"Rebalancing bandwidth: restarting {', '.join(r.key for r in requests)}")
+            self.scheduler.launch(requests)
+
+    def _rebalance_locked(self):
+        with self.commands_lock:
+            self._rebalance()
+
+    def _on_window_state(self, window):
+        # a window the user closed frees its share for the others. This runs on the supervisor loop,
+        # building the argv may wait on the device: the restart goes to a thread of its own
+        if window.state is WindowState.EXITED and window.returncode == 0 and self.bandwidth.enabled:
+            threading.Thread(target=self._rebalance_locked, name="rebalance", daemon=True).start()
+
+    def _serial_of(self, key):
+        device = self.fleet.get(key.split('/', 1)[0])
+        return device.serial if device and device.connected else None
+
+    def _restart_key(self, key):
+        # from the adaptive thread: must not interleave with a reload, all or dc on the same windows
+        with self.commands_lock:
+            entry = self.fleet.window_map().get(key.lower())
+            if entry is None:
+                return
+            device, alias = entry
+            shares = self.bandwidth.shares(self._live_keys())
+            self.scheduler.launch(self._requests([(device, alias, self._target(alias, device))], shares))
+
+    def _set_caps(self, windows):
+        aliases = {}
+        for device, alias, _ in windows:
+            aliases.setdefault(device, []).append(alias)
+        for device, names in aliases.items():
+            cap = self._launch_cap(device, names)
+            if self.scheduler.caps.get(device.name) != cap:
+                self.scheduler.set_cap(device.name, cap)
+                print(f"Starting at most {self.scheduler.caps[device.name]} window(s) at once on {device.name}.")
+
+    def _start_windows(self, windows):
+        self._set_caps(windows)
+        keys = [device.key(alias) for device, alias, _ in windows]
+        shares = self.bandwidth.shares(list(dict.fromkeys(self._live_keys() + keys)))
+        results = self.scheduler.launch(self._requests(windows, shares))
+        for device, alias, _ in windows:
+            device.windows[alias] = self.supervisor.windows[device.key(alias)]
+        self._rebalance(shares, skip=keys)
+        return results
+
+    def _stale(self, request):
+        window = self.supervisor.windows.get(request.key)
+        if window is None:
+            return True
+        old, new = window.argv, request.argv
+        if request.key.endswith(f"/{TABS}"):
+            # the app follows the tab switches, it is not a change to restart the window for
+            old, new = ([arg for arg in argv if not arg.startswith("--start-app=")] for argv in (old, new))
+        if old != new:
+            return True
+        return vars(window.resources or Resources()) != vars(request.resources or Resources())
+
+    def _auto_reload(self):
+        print(f"\n{self.config_path.name} changed.")
+        with self.commands_lock:
+            self._reload()
+
+    def _reload(self):
+        try:
+            config = ScrcpyConfig(self.config_path)
+        except Exception as e:
+            print(f"Config not reloaded: {e}")
+            return
+        print("Reloading configuration...")
+        self.config = config
+        self.options.reload(config)
+        for key, name in list(self.profiles.items()):
+            if name and name not in config.profiles:
+                del self.profiles[key]
+        self.bandwidth.config = config
+        self.adaptive.config = config
+        if config.Adaptive.enabled:
+            self.adaptive.start()
         else:
-            print(f"Window '{alias}' should now be visible.")
-
-    def _start_window(self, alias, target, serial, options):
+            self.adaptive.stop()
+        if config.Telemetry.enabled:
+            self.telemetry.interval = float(config.Telemetry.interval)
+            self.telemetry.start(config.Telemetry.port or None)
+        else:
+            self.telemetry.stop()
+        if config.auto_reload:
+            self.watcher.start()
+        else:
+            self.watcher.stop()
+
+        aliases = self._aliases()
+        removed, wanted = [], []
+        for device in self.fleet.live():
+            for alias in [alias for alias in device.windows if alias not in aliases]:
+                removed.append(device.key(alias))
+                del device.windows[alias]
+            if device.tab not in config.App.apps_to_open:
+                device.tab = next(iter(config.App.apps_to_open), None)
+            wanted += [(device, alias, self._target(alias, device)) for alias in aliases]
+        for key in removed:
+            self.supervisor.forget(key)
+            self.shares.pop(key, None)
+            self.balancer.release(key)
+
+        # windows the user closed stay closed, new aliases and running windows get a fresh argv
+        live = set(self._live_keys())
+        candidates = [(device, alias, target) for device, alias, target in wanted
+                      if alias not in device.windows or device.key(alias) in live]
+        shares = self.bandwidth.shares([device.key(alias) for device, alias, _ in candidates])
+        for key, share in shares.items():
+            if key in self.shares and not self.bandwidth.changed(self.shares[key], share):
+                shares[key] = self.shares[key]
+        requests = [request for request in self._requests(candidates, shares) if self._stale(request)]
+
+        if requests:
+            self._set_caps(candidates)
+            self.scheduler.launch(requests)
+            for device, alias, _ in candidates:
+                if device.key(alias) in self.supervisor.windows:
+                    device.windows[alias] = self.supervisor.windows[device.key(alias)]
+        added = [r.key for r in requests if r.key not in live]
+        restarted = [r.key for r in requests if r.key in live]
+        for label, keys in (("Added", added), ("Restarted", restarted), ("Removed", removed)):
+            if keys:
+                print(f"{label} windows: {', '.join(keys)}")
+        if not (added or restarted or removed):
+            print("No window changes.")
+
+    def _launch_all(self, devices):
+        aliases = self._aliases()
+        for device in devices:
+            # a relaunch (autotune, reconnect) comes back on the tab the user left it on
+            if device.tab not in self.config.App.apps_to_open:
+                device.tab = next(iter(self.config.App.apps_to_open), None)
+        if self.config.App.balance_cpus:
+            balanced = [alias for alias in aliases
+                        if (self.config.App.resources.get(alias) or ScrcpyConfig.ResourceConfig({})).cpus is False]
+            self.balancer.plan([device.key(alias) for device in devices for alias in balanced])
+        self._start_windows([(device, alias, self._target(alias, device)) for device in devices for alias in aliases])
+
+    def _targets(self, target):
+        window_map = self.fleet.window_map()
+        key = (target or '').strip().lower()
+        if key in window_map:
+            return [window_map[key]]
+        return [(device, alias) for device, alias in window_map.values() if alias.lower() == key]
+
+    def _select(self, name) -> list[Device]:
+        if not name:
+            return list(self.fleet)
+        device = self.fleet.get(name)
+        if device is None:
+            raise ValueError(f"Unknown device: {name}")
+        return [device]
+
+    def _tab_targets(self, target):
+        if not self.config.App.tab_mode:
+            return []
+        name, _, alias = (target or '').strip().rpartition('/')
+        apps = {a.lower(): a for a in self.config.App.apps_to_open}
+        if alias.lower() not in apps:
+            return []
+        devices = [self.fleet.get(name)] if name else list(self.fleet)
+        return [(device, apps[alias.lower()]) for device in devices
+                if device and device.connected and TABS in device.windows]
+
+    def _switch_tab(self, device, alias):
+        window = device.windows[TABS]
+        display = window.log.display_id
+        # the tab only changes once the app is up, a failed switch leaves the window on the old one
+        if not window.alive() or display is None:
+            print(f"Restarting window {device.key(TABS)} on {alias}...")
+            if self._start_windows([(device, TABS, self._target(alias))]).get(device.key(TABS)):
+                device.tab = alias
+            return device.key(TABS)
+        start = time.monotonic()
+        self.adb.start_on_display(device.serial, self._target(alias), display)
+        device.tab = alias
+        print(f"Switched {device.key(TABS)} to {alias} in {(time.monotonic() - start) * 1000:.0f}ms.")
+        return device.key(TABS)
+
+    def _op_restart(self, target):
+        tabs = self._tab_targets(target)
+        if tabs:
+            # tab mode: the app moves onto the running window's display, no scrcpy restart
+            return [self._switch_tab(device, alias) for device, alias in tabs]
+        targets = self._targets(target)
+        if not targets:
+            raise ValueError(f"Unknown command or alias: {target}")
+        for device, alias in targets:
+            print(f"Restarting window {device.key(alias)}...")
+        self._start_windows([(device, alias, self._target(alias, device)) for device, alias in targets])
+        return [device.key(alias) for device, alias in targets]
+
+    def _op_all(self, device=None):
+        devices = [d for d in self._select(device) if d.connected]
+        self._stop_windows(devices)
+        self._launch_all(devices)
+        return [d.name for d in devices]
+
+    def _op_reload(self):
+        self._reload()
+
+    def _op_dc(self, device=None):
+        print("Disconnecting ADB...")
+        devices = self._select(device)
+        for dev in devices:
+            dev.connected = False
+            self._cleanup(dev)
+        self._rebalance()
+        return [dev.name for dev in devices]
+
+    def _op_conn(self, device=None):
+        devices = [d for d in self._select(device) if not d.connected]
+        if not devices:
+            raise ValueError("Command only available if adb is disconnected.")
+        print("Reconnecting and launching all windows...")
+        for dev in devices:
+            if not self._reconnect(dev):
+                if self.args.fleet:
+                    continue
+                self.fleet.remove(dev)
+                dev = self._connect_device(self.args.port, self.args.config_dir)
+            self._launch_all([dev])
+        return [dev.name for dev in devices if dev.connected]
+
+    def _op_profile(self, target=None, name=None):
+        if not target:
+            return {"windows": {device.key(alias): self._profile(device, alias) or 'default'
+                                for device, alias in self.fleet.window_map().values()},
+                    "profiles": list(self.config.profiles)}
+        if name != 'default' and name not in self.config.profiles:
+            raise ValueError(f"Unknown profile: {name}")
+        targets = self._targets(target)
+        if not targets:
+            raise ValueError(f"Unknown window: {target}")
+        for device, alias in targets:
+            # 'default' drops back to the base options even if the config assigns a profile
+            self.profiles[device.key(alias)] = '' if name == 'default' else name
+            print(f"Switching {device.key(alias)} to profile {name}...")
+        self._start_windows([(device, alias, self._target(alias, device)) for device, alias in targets])
+        return [device.key(alias) for device, alias in targets]
+
+    def _op_autotune(self, device=None):
+        devices = [d for d in self._select(device) if d.connected and d.name not in self.tuning]
+        if not devices:
+            raise ValueError("No connected device to tune, or it is being tuned already.")
+        self.tuning.update(dev.name for dev in devices)
+        # minutes of trials: the reply returns now, progress comes as events
+        threading.Thread(target=self._autotune_all, args=(devices,), name="autotune", daemon=True).start()
+        return [dev.name for dev in devices]
+
+    def _autotune_all(self, devices):
+        # one device at a time, parallel trials would share the host CPU and the Wi-Fi link
+        with self.tune_lock:
+            for device in devices:
+                self._autotune(device)
+
+    def _tune_note(self, device, message):
+        print(f"[{device.name}] autotune: {message}")
+        if self.control:
+            self.control.publish({"event": "autotune", "serial": device.name, "state": message, "ts": time.time()})
+
+    def _trial_args(self, device, trial):
+        options = ScrcpyOptions.override(self.options.options, trial.overrides())
+        options += [flag for flag in ("--print-fps", "--no-audio") if flag not in options]
+        options = ScrcpyOptions.override(options, self.adb.encoder_overrides(device.serial, options))
+        return self.adb.scrcpy_args(device.serial, options, title=f"{device.name} autotune")
+
+    def _autotune(self, device):
+        tune = self.config.Autotune
         try:
-            if alias == "Main":
-                proc = self.adb.start(serial, options)
-            else:
-                proc = self.adb.start_app(serial, options, target, alias)
-            self.windows[alias] = proc
-            self._wait_for_window(alias, timeout=5)
+            trials = autotune.grid(tune.codecs, tune.bitrates, tune.sizes, self.adb.encoders(device.serial))
+            self._tune_note(device, f"{len(trials)} trials of {tune.duration}s, its windows stop meanwhile")
+            with self.commands_lock:
+                self._stop_windows([device])
+            width, height = autotune.screen_size(self.adb.shell(device.serial, "wm size"))
+            self.adb.shell(device.serial, autotune.MOTION_START)
+            swipes = autotune.motion_cmd(width, height, autotune.WARMUP + float(tune.duration))
+
+            def motion():
+                # not the shell session: the loop would hold it for the whole trial
+                self.adb.exec_shell(device.serial, swipes)
+            try:
+                for n, trial in enumerate(trials, 1):
+                    if not (self.running and device.connected):
+                        return
+                    autotune.run_trial(self._trial_args(device, trial), trial, float(tune.duration), motion)
+                    self._tune_note(device, f"{n}/{len(trials)} {trial}")
+            finally:
+                self.adb.shell(device.serial, autotune.MOTION_STOP)
+            chosen = autotune.best(trials, float(tune.tolerance))
+            if chosen is None:
+                self._tune_note(device, "no trial streamed, nothing saved")
+                return
+            if chosen.fps < float(tune.min_fps):
+                self._tune_note(device, f"the best trial only reached {chosen.fps:.0f} fps, the screen did not "
+                                        f"move enough to tell settings apart; nothing saved")
+                return
+            self.adb.save_tuning(device.serial, chosen.overrides(), [t.record() for t in trials])
+            self._tune_note(device, f"using {chosen.codec} {chosen.bitrate} {chosen.max_size} from now on")
         except Exception as e:
-            print(f"Failed to start {alias}: {e}")
-            self.windows[alias] = None
-
-    def _launch_all(self, serial):
-        apps = {'Main': None, **self.config.App.apps_to_open}
-        opts = self.options.options
-        with ThreadPoolExecutor() as execute:
-            for alias, target in apps.items():
-                execute.submit(self._start_window, alias, target, serial, opts)
-        time.sleep(1)
-
-    def _interactive_loop(self, serial):
+            self._tune_note(device, f"failed: {e}")
+        finally:
+            self.tuning.discard(device.name)
+            if self.running and device.connected:
+                with self.commands_lock:
+                    self._launch_all([device])
+
+    def _op_metrics(self, path=None):
+        path = Path(path or self.args.config_dir / "metrics.jsonl")
+        self.telemetry.dump(path)
+        print(f"Metrics written to {path}")
+        return str(path)
+
+    def _op_trace(self, count=None):
+        return self.tracer.slowest(int(count or 5))
+
+    def _window_status(self, device, alias):
+        window = device.windows[alias]
+        return {"key": device.key(alias), "alias": alias, "device": device.name, "state": window.state.value,
+                "pid": window.pid, "ttff": window.ttff, "restarts": window.restarts,
+                "profile": self._profile(device, alias) or ('autotune' if self._tuned(device, alias) else 'default'),
+                "tab": device.tab if alias == TABS else None}
+
+    def _op_status(self):
+        return {"devices": [{"name": device.name, "serial": device.serial, "socket": device.socket,
+                             "connected": device.connected,
+                             "windows": [self._window_status(device, alias) for alias in device.windows]}
+                            for device in self.fleet]}
+
+    def _op_list(self):
+        return [self._window_status(device, alias) for device, alias in self.fleet.window_map().values()]
+
+    def _op_shutdown(self):
+        threading.Thread(target=self._handle_exit, args=(None, None), daemon=True).start()
+
+    def _rpc(self, request):
+        handler = getattr(self, f"_op_{request.get('op')}", None)
+        if handler is None:
+            raise ValueError(f"Unknown op: {request.get('op')}")
+        args = {k: v for k, v in request.items() if k not in ("id", "op")}
+        # the daemon keeps its own log, an in-process prompt prints the reply instead
+        with self.commands_lock, captured_output(tee=self.args.daemon) as output:
+            result = handler(**args)
+        return {"result": result, "output": output.getvalue()}
+
+    def _publish_state(self, window):
+        if self.control:
+            self.control.publish({"event": "state", "window": window.key, "state": window.state.value,
+                                  "pid": window.pid, "returncode": window.returncode, "ttff": window.ttff,
+                                  "ts": time.time()})
+
+    def _publish_device(self, event):
+        if self.control:
+            self.control.publish({"event": "device", "serial": event.serial, "state": event.state,
+                                  "previous": event.previous, "ts": time.time()})
+
+    def _show(self, request, reply):
+        if not reply.get("ok"):
+            print(reply.get("error"))
+            return
+        print(reply.get("output", ""), end="")
+        result = reply.get("result")
+        if request["op"] == "status":
+            for device in result["devices"]:
+                state = "connected" if device["connected"] else "disconnected"
+                print(f"{device['name']}: {device['serial']} {device['socket']} [{state}] "
+                      f"windows: {', '.join(w['alias'] for w in device['windows']) or '-'}")
+        elif request["op"] == "list":
+            for window in result:
+                tab = f" tab={window['tab']}" if window.get("tab") else ""
+                print(f"{window['key']}: {window['state']} pid={window['pid']} profile={window['profile']}{tab}")
+        elif request["op"] == "trace":
+            if not result:
+                print("No connects traced yet.")
+            for trace in result:
+                root = trace["root"]
+                status = f" failed: {root['error']}" if root.get("error") else ""
+                print(f"{time.strftime('%H:%M:%S', time.localtime(root['ts']))} {root['name']} "
+                      f"{root.get('mode') or root.get('device') or ''} {root['duration']:.2f}s "
+                      f"({trace['spans']} spans){status}")
+                for span in trace["slowest"]:
+                    detail = span.get("cmd") or ""
+                    if "code" in span:
+                        detail += f" exit={span['code']} {span.get('bytes', 0)}B"
+                    print(f"  {span['duration']:7.3f}s  {span['kind']:<5} {span['name']:<14} {detail}"
+                          f"{' ' + span['error'] if span.get('error') else ''}")
+        elif request["op"] == "profile" and not request.get("target"):
+            for key, name in sorted(result["windows"].items()):
+                print(f"{key}: {name}")
+            print(f"Profiles: {', '.join(result['profiles']) or '-'}")
+
+    def _interactive_loop(self, client):
+        from prompt_toolkit import PromptSession
+        from prompt_toolkit.history import InMemoryHistory
+
+        self.session = self.session or PromptSession(history=InMemoryHistory())
         print("Type 'reload' to refresh config, 'all' to restart all windows, or window alias to restart one.")
-        def build_map():
-            return {alias.lower(): alias for alias in self.windows}
-        connected = True
+        if self.args.fleet:
+            print("Prefix an alias with '<device>/' to target one device, 'devices' lists them.")
+        if self.config.profiles:
+            print("'profile <alias> <name>' restarts a window with another profile, 'profile' lists them.")
+        if self.config.App.tab_mode:
+            print(f"Tab mode: an app alias switches the {TABS} window to it, '{TABS}' restarts that window.")
+        print("'trace [n]' shows the slowest phases of the last n connects.")
+        print("'autotune [device]' times codec/bitrate/size settings and keeps the best for that device.")
 
         while self.running:
             try:
-                choice = self.session.prompt("Command: ", refresh_interval=5)
+                choice = self.session.prompt("Command: ")
                 # choice = input("Command: ")
             except (EOFError, KeyboardInterrupt):
+                if self.args.attach:
+                    return
                 self._handle_exit(None, None)
-            choice = choice.strip()
-            lower_map = build_map()
-            if choice.lower() == 'all':
-                self._cleanup()
-                self._launch_all(serial)
-            elif choice.lower() == 'reload':
-                print("Reloading configuration...")
-                self.config = ScrcpyConfig()  # re-read config
-                self.options.config = self.config
-                self.options.generate_args()
-                new_apps = set(self.config.App.apps_to_open)
-                existing = set(self.windows)
-                to_add = new_apps - existing
-                for alias in to_add:
-                    target = self.config.App.apps_to_open[alias]
-                    self._start_window(alias, target, serial, self.options.options)
-                print(f"Spawned new windows: {to_add}" if to_add else "No new apps to add.")
-            elif choice.lower() == 'dc':
-                connected = False
-                print("Disconnecting ADB...")
-                self._cleanup()
-                self.adb.disconnect()
-            elif choice.lower() == 'conn' and connected is False:
-                print("Reconnecting and launching all windows...")
-                serial = self._connect_device(self.args.port, self.args.config_dir)
-                self.adb.save_last_device(self.socket)
-                self._launch_all(serial)
-            elif choice.lower() == 'conn' and connected is True:
-                print("Command only available if adb is disconnected.")
-            elif choice.lower() in lower_map:
-                alias = lower_map[choice.lower()]
-                print(f"Restarting window {choice}..." )
-                proc = self.windows[alias]
-                if proc:
-                    proc.terminate()
-                    try:
-                        proc.wait(5)
-                    except subprocess.TimeoutExpired:
-                        proc.kill()
-                target = None if alias == 'Main' else self.config.App.apps_to_open[alias]
-                self._start_window(alias, target, serial, self.options.options)
-            else:
-                print(f"Unknown command or alias: {choice}" )
+            if not choice.strip():
+                continue
+            try:
+                request = parse_command(choice)
+            except ValueError as e:
+                print(e)
+                continue
+            try:
+                self._show(request, client.call(**request))
+            except ControlError as e:
+                print(e)
+                if self.args.attach:
+                    return
+
+    def _attach(self, path):
+        from prompt_toolkit.patch_stdout import patch_stdout
+
+        def on_event(event):
+            print(f"[{event.get('window') or event.get('serial')}] {event['state']}")
+
+        try:
+            client = ControlClient(path, on_event)
+        except ControlError as e:
+            print(e)
+            return
+        print(f"Attached to the manager on {path}.")
+        client.subscribe()
+        with patch_stdout():
+            self._interactive_loop(client)
+        client.close()
+
+    def _serve(self, path):
+        self.control = ControlServer(path, self._rpc)
+        self.control.start()
 
     def run(self):
         self.args = self._parse_args()
-        serial = self._connect_device(self.args.port, self.args.config_dir)
-        self.adb.save_last_device(self.socket)
+        path = self.args.socket or self.args.config_dir / "scrcpy.sock"
+        if self.args.attach:
+            return self._attach(path)
+        try:
+            self._serve(path)
+        except ControlError as e:
+            print(f"{e}, use --attach to control it.")
+            return
+        with STARTUP.phase("connect"):
+            if self.args.fleet:
+                devices = self._connect_fleet(self.args.port, self.args.config_dir)
+            else:
+                devices = [self._connect_device(self.args.port, self.args.config_dir)]
         print(f"Launch options for all windows: {self.options.options}")
 
-        self._launch_all(serial)
-        self._interactive_loop(serial)
+        with STARTUP.phase("launch"):
+            self._launch_all(devices)
+        STARTUP.report()
+        self.adaptive.start()
+        if self.config.Telemetry.enabled:
+            self.telemetry.start(self.config.Telemetry.port or None)
+        if self.config.auto_reload:
+            self.watcher.start()
+        if self.args.daemon:
+            print(f"Running headless, control socket: {path}")
+            signal.signal(signal.SIGTERM, self._handle_exit)
+            while self.running:
+                signal.pause()
+            return
+        # same process: the reply comes once the op is done, however many windows it waits for
+        self._interactive_loop(ControlClient(path, timeout=None))
 
 
 if __name__ == "__main__":
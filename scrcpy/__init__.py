@@ -1,4 +1,29 @@
 # -*- coding: utf-8 -*-
-from .options import ScrcpyOptions
-from .adb_utils import AdbUtils, ADBError
-from .enums import (AudioCodec, AudioSource, Bitrate, CameraSize, Orientation, VideoCodec)
+import importlib
+
+# resolved on first use: importing one submodule must not pull in adb, asyncio and the rest
+_EXPORTS = {
+    "ScrcpyOptions": ".options",
+    "AdbUtils": ".adb_utils",
+    "ADBError": ".adb_utils",
+    "AdbClient": ".adb_client",
+    "AdbClientError": ".adb_client",
+    "AudioCodec": ".enums",
+    "AudioSource": ".enums",
+    "Bitrate": ".enums",
+    "CameraSize": ".enums",
+    "Orientation": ".enums",
+    "VideoCodec": ".enums",
+}
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted([*globals(), *_EXPORTS])
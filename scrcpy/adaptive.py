@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import re
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Callable
+
+from .adb_utils import ADBError, AdbUtils
+from .bandwidth import parse_rate
+from .enums import Bitrate
+from .supervisor import Supervisor, WindowState
+
+if TYPE_CHECKING:
+    from config import ScrcpyConfig
+
+# grep exits 1 when wifi is off, the wireless stats are still worth having
+LINK_CMD = "cat /proc/net/wireless; dumpsys wifi | grep -m 1 mWifiInfo; true"
+WIRELESS_LINE = re.compile(r"wlan0:\s+\S+\s+(?P<quality>[\d.]+)\s+(?P<level>-?[\d.]+)")
+RSSI = re.compile(r"RSSI: (?P<rssi>-?\d+)")
+LINK_SPEED = re.compile(r"Link speed: (?P<speed>\d+)")
+
+BITRATE_LADDER = [parse_rate(b.value) for b in (Bitrate.BR_64M, Bitrate.BR_32M, Bitrate.BR_16M, Bitrate.BR_8M,
+                                                 Bitrate.BR_4M, Bitrate.BR_2M, Bitrate.BR_1M, Bitrate.BR_512K)]
+SIZE_LADDER = [2560, 1920, 1600, 1280, 1024, 800, 640]
+
+
+class LinkSample:
+    def __init__(self, rssi: int | None = None, speed: int | None = None, quality: float | None = None):
+        self.rssi = rssi
+        self.speed = speed
+        self.quality = quality
+
+    @classmethod
+    def parse(cls, output: str) -> "LinkSample":
+        sample = cls()
+        if m := WIRELESS_LINE.search(output):
+            sample.quality = float(m.group("quality"))
+            sample.rssi = int(float(m.group("level")))
+        if m := RSSI.search(output):
+            sample.rssi = int(m.group("rssi"))
+        if m := LINK_SPEED.search(output):
+            sample.speed = int(m.group("speed"))
+        return sample
+
+    def __repr__(self):
+        return f"LinkSample(rssi={self.rssi}, speed={self.speed})"
+
+
+class WindowTuning:
+    def __init__(self):
+        self.level = 0
+        self.low = 0
+        self.good = 0
+        self.last_restart = 0.0
+
+
+def ladder_from(ladder: list[int], start: int) -> list[int]:
+    return [start] + [v for v in ladder if v < start]
+
+
+class AdaptiveController:
+    def __init__(self, config: ScrcpyConfig, adb: AdbUtils, supervisor: Supervisor,
+                 serial_of: Callable[[str], str | None], restart: Callable[[str], None]):
+        self.config = config
+        self.adb = adb
+        self.supervisor = supervisor
+        self.serial_of = serial_of
+        self.restart = restart
+        self.tuning: dict[str, WindowTuning] = {}
+        self.links: dict[str, deque[LinkSample]] = {}
+        self._restarts: deque[float] = deque()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def settings(self):
+        return self.config.Adaptive
+
+    def start(self):
+        if self._thread is None and self.settings.enabled:
+            # a fresh event: a controller that is still winding down must not be revived
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(self._stop,), name="adaptive", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+        # re-enabled later, windows start over from their configured settings
+        self.tuning.clear()
+
+    def overrides(self, key: str, base_bitrate: int | None = None, max_size=None) -> dict[str, str]:
+        tuning = self.tuning.get(key)
+        if not tuning or not tuning.level:
+            return {}
+        video = self.config.Video
+        max_size = max_size or video.max_size
+        bitrates = ladder_from(BITRATE_LADDER, base_bitrate or parse_rate(video.bitrate))
+        overrides = {"--video-bit-rate": str(bitrates[min(tuning.level, len(bitrates) - 1)])}
+        if max_size:
+            sizes = ladder_from(SIZE_LADDER, int(max_size))
+            overrides["--max-size"] = str(sizes[min(tuning.level, len(sizes) - 1)])
+        return overrides
+
+    def _run(self, stop: threading.Event):
+        while not stop.wait(float(self.settings.interval)):
+            if not self.settings.enabled:
+                return
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Adaptive controller error: {e}")
+
+    def _link(self, serial: str) -> LinkSample | None:
+        try:
+            sample = LinkSample.parse(self.adb.shell(serial, LINK_CMD, timeout=5))
+        except ADBError:
+            return None
+        self.links.setdefault(serial, deque(maxlen=10)).append(sample)
+        return sample
+
+    def _link_good(self, sample: LinkSample | None) -> bool:
+        if sample is None or sample.rssi is None:
+            return True  # nothing to say against it, let fps decide
+        return sample.rssi >= int(self.settings.good_rssi)
+
+    def _link_degraded(self, sample: LinkSample | None) -> bool:
+        # low fps alone is usually a static screen, only a weak link makes it worth a restart
+        if sample is None:
+            return False
+        weak = sample.rssi is not None and sample.rssi < int(self.settings.good_rssi)
+        slow = sample.speed is not None and sample.speed < int(self.settings.min_link_speed)
+        return weak or slow
+
+    def _can_restart(self, tuning: WindowTuning, now: float) -> bool:
+        while self._restarts and now - self._restarts[0] > 60:
+            self._restarts.popleft()
+        if len(self._restarts) >= int(self.settings.max_restarts_per_minute):
+            return False
+        return now - tuning.last_restart >= float(self.settings.min_restart_interval)
+
+    def sample(self):
+        target = float(self.settings.target_fps or self.config.Video.fps or 30)
+        links: dict[str, LinkSample | None] = {}
+        now = time.monotonic()
+        for key, window in list(self.supervisor.windows.items()):
+            if window.state is not WindowState.RUNNING:
+                continue
+            serial = self.serial_of(key)
+            if serial and serial not in links:
+                links[serial] = self._link(serial)
+            tuning = self.tuning.setdefault(key, WindowTuning())
+            if window.log.fps is None:
+                continue  # no --print-fps output yet
+            if now - window.log.fps_at >= 3 * float(self.settings.interval):
+                continue  # scrcpy only logs fps while frames arrive, nothing changes on screen
+            fps = window.log.fps
+            good_link = self._link_good(links.get(serial))
+
+            if fps < target * (1 - float(self.settings.tolerance)) and self._link_degraded(links.get(serial)):
+                tuning.low, tuning.good = tuning.low + 1, 0
+            elif fps >= target and good_link:
+                tuning.good, tuning.low = tuning.good + 1, 0
+            else:
+                tuning.low = tuning.good = 0
+
+            step = 0
+            if tuning.low >= int(self.settings.down_after):
+                step = 1
+            elif tuning.level and tuning.good >= int(self.settings.up_after):
+                step = -1
+            if not step or not self._can_restart(tuning, now):
+                continue
+            tuning.level = max(0, tuning.level + step)
+            tuning.low = tuning.good = 0
+            tuning.last_restart = now
+            self._restarts.append(now)
+            direction = "down" if step > 0 else "up"
+            print(f"Adaptive: stepping {key} {direction} to level {tuning.level} (fps {fps}, link {links.get(serial)})")
+            self.restart(key)
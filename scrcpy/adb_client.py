@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+import os
+import socket
+import struct
+
+ADB_HOST = "127.0.0.1"
+ADB_PORT = int(os.environ.get("ANDROID_ADB_SERVER_PORT", 5037))  # same override as the adb binary
+
+# shell protocol v2 packet ids
+SHELL_STDOUT = 1
+SHELL_STDERR = 2
+SHELL_EXIT = 3
+
+
+class AdbClientError(Exception):
+    pass
+
+
+class AdbServerUnavailable(AdbClientError):
+    pass
+
+
+def parse_devices(output: str) -> list[tuple[str, str, dict[str, str]]]:
+    devices = []
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) < 2 or line.startswith("List of devices"):
+            continue
+        attrs = {}
+        for field in parts[2:]:
+            if ":" in field:
+                k, v = field.split(":", 1)
+                attrs[k] = v
+        devices.append((parts[0], parts[1], attrs))
+    return devices
+
+
+class AdbClient:
+    def __init__(self, host: str = ADB_HOST, port: int = ADB_PORT, timeout: float = 10.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def _open(self, timeout: float | None = None) -> socket.socket:
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout or self.timeout)
+        except OSError as e:
+            raise AdbServerUnavailable(f"adb server not reachable on {self.host}:{self.port}: {e}")
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    @staticmethod
+    def _recv_exact(sock: socket.socket, size: int) -> bytes:
+        buf = b""
+        while len(buf) < size:
+            chunk = sock.recv(size - len(buf))
+            if not chunk:
+                raise AdbClientError("adb server closed the connection")
+            buf += chunk
+        return buf
+
+    @staticmethod
+    def _recv_all(sock: socket.socket) -> bytes:
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def _read_block(self, sock: socket.socket) -> str:
+        size = int(self._recv_exact(sock, 4), 16)
+        return self._recv_exact(sock, size).decode("utf-8", "replace")
+
+    def _request(self, sock: socket.socket, request: str):
+        payload = request.encode("utf-8")
+        sock.sendall(b"%04x" % len(payload) + payload)
+        status = self._recv_exact(sock, 4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            raise AdbClientError(self._read_block(sock))
+        raise AdbClientError(f"unexpected adb server reply {status!r} to {request}")
+
+    def host_command(self, request: str, reply: bool = True) -> str:
+        with self._open() as sock:
+            self._request(sock, request)
+            return self._read_block(sock) if reply else ""
+
+    def version(self) -> int:
+        return int(self.host_command("host:version"), 16)
+
+    def devices(self) -> str:
+        return self.host_command("host:devices-l")
+
+    def device_list(self) -> list[tuple[str, str, dict[str, str]]]:
+        return parse_devices(self.devices())
+
+    def connect(self, address: str) -> str:
+        return self.host_command(f"host:connect:{address}")
+
+    def disconnect(self, address: str = "") -> str:
+        return self.host_command(f"host:disconnect:{address}")
+
+    def kill_server(self):
+        try:
+            with self._open(timeout=2) as sock:
+                self._request(sock, "host:kill")
+        except AdbClientError:
+            pass
+
+    def transport(self, serial: str | None, timeout: float | None = None) -> socket.socket:
+        sock = self._open(timeout)
+        try:
+            self._request(sock, f"host:transport:{serial}" if serial else "host:transport-any")
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def service(self, serial: str | None, service: str, timeout: float | None = None) -> str:
+        with self.transport(serial, timeout) as sock:
+            self._request(sock, service)
+            return self._recv_all(sock).decode("utf-8", "replace")
+
+    def shell(self, serial: str, cmd: str, timeout: float | None = None) -> tuple[int, str, str]:
+        sock = self.transport(serial, timeout)
+        try:
+            try:
+                self._request(sock, f"shell,v2,raw:{cmd}")
+            except AdbClientError:
+                # device without shell_v2: legacy protocol, no exit code
+                sock.close()
+                out = self.service(serial, f"shell:{cmd}", timeout)
+                return 0, out, ""
+            return self._read_shell_v2(sock)
+        finally:
+            sock.close()
+
+    def _read_shell_v2(self, sock: socket.socket) -> tuple[int, str, str]:
+        stdout, stderr = [], []
+        code = 0
+        while True:
+            try:
+                header = self._recv_exact(sock, 5)
+            except AdbClientError:
+                break
+            packet_id, size = struct.unpack("<BI", header)
+            data = self._recv_exact(sock, size) if size else b""
+            if packet_id == SHELL_STDOUT:
+                stdout.append(data)
+            elif packet_id == SHELL_STDERR:
+                stderr.append(data)
+            elif packet_id == SHELL_EXIT:
+                code = data[0] if data else 0
+                break
+        return (code,
+                b"".join(stdout).decode("utf-8", "replace"),
+                b"".join(stderr).decode("utf-8", "replace"))
+
+    def tcpip(self, port: int, serial: str | None = None) -> str:
+        return self.service(serial, f"tcpip:{port}")
+
+    def usb(self, serial: str | None = None) -> str:
+        return self.service(serial, "usb:")
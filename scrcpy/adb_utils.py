@@ -1,17 +1,39 @@
 # -*- coding: utf-8 -*-
 import shutil
+import sqlite3
 import subprocess
+import threading
 import time
 from pathlib import Path
 
+from .adb_client import AdbClient, AdbClientError, AdbServerUnavailable, parse_devices
+from .device_tracker import DeviceTracker
+from .discovery import Discovery
+from .encoders import (AUDIO_FALLBACK, CODEC_MIME, MEDIA_CODECS_CMD, VIDEO_FALLBACK, EncoderCache,
+                       choose_encoder, parse_list_encoders, parse_session_limits)
+from .history import ConnectionHistory
+from .props import FINGERPRINT, IDENTITY_CMD, LAST_DEVICE_PROPS, PropertyCache, parse_getprop, same_device
+from .shell_session import ShellSession, ShellSessionError
+from .trace import Tracer
+
+CONNECT_READY = 10  # seconds for a fresh TCP transport to leave offline/unauthorized
+RESTART_TIMEOUT = 15  # seconds for adbd to come back after tcpip or a restart
+DEBUG_LOG_BYTES = 1 << 20
+LIST_ENCODERS_TIMEOUT = 30  # scrcpy pushes and starts its server just to list them
+LAUNCHER_CMD = "cmd package resolve-activity --brief -a android.intent.action.MAIN " \
+               "-c android.intent.category.LAUNCHER {}"
+
 
 class ADBHelper:
     def __init__(self):
         self.script_dir = Path(__file__).resolve().parent
         self.last_working_device_file = self.script_dir / "last_working_device.conf"
         self.debug_log_file = self.script_dir / "debug.log"
+        self.tracer = Tracer(self.script_dir / "trace.log")
         self.usb_device_serial = None
         self.rooted = False
+        self.props = PropertyCache(self.script_dir / "device_props.json")
+        self.tracker = DeviceTracker(poll=self._device_list)
         self._check_adb_presence()
         self._init_logs()
 
@@ -25,11 +47,28 @@ class ADBHelper:
 
     def _init_logs(self):
         self.last_working_device_file.touch(exist_ok=True)
-        self.debug_log_file.write_text("")  # empty the log
+        # keep earlier runs: a slow connect is often noticed only after a restart
+        if self.debug_log_file.exists() and self.debug_log_file.stat().st_size > DEBUG_LOG_BYTES:
+            self.debug_log_file.replace(self.debug_log_file.with_name(self.debug_log_file.name + ".1"))
+        with open(self.debug_log_file, "a") as f:
+            f.write(f"--- {time.strftime('%Y-%m-%d %H:%M:%S')} ---\n")
+
+    def _device_list(self) -> list[tuple[str, str, dict[str, str]]]:
+        result = self.tracer.run(
+            ["adb", "devices", "-l"], capture_output=True, text=True, check=True
+        )
+        return parse_devices(result.stdout)
+
+    @staticmethod
+    def _usb_serial(devices: dict[str, str]) -> str | None:
+        for serial, state in devices.items():
+            if state == "device" and "." not in serial:
+                return serial
+        return None
 
     def get_device_serial(self) -> str:
         try:
-            result = subprocess.run(
+            result = self.tracer.run(
                 ["adb", "devices", "-l"], capture_output=True, text=True, check=True
             )
             lines = result.stdout.splitlines()
@@ -44,28 +83,27 @@ class ADBHelper:
 
     def check_usb_connection(self):
         print("DEBUG> killing adb server...")
-        subprocess.run(
+        self.tracer.run(
             ["adb", "kill-server"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
         )
 
-        while not self.usb_device_serial:
-            subprocess.run(
-                ["adb", "usb"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-            )
-            time.sleep(2)
-            self.usb_device_serial = self.get_device_serial()
-
-            if self.usb_device_serial:
-                device_name = self._get_device_name()
-                print(f"\ndevice(s) connected via USB cable: {device_name}")
-                print(f"usb_device_serial: {self.usb_device_serial}")
-                break
-            else:
-                print(".", end="", flush=True)
+        self.tracer.run(
+            ["adb", "usb"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        print("Waiting for a device on USB...")
+        # returns as soon as the server reports the device, however long the cable takes
+        self.usb_device_serial = self.tracker.wait_for(self._usb_serial, None)
+
+        device_name = self._get_device_name()
+        print(f"\ndevice(s) connected via USB cable: {device_name}")
+        print(f"usb_device_serial: {self.usb_device_serial}")
 
     def _get_device_name(self) -> str:
+        cached = self.props.get(self.usb_device_serial) if self.usb_device_serial else None
+        if cached and cached.get("ro.product.model"):
+            return cached["ro.product.model"]
         try:
-            result = subprocess.run(
+            result = self.tracer.run(
                 ["adb", "devices", "-l"], capture_output=True, text=True, check=True
             )
             lines = result.stdout.splitlines()
@@ -82,7 +120,7 @@ class ADBHelper:
     def check_root(self, device_serial: str):
         print("Checking root...")
         try:
-            result = subprocess.run(
+            result = self.tracer.run(
                 ["adb", "-s", device_serial, "shell", "su", "--command", "id -u"],
                 capture_output=True,
                 text=True,
@@ -109,14 +147,17 @@ class ADBHelper:
         if not device_serial:
             raise RuntimeError("No device connected via USB.")
 
-        subprocess.run(
+        self.tracer.run(
             ["adb", "-s", device_serial, "shell", "svc", "wifi", "enable"],
             stdout=subprocess.DEVNULL,
         )
 
         wlan0_ip = ""
+        deadline = time.monotonic() + RESTART_TIMEOUT
         while not wlan0_ip:
-            result = subprocess.run(
+            if time.monotonic() > deadline:
+                raise RuntimeError("Wi-Fi did not get an IP address.")
+            result = self.tracer.run(
                 ["adb", "-s", device_serial, "shell", "ip -f inet addr show wlan0"],
                 capture_output=True,
                 text=True,
@@ -127,39 +168,49 @@ class ADBHelper:
                     ip = line.strip().split()[1].split("/")[0]
                     wlan0_ip = ip
                     break
+            if not wlan0_ip and self.tracker.wait_gone(device_serial, 0.5):
+                raise RuntimeError("Device went away while waiting for Wi-Fi.")
         print(f"WiFi IP: {wlan0_ip}")
         return wlan0_ip
 
     def set_last_working_device_info(self, device_serial: str):
         lines = [device_serial]
+        props = self._get_props(device_serial)
 
-        props = {
-            "Manufacturer": "ro.product.manufacturer",
-            "Android Version": "ro.build.version.release",
-            "SDK Version": "ro.build.version.sdk",
-            "Product Name": "ro.product.name",
-            "Model": "ro.product.model",
-        }
-
-        for label, prop in props.items():
-            value = self._get_prop(device_serial, prop)
-            lines.append(f"{label}: {value}")
+        for label, prop in LAST_DEVICE_PROPS.items():
+            lines.append(f"{label}: {props.get(prop, 'Unknown')}")
 
         self.last_working_device_file.write_text("\n".join(lines))
 
-    def _get_prop(self, device_serial: str, prop: str) -> str:
+    def _get_props(self, device_serial: str) -> dict[str, str]:
+        props = self.props.get(device_serial)
+        if props is not None:
+            try:
+                identity = self.tracer.run(["adb", "-s", device_serial, "shell", IDENTITY_CMD],
+                                           capture_output=True, text=True, timeout=5).stdout
+            except subprocess.SubprocessError:
+                identity = ""
+            if same_device(props, identity):
+                return props
         try:
-            result = subprocess.run(
-                ["adb", "-s", device_serial, "shell", "getprop", prop],
+            result = self.tracer.run(
+                ["adb", "-s", device_serial, "shell", "getprop"],
                 capture_output=True,
                 text=True,
                 timeout=5,
             )
-            return result.stdout.strip()
         except subprocess.SubprocessError:
-            return "Unknown"
+            return {}
+        props = parse_getprop(result.stdout)
+        if props:
+            self.props.put(device_serial, props)
+        return props
 
     def usb_connection(self, port: int = 5555):
+        with self.tracer.trace("usb_connection", port=port):
+            return self._usb_connection(port)
+
+    def _usb_connection(self, port: int):
         print("\n\n!!! READ CAREFULLY !!!\n")
         print("1. Plug in the USB cable and enable USB debugging.")
         print(
@@ -172,21 +223,25 @@ class ADBHelper:
             "Checking if USB cable is connected and USB debugging is enabled...\n......"
         )
 
-        self.check_usb_connection()
+        with self.tracer.span("usb_detect"):
+            self.check_usb_connection()
         if not self.usb_device_serial:
             raise RuntimeError("No USB device detected.")
 
         device = self.usb_device_serial
-        self.check_root(device)
+        with self.tracer.span("root_check"):
+            self.check_root(device)
 
         if not self.rooted:
             print("Device is not rooted. Using temporary TCP/IP method...")
-            subprocess.run(["adb", "tcpip", str(port)])
-            time.sleep(5)
+            with self.tracer.span("tcpip"):
+                mark = self.tracker.mark(device)
+                self.tracer.run(["adb", "-s", device, "tcpip", str(port)])
+                self.tracker.wait_restart(device, mark, RESTART_TIMEOUT)
         else:
             # Set adb tcp props persistently
             for prop in ["service.adb.tcp.port", "persist.adb.tcp.port"]:
-                subprocess.run(
+                self.tracer.run(
                     [
                         "adb",
                         "-s",
@@ -198,7 +253,7 @@ class ADBHelper:
                     ],
                     check=False,
                 )
-                value = subprocess.run(
+                value = self.tracer.run(
                     [
                         "adb",
                         "-s",
@@ -214,29 +269,34 @@ class ADBHelper:
                 print(f"Property {prop} set to: {value}")
 
             print("Restarting adbd...")
-            subprocess.run(
-                [
-                    "adb",
-                    "-s",
-                    device,
-                    "shell",
-                    "su",
-                    "--command",
-                    "stop adbd ; sleep 2 ; start adbd",
-                ],
-                check=False,
-            )
-            time.sleep(5)
+            with self.tracer.span("adbd_restart"):
+                mark = self.tracker.mark(device)
+                self.tracer.run(
+                    [
+                        "adb",
+                        "-s",
+                        device,
+                        "shell",
+                        "su",
+                        "--command",
+                        "stop adbd ; sleep 2 ; start adbd",
+                    ],
+                    check=False,
+                )
+                if not self.tracker.wait_restart(device, mark, RESTART_TIMEOUT):
+                    raise RuntimeError("adbd did not come back after the restart.")
             print("Restarted adbd")
 
         print("Attempting to start Wi-Fi on the device...")
-        wlan0_ip = self.start_wifi_connection()
+        with self.tracer.span("wifi_ip"):
+            wlan0_ip = self.start_wifi_connection()
         socket = f"{wlan0_ip}:{port}"
         print(f"New socket: {socket}")
 
-        result = subprocess.run(
-            ["adb", "connect", socket], capture_output=True, text=True
-        )
+        with self.tracer.span("tcp_connect"):
+            result = self.tracer.run(
+                ["adb", "connect", socket], capture_output=True, text=True
+            )
         status = result.stdout.strip()
         with open(self.debug_log_file, "a") as log:
             log.write(f"ADB connect status: {status}\n")
@@ -246,7 +306,7 @@ class ADBHelper:
             connected = False
         else:
             print("Connecting via WiFi succeeded!")
-            subprocess.run(["adb", "connect", socket])
+            self.tracer.run(["adb", "connect", socket])
             self.set_last_working_device_info(device_serial=socket)
             print("Device ready!")
             connected = True
@@ -262,12 +322,12 @@ class ADBHelper:
         print("Enjoy a smooth wireless experience!")
         print("######################################\n")
 
-    def print_connections(self, port: int = 5555):
+    def print_connections(self, port: int = 5555, timeout: float = 60):
         socket = None
         connections = None
 
         try:
-            output = subprocess.run(
+            output = self.tracer.run(
                 ["adb", "devices", "-l"], capture_output=True, text=True, check=True
             ).stdout
 
@@ -280,8 +340,9 @@ class ADBHelper:
                 print("No active device found using TCP on the given port.")
                 return
 
-            while not connections:
-                result = subprocess.run(
+            deadline = time.monotonic() + timeout
+            while not connections and time.monotonic() < deadline:
+                result = self.tracer.run(
                     ["adb", "-s", socket, "shell", f"netstat -tupna | grep {port}"],
                     capture_output=True,
                     text=True,
@@ -291,7 +352,11 @@ class ADBHelper:
                     print(f"Active connections on port {port}:\n{connections}")
                     break
 
-                time.sleep(1)
+                if self.tracker.wait_gone(socket, 1):
+                    print(f"{socket} went away.")
+                    return
+            if not connections:
+                print(f"No connections on port {port} within {timeout}s.")
 
         except subprocess.CalledProcessError as e:
             print(f"Error while checking connections: {e}")
@@ -303,73 +368,319 @@ class ADBError(Exception):
 
 
 class AdbUtils:
-    def __init__(self, port: int = 5555, config_dir: Path = Path(__file__).parent.parent):
+    def __init__(self, port: int = 5555, config_dir: Path = Path(__file__).parent.parent,
+                 backend: str = "socket", tracer: Tracer | None = None, subnets: list[str] | None = None):
         self.port = port
         self.config_dir = config_dir
         self.last_device_file = self.config_dir / 'last_working_device.conf'
         self.config_dir.mkdir(parents=True, exist_ok=True)
+        self.client = AdbClient() if backend == "socket" else None
+        self.sessions: dict[str, ShellSession] = {}
+        self._sessions_lock = threading.Lock()
+        self.props = PropertyCache(self.config_dir / 'device_props.json')
+        self.session_limits: dict[str, dict[str, int]] = {}
+        self._verified: set[str] = set()
+        self.activities: dict[tuple[str, str], str] = {}
+        self.encoder_cache = EncoderCache(self.config_dir / 'encoders.json')
+        self._unlisted: set[str] = set()
+        self._listing: dict[str, threading.Lock] = {}
+        self._fallbacks: set[tuple[str, str, str]] = set()
+        self.tunings: dict[str, dict[str, str] | None] = {}
+        self.tracer = tracer or Tracer()
+        self.history = ConnectionHistory(self.config_dir / 'connections.db')
+        self.tracker = DeviceTracker(self.client, poll=self.device_list)
+        self.discovery = Discovery(port, self.config_dir / 'discovery.json', networks=subnets)
+        self._import_last_device()
+
+    def _import_last_device(self):
+        # one-time migration of the single socket kept before the history existed
+        socket, _ = self.load_last_device()
+        if socket and self.history.empty():
+            self.history.attempt(socket, True)
+
+    def _record(self, method, *args):
+        try:
+            method(*args)
+        except sqlite3.Error as e:
+            print(f"Could not update connection history: {e}")
 
     def _run(self, args, capture_output=True, check=False):
-        result = subprocess.run(["adb"] + args,
-                                capture_output=capture_output,
-                                text=True)
+        result = self.tracer.run(["adb"] + args,
+                                 capture_output=capture_output,
+                                 text=True)
         if check and result.returncode != 0:
             raise ADBError(f"ADB command failed: {' '.join(args)} - {result.stderr}")
         return result.stdout.strip()
 
+    def _call(self, args, native, check=False):
+        if self.client is not None:
+            try:
+                with self.tracer.command(["adb"] + args, backend="socket") as span:
+                    out = native(self.client)
+                    span.attrs.update(code=0, bytes=len(out))
+                return out.strip()
+            except AdbServerUnavailable:
+                pass  # the adb binary spawns the server, later calls go through the socket
+            except AdbClientError as e:
+                if check:
+                    raise ADBError(f"ADB command failed: {' '.join(args)} - {e}")
+                return str(e)
+        return self._run(args, check=check)
+
+    def session(self, serial: str) -> ShellSession:
+        with self._sessions_lock:
+            session = self.sessions.get(serial)
+            if session is None:
+                session = self.sessions[serial] = ShellSession(serial, self.client)
+            return session
+
+    def close_sessions(self, serial: str | None = None):
+        with self._sessions_lock:
+            serials = [serial] if serial else list(self.sessions)
+            closing = [self.sessions.pop(s) for s in serials if s in self.sessions]
+            # the next phone on this address may be another one
+            if serial:
+                self._verified.discard(serial)
+            else:
+                self._verified.clear()
+        for session in closing:
+            session.close()
+
     def kill_server(self):
-        self._run(["kill-server"], check=False)
+        self.close_sessions()
+        if self.client is not None:
+            self.client.kill_server()
+        else:
+            self._run(["kill-server"], check=False)
 
     def usb(self):
-        self._run(["usb"], check=False)
+        self._call(["usb"], lambda c: c.usb(), check=False)
 
     def devices(self) -> str:
-        return self._run(["devices", "-l"], check=True)
+        return self._call(["devices", "-l"],
+                          lambda c: "List of devices attached\n" + c.devices(),
+                          check=True)
+
+    def device_list(self) -> list[tuple[str, str, dict[str, str]]]:
+        return parse_devices(self.devices())
 
     def get_device_serial(self) -> str:
-        output = self.devices()
-        for line in output.splitlines():
-            if line.endswith("device") and "." not in line:
-                return line.split()[0]
+        for serial, state, _ in self.device_list():
+            if state == "device" and "." not in serial:
+                return serial
         return ""
 
-    def check_usb_connection(self, timeout: int = 60) -> str:
-        self.kill_server()
-        serial = ""
-        start = time.time()
-        while not serial and time.time() - start < timeout:
-            self.usb()
-            time.sleep(2)
-            serial = self.get_device_serial()
-        if not serial:
-            raise ADBError("No USB device found within timeout")
-        return serial
+    def server_busy(self) -> bool:
+        try:
+            return any(state == "device" for _, state, _ in self.device_list())
+        except ADBError:
+            return False
+
+    def check_usb_connection(self, timeout: int = 60, cancelled: threading.Event | None = None,
+                             restart_server: bool = True) -> str:
+        if restart_server and not self.server_busy():
+            self.kill_server()
+        self.usb()
+        prompted = set()
+
+        def usb_device(devices):
+            for serial, state in devices.items():
+                if "." in serial:
+                    continue
+                if state == "device":
+                    return serial
+                if state == "unauthorized" and serial not in prompted:
+                    prompted.add(serial)
+                    print(f"Allow USB debugging on {serial} (check 'Always allow')...")
+            return None
+        serial = self.tracker.wait_for(usb_device, timeout, cancelled)
+        if serial:
+            return serial
+        if cancelled is not None and cancelled.is_set():
+            return ""
+        raise ADBError("No USB device found within timeout")
 
     def connect_tcp(self, socket: str) -> bool:
-        status = self._run(["connect", socket])
-        return "cannot" not in status and "failed" not in status
-
-    def disconnect(self):
-        self._run(["disconnect"], check=False)
-
-    def shell(self, serial: str, cmd: str) -> str:
-        return self._run(["-s", serial, "shell", cmd], check=True)
-
-    def tcpip(self):
-        self._run(["tcpip", str(self.port)], check=True)
-
-    def save_last_device(self, serial: str):
-        properties = {
-                'Manufacturer': self.shell(serial, "getprop ro.product.manufacturer"),
-                'Android Version': self.shell(serial, "getprop ro.build.version.release"),
-                'SDK Version': self.shell(serial, "getprop ro.build.version.sdk"),
-                'Product Name': self.shell(serial, "getprop ro.product.name"),
-                'Model': self.shell(serial, "getprop ro.product.model")
-        }
-        with open(self.last_device_file, 'w') as f:
-            f.write(f"{serial}\n")
-            for key, val in properties.items():
-                f.write(f"{key}: {val}\n")
+        self._verified.discard(socket)
+        start = time.perf_counter()
+        status = self._call(["connect", socket], lambda c: c.connect(socket))
+        ok = "cannot" not in status and "failed" not in status
+        if ok and not self.tracker.wait_online(socket, CONNECT_READY):
+            # adb reports "connected" before the transport is usable (offline, unauthorized)
+            print(f"{socket} connected but is {self.tracker.state(socket)}")
+            ok = False
+        self._record(self.history.attempt, socket, ok, time.perf_counter() - start)
+        return ok
+
+    def known_sockets(self) -> list[str]:
+        try:
+            return [entry["socket"] for entry in self.history.ranked("tcp")]
+        except sqlite3.Error:
+            socket, _ = self.load_last_device()
+            return [socket] if socket else []
+
+    def known_ips(self) -> list[str]:
+        try:
+            return [device["last_ip"] for device in self.history.devices() if device["last_ip"]]
+        except sqlite3.Error:
+            return []
+
+    def known_devices(self) -> list[str]:
+        try:
+            return [entry["socket"] for entry in self.history.best_per_device("tcp")]
+        except sqlite3.Error:
+            return self.known_sockets()
+
+    def disconnect(self, socket: str = ''):
+        self.close_sessions(socket or None)
+        args = ["disconnect", socket] if socket else ["disconnect"]
+        self._call(args, lambda c: c.disconnect(socket), check=False)
+
+    def shell(self, serial: str, cmd: str, timeout: float | None = None) -> str:
+        try:
+            with self.tracer.command(["adb", "-s", serial, "shell", cmd], backend="session") as span:
+                code, out, err = self.session(serial).run(cmd, timeout)
+                span.attrs.update(code=code, bytes=len(out))
+        except ShellSessionError as e:
+            raise ADBError(f"ADB shell failed on {serial}: {cmd} - {e}")
+        except OSError:
+            return self.exec_shell(serial, cmd)
+        if code != 0:
+            raise ADBError(f"ADB command failed: -s {serial} shell {cmd} - {(err or out).strip()}")
+        return out.strip()
+
+    def exec_shell(self, serial: str, cmd: str) -> str:
+        def native(client: AdbClient):
+            code, out, err = client.shell(serial, cmd)
+            if code != 0:
+                raise AdbClientError(err or out)
+            return out
+        return self._call(["-s", serial, "shell", cmd], native, check=True)
+
+    def tcpip(self, serial: str | None = None):
+        mark = self.tracker.mark(serial) if serial else 0
+        args = (["-s", serial] if serial else []) + ["tcpip", str(self.port)]
+        self._call(args, lambda c: c.tcpip(self.port, serial), check=True)
+        if serial:
+            # adbd restarts in TCP mode: the old shell session is gone and the device drops for a moment
+            self.close_sessions(serial)
+            if not self.tracker.wait_restart(serial, mark, RESTART_TIMEOUT):
+                raise ADBError(f"{serial} did not come back after switching to TCP mode")
+
+    def properties(self, serial: str, refresh: bool = False) -> dict[str, str]:
+        props = None if refresh else self.props.get(serial)
+        if props is not None and serial not in self._verified:
+            # an ip:port is reused by whatever phone gets that address, check the cached one is still there
+            try:
+                if not same_device(props, self.shell(serial, IDENTITY_CMD)):
+                    props = None
+            except ADBError:
+                props = None
+        if props is None:
+            props = parse_getprop(self.shell(serial, "getprop"))
+            self.props.put(serial, props)
+            self.tunings.pop(serial, None)
+        self._verified.add(serial)
+        return props
+
+    def encoder_session_limit(self, serial: str, codec: str = "h264") -> int | None:
+        fingerprint = self.properties(serial).get(FINGERPRINT, serial)
+        if fingerprint not in self.session_limits:
+            try:
+                self.session_limits[fingerprint] = parse_session_limits(self.shell(serial, MEDIA_CODECS_CMD))
+            except ADBError:
+                return None
+        return self.session_limits[fingerprint].get(CODEC_MIME.get(codec, codec))
+
+    def encoders(self, serial: str) -> dict[str, list[dict]] | None:
+        fingerprint = self.properties(serial).get(FINGERPRINT, serial)
+        with self._sessions_lock:
+            listing = self._listing.setdefault(fingerprint, threading.Lock())
+        # windows of one build launching together wait for a single listing
+        with listing:
+            encoders = self.encoder_cache.get(fingerprint)
+            if encoders is None and fingerprint not in self._unlisted:
+                print(f"Listing the encoders of {serial} (once per build)...")
+                try:
+                    result = self.tracer.run(["scrcpy", "-s", serial, "--list-encoders"], capture_output=True,
+                                             text=True, timeout=LIST_ENCODERS_TIMEOUT)
+                    encoders = parse_list_encoders(result.stdout + result.stderr)
+                except (OSError, subprocess.TimeoutExpired):
+                    encoders = None
+                if encoders and (encoders["video"] or encoders["audio"]):
+                    self.encoder_cache.put(fingerprint, encoders)
+                else:
+                    # not again this session, every launch would pay for it
+                    print(f"Could not list the encoders of {serial}, keeping the configured ones.")
+                    self._unlisted.add(fingerprint)
+                    encoders = None
+        return encoders
+
+    def encoder_overrides(self, serial: str, options: list[str]) -> dict[str, str]:
+        """Codec and encoder flags for `options`: a hardware encoder, another codec if the device lacks one."""
+        encoders = self.encoders(serial)
+        if not encoders:
+            return {}
+        overrides = {}
+        for kind, fallback in (("video", VIDEO_FALLBACK), ("audio", AUDIO_FALLBACK)):
+            flag = f"--{kind}-codec"
+            # a hand-picked encoder is kept as is
+            if f"--{kind}-encoder" in options or f"--no-{kind}" in options:
+                continue
+            codec = options[options.index(flag) + 1] if flag in options else fallback[0]
+            choice = None if codec == "raw" else choose_encoder(encoders[kind], codec, fallback)
+            if choice is None:
+                continue
+            if choice[0] != codec and (serial, kind, codec) not in self._fallbacks:
+                self._fallbacks.add((serial, kind, codec))
+                print(f"{serial} has no {codec} encoder, using {choice[0]} ({choice[1]}).")
+            overrides[flag], overrides[f"--{kind}-encoder"] = choice
+        return overrides
+
+    def _serialno(self, serial: str) -> str:
+        return self.properties(serial).get("ro.serialno") or serial
+
+    def tuning(self, serial: str) -> dict[str, str] | None:
+        if serial not in self.tunings:
+            try:
+                self.tunings[serial] = self.history.tuning(self._serialno(serial))
+            except sqlite3.Error:
+                return None
+        return self.tunings[serial]
+
+    def save_tuning(self, serial: str, settings: dict[str, str], trials: list[dict]):
+        # kept by serialno, the same phone over USB or another address reuses it
+        self._record(self.history.tune, self._serialno(serial), settings, trials)
+        self.tunings[serial] = settings
+
+    def launcher_activity(self, serial: str, package: str) -> str:
+        if (serial, package) not in self.activities:
+            out = self.shell(serial, LAUNCHER_CMD.format(package))
+            component = out.splitlines()[-1].strip() if out else ''
+            if "/" not in component:
+                raise ADBError(f"No launcher activity for {package} on {serial}")
+            self.activities[serial, package] = component
+        return self.activities[serial, package]
+
+    def start_on_display(self, serial: str, app: str, display: int):
+        """Launch an app onto an existing display, `app` as in scrcpy's --start-app (a '+' force-stops it first)."""
+        package = app.lstrip("+")
+        if package.startswith("?"):
+            raise ADBError(f"Switching needs a package name, not {package}")
+        component = self.launcher_activity(serial, package)
+        stop = "-S " if app.startswith("+") else ""
+        out = self.shell(serial, f"am start --display {display} {stop}-n {component}")
+        # am reports a missing activity on stdout and still exits 0
+        if "Error" in out:
+            self.activities.pop((serial, package), None)
+            raise ADBError(f"Could not start {package} on display {display}: {out.splitlines()[-1]}")
+
+    def remember(self, serial: str, socket: str):
+        serialno = self._serialno(serial)
+        name = self.properties(serial).get("ro.product.model")
+        if serial != socket:
+            self._record(self.history.seen, serialno, serial, name)
+        self._record(self.history.seen, serialno, socket, name)
 
     def load_last_device(self) -> (str, dict):
         if not self.last_device_file.exists():
@@ -385,11 +696,11 @@ class AdbUtils:
         return socket, props
 
     @staticmethod
-    def start(serial: str, options: str):
-        cmd = f"scrcpy -s {serial} {' '.join(options)}"
-        return subprocess.Popen(cmd, shell=True)
-
-    @staticmethod
-    def start_app(serial: str, options: str, app: str, name: str):
-        cmd = f"scrcpy -s {serial} {' '.join(options)} --new-display --start-app={app} --window-title={name}"
-        return subprocess.Popen(cmd, shell=True)
+    def scrcpy_args(serial: str, options: list[str], app: str | None = None,
+                    title: str | None = None) -> list[str]:
+        argv = ["scrcpy", "-s", serial, *options]
+        if app:
+            argv += ["--new-display", f"--start-app={app}"]
+        if title:
+            argv.append(f"--window-title={title}")
+        return argv
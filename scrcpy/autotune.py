@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+import re
+import signal
+import statistics
+import subprocess
+import threading
+import time
+from typing import Callable
+
+from . import launcher
+from .scrcpy_log import ScrcpyLog
+from .telemetry import CLOCK_TICKS, proc_usage
+
+WARMUP = 2.0  # seconds for the encoder and its rate control to settle, not scored
+# a static screen encodes next to no frames: trials scroll the Settings list to have something to measure
+MOTION_START = "am start -W -a android.settings.SETTINGS"
+MOTION_STOP = "input keyevent KEYCODE_HOME"
+SWIPE_SECONDS = 0.3
+WM_SIZE = re.compile(r"(?:Override|Physical) size: (?P<width>\d+)x(?P<height>\d+)")
+
+
+def screen_size(output: str) -> tuple[int, int]:
+    # the override, when set, is what apps lay out for; it comes last
+    sizes = WM_SIZE.findall(output)
+    return (int(sizes[-1][0]), int(sizes[-1][1])) if sizes else (1080, 1920)
+
+
+def motion_cmd(width: int, height: int, seconds: float) -> str:
+    x, top, bottom = width // 2, height // 4, height * 3 // 4
+    ms = int(SWIPE_SECONDS * 1000)
+    swipes = max(1, int(seconds / SWIPE_SECONDS / 2) + 1)
+    return (f"for i in $(seq {swipes}); do input swipe {x} {bottom} {x} {top} {ms}; "
+            f"input swipe {x} {top} {x} {bottom} {ms}; done")
+
+
+class Trial:
+    def __init__(self, codec: str, bitrate: str, max_size: str):
+        self.codec = codec
+        self.bitrate = bitrate
+        self.max_size = max_size
+        self.fps: float | None = None
+        self.cpu: float | None = None
+        self.error = ''
+
+    def overrides(self) -> dict[str, str]:
+        return {"--video-codec": self.codec, "--video-bit-rate": self.bitrate, "--max-size": self.max_size}
+
+    def record(self) -> dict:
+        return {"codec": self.codec, "bitrate": self.bitrate, "max_size": self.max_size,
+                "fps": self.fps, "cpu": self.cpu, "error": self.error or None}
+
+    def __str__(self):
+        if self.error:
+            result = f"failed: {self.error}"
+        else:
+            cpu = f"{self.cpu:.0f}% CPU" if self.cpu is not None else "CPU unknown"
+            result = f"{self.fps:.1f} fps, {cpu}"
+        return f"{self.codec} {self.bitrate} {self.max_size}: {result}"
+
+
+def grid(codecs: list[str], bitrates: list, sizes: list,
+         encoders: dict[str, list[dict]] | None = None) -> list[Trial]:
+    if encoders:
+        # a codec only the software encoder handles is never what we want to launch with
+        hardware = {e["codec"] for e in encoders["video"] if e["hardware"]}
+        codecs = [codec for codec in codecs if codec in hardware]
+    return [Trial(codec, str(bitrate), str(size)) for codec in codecs for bitrate in bitrates for size in sizes]
+
+
+def _quietly(fn: Callable[[], object]):
+    try:
+        fn()
+    except Exception:
+        pass  # a trial without motion still runs, min_fps catches a tune that never moved
+
+
+def run_trial(argv: list[str], trial: Trial, duration: float, motion: Callable[[], object] | None = None) -> Trial:
+    """Run scrcpy for WARMUP + `duration` seconds, scoring its --print-fps lines and host CPU.
+
+    `motion` runs meanwhile to put moving content on the screen, see motion_cmd.
+    """
+    log = ScrcpyLog.for_args(argv)
+    samples: list[int] = []
+    mover = threading.Thread(target=_quietly, args=(motion,), name="autotune-motion", daemon=True) if motion else None
+    if mover:
+        mover.start()
+    proc = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, **launcher.popen_kwargs())
+    start = time.monotonic()
+
+    def read():
+        for raw in proc.stdout:
+            if log.feed(raw.decode("utf-8", "replace")) == "fps" and time.monotonic() - start >= WARMUP:
+                samples.append(log.fps)
+
+    reader = threading.Thread(target=read, name="autotune-log", daemon=True)
+    reader.start()
+    try:
+        proc.wait(WARMUP)
+    except subprocess.TimeoutExpired:
+        before, since = proc_usage(proc.pid), time.monotonic()
+        try:
+            proc.wait(duration)
+        except subprocess.TimeoutExpired:
+            after = proc_usage(proc.pid)
+            if before and after:
+                trial.cpu = 100.0 * (after[0] - before[0]) / CLOCK_TICKS / (time.monotonic() - since)
+    if proc.poll() is not None:
+        trial.error = log.failure.value if log.failure else f"scrcpy exited with {proc.returncode}"
+    else:
+        # the whole group, as the supervisor does: what scrcpy forked goes with it
+        launcher.signal_group(proc.pid, signal.SIGTERM)
+        try:
+            proc.wait(5)
+        except subprocess.TimeoutExpired:
+            launcher.signal_group(proc.pid, signal.SIGKILL)
+            proc.wait()
+    # anything it left behind once it exited on its own
+    launcher.signal_leftovers(proc.pid, signal.SIGTERM)
+    reader.join(1)
+    if mover:
+        # sized to end with the trial, the next one should not start under its tail
+        mover.join(SWIPE_SECONDS * 2)
+    if not trial.error:
+        if samples:
+            trial.fps = statistics.median(samples)
+        else:
+            trial.error = "no fps reported"
+    return trial
+
+
+def pareto(trials: list[Trial]) -> list[Trial]:
+    scored = [t for t in trials if t.fps is not None and t.cpu is not None]
+    return [t for t in scored
+            if not any(o.fps >= t.fps and o.cpu <= t.cpu and (o.fps > t.fps or o.cpu < t.cpu) for o in scored)]
+
+
+def best(trials: list[Trial], tolerance: float = 0.05) -> Trial | None:
+    front = pareto(trials)
+    if not front:
+        return None
+    top = max(t.fps for t in front)
+    # frame rates within `tolerance` of the best look the same, the cheapest of them for the host wins
+    return min((t for t in front if t.fps >= top * (1 - tolerance)), key=lambda t: t.cpu)
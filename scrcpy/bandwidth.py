@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import math
+from enum import Enum
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from config import ScrcpyConfig
+
+UNITS = {"K": 10 ** 3, "M": 10 ** 6, "G": 10 ** 9}
+
+
+def parse_rate(value) -> int:
+    if isinstance(value, Enum):
+        value = value.value
+    value = str(value).strip().upper()
+    if value and value[-1] in UNITS:
+        return int(float(value[:-1]) * UNITS[value[-1]])
+    return int(float(value))
+
+
+class BandwidthPlanner:
+    def __init__(self, config: ScrcpyConfig):
+        self.config = config
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.Bandwidth.budget is not False
+
+    def weight(self, alias: str) -> float:
+        if alias == "Main":
+            return float(self.config.Bandwidth.main_weight)
+        return float(self.config.App.weights.get(alias, 1))
+
+    def shares(self, keys: list[str]) -> dict[str, int]:
+        if not self.enabled or not keys:
+            return {}
+        weights = {key: self.weight(key.split("/", 1)[-1]) for key in keys}
+        total = sum(weights.values()) or 1
+        budget = parse_rate(self.config.Bandwidth.budget)
+        floor = parse_rate(self.config.Bandwidth.min_bitrate)
+        return {key: max(floor, int(budget * weight / total)) for key, weight in weights.items()}
+
+    def args_for(self, share: int, bitrate=None, max_size=None, fps=None) -> dict[str, str]:
+        """Overrides for a window given `share`; bitrate, max_size and fps are the window's own (e.g. its profile)."""
+        video = self.config.Video
+        bitrate, max_size, fps = bitrate or video.bitrate, max_size or video.max_size, fps or video.fps
+        # a share never raises a window above what it asked for
+        share = min(share, parse_rate(bitrate)) if bitrate else share
+        overrides = {"--video-bit-rate": str(share)}
+        ratio = min(1.0, share / parse_rate(bitrate)) if bitrate else 1.0
+        if self.config.Bandwidth.scale_max_size and max_size:
+            size = int(int(max_size) * math.sqrt(ratio)) // 8 * 8
+            overrides["--max-size"] = str(min(int(max_size), max(480, size)))
+        if self.config.Bandwidth.scale_fps and fps:
+            overrides["--max-fps"] = str(min(int(fps), max(15, int(int(fps) * ratio))))
+        return overrides
+
+    def changed(self, old: int | None, new: int) -> bool:
+        if old is None:
+            return False
+        return abs(new - old) > old * float(self.config.Bandwidth.tolerance)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import ctypes
+import ctypes.util
+import hashlib
+import os
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def _inotify_fd(directory: Path) -> int | None:
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    # editors often save by writing a temp file and renaming it over the config
+    if libc.inotify_add_watch(fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _names(data: bytes) -> list[str]:
+    names, offset = [], 0
+    while offset + EVENT_HEADER.size <= len(data):
+        _, _, _, size = EVENT_HEADER.unpack_from(data, offset)
+        offset += EVENT_HEADER.size
+        names.append(data[offset:offset + size].rstrip(b"\0").decode(errors="replace"))
+        offset += size
+    return names
+
+
+class ConfigWatcher:
+    def __init__(self, path: Path, callback: Callable[[], None], debounce: float = 0.5):
+        self.path = Path(path).resolve()
+        self.callback = callback
+        self.debounce = debounce
+        self.digest = self._digest()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _digest(self) -> str | None:
+        try:
+            return hashlib.sha1(self.path.read_bytes()).hexdigest()
+        except OSError:
+            return None
+
+    def start(self):
+        if self._thread is None:
+            # a fresh event: a watcher that is still winding down must not be revived
+            self._stop = threading.Event()
+            # watch before returning so an edit right after start() is not missed
+            fd = _inotify_fd(self.path.parent)
+            self._thread = threading.Thread(target=self._run, args=(self._stop, fd), name="config-watch",
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def _changed(self):
+        digest = self._digest()
+        # touch or a save without edits: nothing to do
+        if digest is None or digest == self.digest:
+            return
+        self.digest = digest
+        try:
+            self.callback()
+        except Exception as e:
+            print(f"Config reload failed: {e}")
+
+    def _run(self, stop: threading.Event, fd: int | None):
+        if fd is None:
+            self._poll(stop)
+            return
+        try:
+            pending = None
+            while not stop.is_set():
+                timeout = 0.5 if pending is None else max(0.0, pending - time.monotonic())
+                ready, _, _ = select.select([fd], [], [], timeout)
+                if ready:
+                    try:
+                        data = os.read(fd, 65536)
+                    except BlockingIOError:
+                        data = b""
+                    # the logs and history db next to the config wake us too, only its own name counts
+                    if self.path.name in _names(data):
+                        # a burst of writes restarts the quiet period
+                        pending = time.monotonic() + self.debounce
+                # checked on every wakeup, busy neighbours must not hold a pending reload back
+                if pending is not None and time.monotonic() >= pending:
+                    pending = None
+                    self._changed()
+        finally:
+            os.close(fd)
+
+    def _poll(self, stop: threading.Event):
+        last = None
+        while not stop.wait(max(self.debounce, 1.0)):
+            try:
+                mtime = self.path.stat().st_mtime_ns
+            except OSError:
+                continue
+            if last is not None and mtime != last:
+                self._changed()
+            last = mtime
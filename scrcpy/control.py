@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+import contextvars
+import io
+import itertools
+import json
+import os
+import queue
+import socket
+import sys
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable
+
+
+class ControlError(Exception):
+    pass
+
+
+def parse_command(line: str) -> dict:
+    command, _, arg = line.strip().partition(' ')
+    command, arg = command.lower(), arg.strip()
+    if command in ('all', 'dc', 'conn', 'autotune'):
+        return {"op": command, "device": arg or None}
+    if command == 'reload':
+        return {"op": "reload"}
+    if command == 'devices':
+        return {"op": "status"}
+    if command == 'list':
+        return {"op": "list"}
+    if command == 'metrics':
+        return {"op": "metrics", "path": arg or None}
+    if command == 'trace':
+        return {"op": "trace", "count": int(arg) if arg.isdigit() else None}
+    if command == 'profile':
+        target, _, name = arg.rpartition(' ')
+        if arg and not target.strip():
+            raise ValueError("Usage: profile <alias> <name>, or 'profile' to list them")
+        return {"op": "profile", "target": target.strip() or None, "name": name.strip() or None}
+    return {"op": "restart", "target": line.strip()}
+
+
+class _Capture:
+    def __init__(self, tee: bool):
+        self.buffer = io.StringIO()
+        self.tee = tee
+        self.open = True
+
+
+_capture: contextvars.ContextVar[_Capture | None] = contextvars.ContextVar("capture", default=None)
+
+
+class _Router:
+    """Process-wide stdout: prints under a request's context go to its reply, the rest pass through."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        capture = _capture.get()
+        # a task the request left running outlives its reply, it prints like everyone else
+        if capture is None or not capture.open:
+            return self.stream.write(text)
+        capture.buffer.write(text)
+        if capture.tee:
+            self.stream.write(text)
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+@contextmanager
+def captured_output(tee: bool):
+    if not isinstance(sys.stdout, _Router):
+        sys.stdout = _Router(sys.stdout)
+    capture = _Capture(tee)
+    token = _capture.set(capture)
+    try:
+        yield capture.buffer
+    finally:
+        capture.open = False
+        _capture.reset(token)
+
+
+class _Connection:
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.outbox: queue.Queue = queue.Queue(maxsize=1000)
+        self.subscribed = False
+        self.closed = False
+        threading.Thread(target=self._write, name="control-writer", daemon=True).start()
+
+    def send(self, message: dict):
+        if self.closed:
+            return
+        try:
+            self.outbox.put_nowait(message)
+        except queue.Full:
+            # a client that stopped reading must not hold back the others
+            self.close()
+
+    def _write(self):
+        while True:
+            message = self.outbox.get()
+            if message is None:
+                break
+            try:
+                self.sock.sendall(json.dumps(message).encode() + b"\n")
+            except OSError:
+                break
+        self.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            try:
+                self.outbox.put_nowait(None)
+            except queue.Full:
+                pass
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class ControlServer:
+    def __init__(self, path: Path, handler: Callable[[dict], dict]):
+        self.path = Path(path)
+        self.handler = handler
+        self.connections: list[_Connection] = []
+        self.lock = threading.Lock()
+        self.sock: socket.socket | None = None
+
+    @staticmethod
+    def alive(path: Path) -> bool:
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(str(path))
+            return True
+        except OSError:
+            return False
+
+    def start(self):
+        if self.alive(self.path):
+            raise ControlError(f"Another manager is listening on {self.path}")
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(str(self.path))
+        os.chmod(self.path, 0o600)
+        self.sock.listen(16)
+        threading.Thread(target=self._accept, name="control", daemon=True).start()
+
+    def stop(self):
+        if self.sock is None:
+            return
+        self.sock.close()
+        self.sock = None
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections.clear()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def publish(self, event: dict):
+        with self.lock:
+            subscribers = [conn for conn in self.connections if conn.subscribed]
+        for conn in subscribers:
+            conn.send(event)
+
+    def _accept(self):
+        while self.sock is not None:
+            try:
+                sock, _ = self.sock.accept()
+            except OSError:
+                return
+            conn = _Connection(sock)
+            with self.lock:
+                self.connections.append(conn)
+            threading.Thread(target=self._serve, args=(conn,), name="control-client", daemon=True).start()
+
+    def _serve(self, conn: _Connection):
+        try:
+            with conn.sock.makefile("rb") as lines:
+                for line in lines:
+                    if not line.strip():
+                        continue
+                    try:
+                        request = json.loads(line)
+                    except ValueError as e:
+                        conn.send({"ok": False, "error": f"bad request: {e}"})
+                        continue
+                    conn.send(self._dispatch(conn, request))
+        except OSError:
+            pass
+        finally:
+            conn.close()
+            with self.lock:
+                if conn in self.connections:
+                    self.connections.remove(conn)
+
+    def _dispatch(self, conn: _Connection, request: dict) -> dict:
+        reply = {"id": request.get("id")}
+        if request.get("op") == "subscribe":
+            conn.subscribed = True
+            return {**reply, "ok": True, "result": None}
+        try:
+            return {**reply, "ok": True, **self.handler(request)}
+        except Exception as e:
+            return {**reply, "ok": False, "error": str(e) or type(e).__name__}
+
+
+class ControlClient:
+    def __init__(self, path: Path, on_event: Callable[[dict], None] | None = None,
+                 timeout: float | None = 120):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(str(path))
+        except OSError as e:
+            self.sock.close()
+            raise ControlError(f"No manager listening on {path}: {e}")
+        self.on_event = on_event
+        self.timeout = timeout
+        self.pending: dict[int, queue.Queue] = {}
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+        threading.Thread(target=self._read, name="control-reader", daemon=True).start()
+
+    def _read(self):
+        with self.sock.makefile("rb") as lines:
+            try:
+                for line in lines:
+                    message = json.loads(line)
+                    if "event" in message:
+                        if self.on_event:
+                            self.on_event(message)
+                        continue
+                    with self.lock:
+                        waiter = self.pending.pop(message.get("id"), None)
+                    if waiter:
+                        waiter.put(message)
+            except (OSError, ValueError):
+                pass
+        with self.lock:
+            waiters, self.pending = list(self.pending.values()), {}
+        for waiter in waiters:
+            waiter.put({"ok": False, "error": "connection closed"})
+
+    def call(self, op: str, **fields) -> dict:
+        request_id = next(self._ids)
+        waiter: queue.Queue = queue.Queue(maxsize=1)
+        with self.lock:
+            self.pending[request_id] = waiter
+        try:
+            self.sock.sendall(json.dumps({"id": request_id, "op": op, **fields}).encode() + b"\n")
+        except OSError as e:
+            raise ControlError(f"Manager went away: {e}")
+        try:
+            return waiter.get(timeout=self.timeout)
+        except queue.Empty:
+            raise ControlError(f"No reply to {op} within {self.timeout}s")
+
+    def subscribe(self):
+        return self.call("subscribe")
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
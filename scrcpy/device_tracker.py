@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+import subprocess
+import threading
+import time
+from typing import Any, Callable
+
+from .adb_client import AdbClient, AdbClientError, parse_devices
+
+ONLINE = "device"
+DETACHED = "detached"
+TICK = 0.25  # how often a wait looks at its cancel event, or polls while the stream is down
+
+
+class DeviceEvent:
+    def __init__(self, serial: str, state: str, previous: str | None):
+        self.serial = serial
+        self.state = state
+        self.previous = previous
+
+    def __repr__(self):
+        return f"DeviceEvent({self.serial}, {self.previous} -> {self.state})"
+
+
+class DeviceTracker:
+    def __init__(self, client: AdbClient | None = None,
+                 poll: Callable[[], list[tuple[str, str, dict[str, str]]]] | None = None,
+                 retry: float = 0.5):
+        self.client = client
+        self.poll = poll
+        self.retry = retry
+        self.devices: dict[str, str] = {}
+        self.drops: dict[str, int] = {}
+        self.live = False
+        self.listeners: list[Callable[[DeviceEvent], None]] = []
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._close: Callable[[], None] | None = None
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(self._stop,), name="track-devices",
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+        if self._close:
+            self._close()
+
+    def _open(self) -> tuple[Callable[[], str], Callable[[], None]]:
+        if self.client is not None:
+            for request in ("host:track-devices-l", "host:track-devices"):
+                sock = self.client._open()
+                try:
+                    self.client._request(sock, request)
+                except AdbClientError:
+                    sock.close()
+                    continue
+                sock.settimeout(None)
+                return (lambda: self.client._read_block(sock)), sock.close
+            raise AdbClientError("adb server does not support track-devices")
+        proc = subprocess.Popen(["adb", "track-devices"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+        def read() -> str:
+            size = proc.stdout.read(4)
+            if len(size) < 4:
+                raise AdbClientError("adb track-devices exited")
+            return proc.stdout.read(int(size, 16)).decode("utf-8", "replace")
+        return read, proc.kill
+
+    def _run(self, stop: threading.Event):
+        while not stop.is_set():
+            try:
+                read, self._close = self._open()
+            except (AdbClientError, OSError):
+                stop.wait(self.retry)
+                continue
+            try:
+                while not stop.is_set():
+                    self._update(parse_devices(read()), live=True)
+            except (AdbClientError, OSError, ValueError):
+                pass
+            finally:
+                self._close()
+                with self._cond:
+                    self.live = False
+                    self._cond.notify_all()
+            # killed server: a respawned one is picked up on the next round
+            stop.wait(self.retry)
+
+    def _update(self, entries: list[tuple[str, str, dict[str, str]]], live: bool = False):
+        current = {serial: state for serial, state, _ in entries}
+        with self._cond:
+            previous = self.devices
+            events = [DeviceEvent(serial, state, previous.get(serial))
+                      for serial, state in current.items() if previous.get(serial) != state]
+            events += [DeviceEvent(serial, DETACHED, state) for serial, state in previous.items()
+                       if serial not in current]
+            for event in events:
+                if event.previous == ONLINE:
+                    self.drops[event.serial] = self.drops.get(event.serial, 0) + 1
+            self.devices = current
+            self.live = self.live or live
+            self._cond.notify_all()
+        for event in events:
+            for listener in self.listeners:
+                try:
+                    listener(event)
+                except Exception as e:
+                    print(f"Device listener failed: {e}")
+
+    def state(self, serial: str) -> str:
+        with self._cond:
+            return self.devices.get(serial, DETACHED)
+
+    def wait_for(self, predicate: Callable[[dict[str, str]], Any], timeout: float | None,
+                 cancelled: threading.Event | None = None) -> Any:
+        self.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if not self.live and self.poll:
+                try:
+                    self._update(self.poll())
+                except Exception:
+                    pass
+            with self._cond:
+                result = predicate(self.devices)
+                if result:
+                    return result
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if (remaining is not None and remaining <= 0) or (cancelled and cancelled.is_set()):
+                    return None
+                tick = TICK if cancelled or not self.live else None
+                waits = [t for t in (remaining, tick) if t is not None]
+                self._cond.wait(min(waits) if waits else None)
+
+    def wait_online(self, serial: str, timeout: float | None,
+                    cancelled: threading.Event | None = None) -> bool:
+        return bool(self.wait_for(lambda devices: devices.get(serial) == ONLINE, timeout, cancelled))
+
+    def wait_gone(self, serial: str, timeout: float | None) -> bool:
+        return bool(self.wait_for(lambda devices: devices.get(serial) != ONLINE, timeout))
+
+    def mark(self, serial: str) -> int:
+        with self._cond:
+            return self.drops.get(serial, 0)
+
+    def wait_restart(self, serial: str, mark: int, timeout: float, grace: float = 2.0) -> bool:
+        """After tcpip/usb or an adbd restart: wait for the drop that follows `mark`, then for the device."""
+        dropped = self.wait_for(lambda devices: self.drops.get(serial, 0) > mark, grace)
+        if not dropped and self.state(serial) == ONLINE:
+            # adbd did not restart, e.g. it already listened where we asked
+            return True
+        return self.wait_online(serial, max(0.0, timeout - (0 if dropped else grace)))
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import ipaddress
+import json
+import re
+import socket
+import struct
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+# adb wire protocol, see system/core/adb/protocol.txt
+A_CNXN = 0x4E584E43
+A_AUTH = 0x48545541
+A_STLS = 0x534C5453
+A_VERSION = 0x01000001
+MAX_PAYLOAD = 256 * 1024
+HEADER = struct.Struct("<6I")
+
+MAX_HOSTS = 1024  # larger networks are narrowed to the /24 around our own address
+NEGATIVE_TTL = 300  # seconds before a silent address is probed again
+
+
+def cnxn_packet() -> bytes:
+    payload = b"host::\0"
+    return HEADER.pack(A_CNXN, A_VERSION, MAX_PAYLOAD, len(payload), sum(payload),
+                       A_CNXN ^ 0xFFFFFFFF) + payload
+
+
+def is_adb_reply(header: bytes) -> bool:
+    if len(header) != HEADER.size:
+        return False
+    command, *_, magic = HEADER.unpack(header)
+    # CNXN when this host is already trusted, AUTH when it is not, STLS for wireless debugging
+    return command in (A_CNXN, A_AUTH, A_STLS) and magic == command ^ 0xFFFFFFFF
+
+
+def _narrow(interface: ipaddress.IPv4Interface) -> ipaddress.IPv4Network:
+    if interface.network.num_addresses > MAX_HOSTS:
+        return ipaddress.IPv4Interface(f"{interface.ip}/24").network
+    return interface.network
+
+
+def local_networks() -> list[ipaddress.IPv4Network]:
+    try:
+        out = subprocess.run(["ip", "-o", "-4", "addr", "show"], capture_output=True, text=True,
+                             timeout=2).stdout
+    except (OSError, subprocess.SubprocessError):
+        out = ""
+    networks = []
+    for cidr in re.findall(r"inet (\d+\.\d+\.\d+\.\d+/\d+)", out):
+        interface = ipaddress.IPv4Interface(cidr)
+        if interface.ip.is_loopback or interface.ip.is_link_local:
+            continue
+        network = _narrow(interface)
+        if network not in networks:
+            networks.append(network)
+    if not networks:
+        # no iproute2: the address of the default route, assumed to be a /24
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.connect(("192.0.2.1", 9))
+                networks.append(ipaddress.IPv4Interface(f"{sock.getsockname()[0]}/24").network)
+        except OSError:
+            pass
+    return networks
+
+
+def arp_table(path: Path = Path("/proc/net/arp")) -> dict[str, str]:
+    table = {}
+    try:
+        lines = path.read_text().splitlines()[1:]
+    except OSError:
+        return table
+    for line in lines:
+        fields = line.split()
+        # flags 0x0: the neighbour never answered
+        if len(fields) >= 4 and fields[2] != "0x0":
+            table[fields[0]] = fields[3]
+    return table
+
+
+class Discovery:
+    def __init__(self, port: int, path: Path | None = None, timeout: float = 0.5, concurrency: int = 256,
+                 networks: list[str] | None = None):
+        self.port = port
+        self.path = path
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.networks = [ipaddress.IPv4Network(n, strict=False) for n in networks or []]
+        self.entries: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not self.path or not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return
+        # a cache for another port says nothing about this one
+        if data.get("port") == self.port:
+            self.entries = data.get("hosts", {})
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = json.dumps({"port": self.port, "hosts": self.entries})
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(data)
+        tmp.replace(self.path)
+
+    def hosts(self) -> list[str]:
+        networks = self.networks or local_networks()
+        return [str(host) for network in networks for host in network.hosts()]
+
+    def pending(self, hosts: list[str], now: float | None = None) -> list[str]:
+        now = now or time.time()
+        arp = arp_table()
+        probe = []
+        for host in hosts:
+            entry = self.entries.get(host)
+            if (entry is None or entry["adb"] or arp.get(host) != entry.get("mac")
+                    or now - entry["time"] > NEGATIVE_TTL):
+                probe.append(host)
+        return probe
+
+    async def _probe(self, host: str, slots: asyncio.Semaphore, cancelled: threading.Event | None) -> bool:
+        async with slots:
+            if cancelled is not None and cancelled.is_set():
+                return False
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(host, self.port), self.timeout)
+            except (OSError, asyncio.TimeoutError):
+                return False
+            try:
+                writer.write(cnxn_packet())
+                await writer.drain()
+                header = await asyncio.wait_for(reader.readexactly(HEADER.size), self.timeout)
+                return is_adb_reply(header)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                return False
+            finally:
+                writer.close()
+
+    async def _scan(self, hosts: list[str], cancelled: threading.Event | None) -> list[bool]:
+        slots = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*(self._probe(host, slots, cancelled) for host in hosts))
+
+    def scan(self, extra: list[str] | None = None, cancelled: threading.Event | None = None) -> list[str]:
+        """Probe the subnet(s) for adbd on `port`; returns "ip:port" endpoints, `extra` hosts first."""
+        extra = [host for host in extra or [] if host]
+        hosts = list(dict.fromkeys(extra + self.hosts()))
+        # addresses we know a phone at are always probed, the rest only when they may have changed
+        probe = list(dict.fromkeys(extra + self.pending(hosts)))
+        results = asyncio.run(self._scan(probe, cancelled)) if probe else []
+        if cancelled is not None and cancelled.is_set():
+            return []
+        now, arp = time.time(), arp_table()
+        with self._lock:
+            for host, found in zip(probe, results):
+                self.entries[host] = {"adb": found, "mac": arp.get(host), "time": now}
+        self.save()
+        with self._lock:
+            return [f"{host}:{self.port}" for host in hosts if self.entries.get(host, {}).get("adb")]
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import json
+import re
+import threading
+from pathlib import Path
+
+CODEC_MIME = {
+    "h264": "video/avc",
+    "h265": "video/hevc",
+    "av1": "video/av01",
+}
+
+SOFTWARE_PREFIXES = ("OMX.google.", "c2.android.")
+
+MEDIA_CODECS_CMD = ("cat /vendor/etc/media_codecs*.xml /odm/etc/media_codecs*.xml "
+                    "/system/etc/media_codecs*.xml 2>/dev/null; true")
+
+ENCODERS_SECTION = re.compile(r"<Encoders>(.*?)</Encoders>", re.S)
+CODEC_BLOCK = re.compile(r"<MediaCodec\s+([^>]*?)(?:/>|>(.*?)</MediaCodec>)", re.S)
+ATTR = re.compile(r'(\w+)="([^"]*)"')
+TYPE_BLOCK = re.compile(r'<Type\s+name="([^"]+)"')
+CONCURRENT = re.compile(r'<Limit\s+name="concurrent-instances"\s+max="(\d+)"')
+
+
+def is_hardware(name: str) -> bool:
+    return not name.startswith(SOFTWARE_PREFIXES)
+
+
+def parse_session_limits(xml: str) -> dict[str, int]:
+    limits: dict[str, int] = {}
+    for section in ENCODERS_SECTION.findall(xml):
+        for attrs, body in CODEC_BLOCK.findall(section):
+            attrs = dict(ATTR.findall(attrs))
+            if not is_hardware(attrs.get("name", "")):
+                continue
+            m = CONCURRENT.search(body or "")
+            if not m:
+                continue
+            types = [attrs["type"]] if "type" in attrs else TYPE_BLOCK.findall(body)
+            for mime in types:
+                limits[mime] = max(limits.get(mime, 0), int(m.group(1)))
+    return limits
+
+# scrcpy --list-encoders, e.g.
+#     --video-codec=h264 --video-encoder=c2.qti.avc.encoder      (hw) [vendor]
+#     --video-codec=h264 --video-encoder=OMX.google.h264.encoder (sw) (alias for c2.android.avc.encoder)
+LIST_ENCODERS_LINE = re.compile(r"--(?P<kind>video|audio)-codec=(?P<codec>\S+)\s+--(?:video|audio)-encoder="
+                                r"(?:'(?P<quoted>[^']+)'|(?P<name>\S+))(?P<flags>.*)")
+VIDEO_FALLBACK = ("h264", "h265", "av1")
+AUDIO_FALLBACK = ("opus", "aac", "flac")
+
+
+def parse_list_encoders(output: str) -> dict[str, list[dict]]:
+    encoders: dict[str, list[dict]] = {"video": [], "audio": []}
+    for line in output.splitlines():
+        m = LIST_ENCODERS_LINE.search(line)
+        if not m or "alias for" in m.group("flags"):
+            continue
+        name = m.group("quoted") or m.group("name")
+        flags = m.group("flags")
+        # scrcpy < 2.2 prints no (hw)/(sw), the name prefix tells Google's software codecs apart
+        hardware = "(hw)" in flags if "(hw)" in flags or "(sw)" in flags else is_hardware(name)
+        encoders[m.group("kind")].append({"codec": m.group("codec"), "name": name, "hardware": hardware,
+                                          "vendor": "[vendor]" in flags})
+    return encoders
+
+
+def choose_encoder(encoders: list[dict], codec: str, fallback: tuple[str, ...]) -> tuple[str, str] | None:
+    """(codec, encoder) for `codec`, hardware first, or for the first fallback the device can encode at all."""
+    # vendor codecs are the SoC's own, the device lists the rest in its order of preference
+    ranked = sorted(encoders, key=lambda e: (not e["hardware"], not e["vendor"]))
+    # a software encoder of the configured codec beats switching codecs, opus stays opus
+    for candidate in dict.fromkeys((codec, *fallback)):
+        for encoder in ranked:
+            if encoder["codec"] == candidate:
+                return candidate, encoder["name"]
+    return None
+
+
+class EncoderCache:
+    def __init__(self, path: Path | None = None):
+        self.path = path
+        self.entries: dict[str, dict[str, list[dict]]] = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not self.path or not self.path.exists():
+            return
+        try:
+            self.entries = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = json.dumps(self.entries)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(data)
+        tmp.replace(self.path)
+
+    def get(self, fingerprint: str) -> dict[str, list[dict]] | None:
+        with self._lock:
+            return self.entries.get(fingerprint)
+
+    def put(self, fingerprint: str, encoders: dict[str, list[dict]]):
+        # the encoders only change with the build, so the fingerprint is the whole key
+        with self._lock:
+            self.entries[fingerprint] = encoders
+        self.save()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import re
+import threading
+
+from .supervisor import Window
+
+
+class Device:
+    def __init__(self, name: str, serial: str, socket: str = ''):
+        self.name = name
+        self.serial = serial
+        self.socket = socket
+        self.connected = True
+        self.windows: dict[str, Window] = {}
+        self.tab: str | None = None
+
+    def key(self, alias: str) -> str:
+        return f"{self.name}/{alias}"
+
+    def __repr__(self):
+        return f"Device({self.name}, serial={self.serial}, socket={self.socket})"
+
+
+class Fleet:
+    def __init__(self):
+        self.devices: dict[str, Device] = {}
+        self.lock = threading.RLock()
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.devices.values()))
+
+    def __len__(self):
+        return len(self.devices)
+
+    def get(self, name: str) -> Device | None:
+        with self.lock:
+            for dev in self.devices.values():
+                if name.lower() in (dev.name.lower(), dev.serial.lower(), dev.socket.lower()):
+                    return dev
+        return None
+
+    def live(self) -> list[Device]:
+        return [dev for dev in self if dev.connected]
+
+    def add(self, serial: str, socket: str, props: dict[str, str]) -> Device:
+        base = re.sub(r"[^\w.-]+", "_", props.get("ro.product.model", "") or serial).strip("_") or serial
+        with self.lock:
+            name, n = base, 2
+            while name in self.devices and self.devices[name].serial != serial:
+                name, n = f"{base}-{n}", n + 1
+            dev = self.devices.get(name)
+            if dev is None:
+                dev = self.devices[name] = Device(name, serial, socket)
+            else:
+                dev.serial, dev.socket, dev.connected = serial, socket, True
+            return dev
+
+    def remove(self, dev: Device):
+        with self.lock:
+            self.devices.pop(dev.name, None)
+
+    def window_map(self) -> dict[str, tuple[Device, str]]:
+        entries = {}
+        devices = list(self)
+        for dev in devices:
+            for alias in dev.windows:
+                entries[dev.key(alias).lower()] = (dev, alias)
+        return entries
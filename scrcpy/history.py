@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+import json
+import sqlite3
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    serialno TEXT PRIMARY KEY,
+    name TEXT,
+    last_ip TEXT,
+    last_seen REAL
+);
+CREATE TABLE IF NOT EXISTS endpoints (
+    socket TEXT PRIMARY KEY,
+    serialno TEXT,
+    transport TEXT NOT NULL,
+    successes INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    last_success REAL,
+    last_failure REAL
+);
+CREATE TABLE IF NOT EXISTS latencies (
+    socket TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    time REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS latencies_socket ON latencies (socket, time);
+CREATE TABLE IF NOT EXISTS tunings (
+    serialno TEXT PRIMARY KEY,
+    settings TEXT NOT NULL,
+    trials TEXT NOT NULL,
+    time REAL NOT NULL
+);
+"""
+
+SAMPLES = 20
+UNKNOWN_LATENCY = 2.0  # an endpoint never connected to ranks behind any measured one
+
+
+def transport(socket: str) -> str:
+    return "tcp" if ":" in socket else "usb"
+
+
+class ConnectionHistory:
+    def __init__(self, path: Path, timeout: float = 5.0):
+        self.path = Path(path)
+        self.timeout = timeout
+        self._dbs: dict[threading.Thread, sqlite3.Connection] = {}
+        self._lock = threading.Lock()
+        self._db().executescript(SCHEMA)
+
+    def _db(self) -> sqlite3.Connection:
+        # one connection per thread, sqlite connections are not shared
+        thread = threading.current_thread()
+        with self._lock:
+            db = self._dbs.get(thread)
+            if db is not None:
+                return db
+            # a thread that is gone leaves its connection behind
+            for gone in [t for t in self._dbs if not t.is_alive()]:
+                self._dbs.pop(gone).close()
+        # only close() touches it from another thread
+        db = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+        # WAL lets other managers read while one of them records an attempt
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        with self._lock:
+            self._dbs[thread] = db
+        return db
+
+    @contextmanager
+    def _write(self):
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+            db.execute("COMMIT")
+        except BaseException:
+            # a failed COMMIT (busy, disk full) leaves the transaction open on this thread's connection
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        with self._lock:
+            dbs, self._dbs = list(self._dbs.values()), {}
+        for db in dbs:
+            db.close()
+
+    def attempt(self, socket: str, ok: bool, seconds: float | None = None):
+        now = time.time()
+        column = "successes" if ok else "failures"
+        stamp = "last_success" if ok else "last_failure"
+        with self._write() as db:
+            db.execute("INSERT OR IGNORE INTO endpoints (socket, transport) VALUES (?, ?)",
+                       (socket, transport(socket)))
+            db.execute(f"UPDATE endpoints SET {column} = {column} + 1, {stamp} = ? WHERE socket = ?",
+                       (now, socket))
+            if ok and seconds is not None:
+                db.execute("INSERT INTO latencies (socket, seconds, time) VALUES (?, ?, ?)",
+                           (socket, seconds, now))
+                db.execute("DELETE FROM latencies WHERE socket = ? AND rowid NOT IN "
+                           "(SELECT rowid FROM latencies WHERE socket = ? ORDER BY time DESC LIMIT ?)",
+                           (socket, socket, SAMPLES))
+
+    def seen(self, serialno: str, socket: str, name: str | None = None):
+        now = time.time()
+        ip = socket.rsplit(":", 1)[0] if transport(socket) == "tcp" else None
+        with self._write() as db:
+            db.execute("INSERT OR IGNORE INTO endpoints (socket, transport) VALUES (?, ?)",
+                       (socket, transport(socket)))
+            db.execute("UPDATE endpoints SET serialno = ? WHERE socket = ?", (serialno, socket))
+            db.execute("INSERT INTO devices (serialno, name, last_ip, last_seen) VALUES (?, ?, ?, ?) "
+                       "ON CONFLICT (serialno) DO UPDATE SET name = COALESCE(excluded.name, name), "
+                       "last_ip = COALESCE(excluded.last_ip, last_ip), last_seen = excluded.last_seen",
+                       (serialno, name, ip, now))
+
+    def endpoints(self, kind: str | None = "tcp") -> list[dict]:
+        db = self._db()
+        rows = db.execute("SELECT socket, serialno, transport, successes, failures, last_success "
+                          "FROM endpoints" + (" WHERE transport = ?" if kind else ""),
+                          (kind,) if kind else ()).fetchall()
+        samples: dict[str, list[float]] = {}
+        for socket, seconds in db.execute("SELECT socket, seconds FROM latencies"):
+            samples.setdefault(socket, []).append(seconds)
+        entries = []
+        for socket, serialno, kind_, successes, failures, last_success in rows:
+            latency = statistics.median(samples[socket]) if socket in samples else None
+            entries.append({"socket": socket, "serialno": serialno, "transport": kind_,
+                            "successes": successes, "failures": failures,
+                            "last_success": last_success, "latency": latency})
+        return entries
+
+    @staticmethod
+    def score(entry: dict) -> float:
+        # expected time to a working connection: latency over the smoothed success rate
+        reliability = (entry["successes"] + 1) / (entry["successes"] + entry["failures"] + 2)
+        latency = entry["latency"] if entry["latency"] is not None else UNKNOWN_LATENCY
+        return latency / reliability
+
+    def ranked(self, kind: str | None = "tcp") -> list[dict]:
+        return sorted(self.endpoints(kind), key=lambda e: (self.score(e), -(e["last_success"] or 0)))
+
+    def best_per_device(self, kind: str | None = "tcp") -> list[dict]:
+        best, seen = [], set()
+        for entry in self.ranked(kind):
+            key = entry["serialno"] or entry["socket"]
+            if key not in seen:
+                seen.add(key)
+                best.append(entry)
+        return best
+
+    def devices(self) -> list[dict]:
+        rows = self._db().execute("SELECT serialno, name, last_ip, last_seen FROM devices "
+                                  "ORDER BY last_seen DESC").fetchall()
+        return [dict(zip(("serialno", "name", "last_ip", "last_seen"), row)) for row in rows]
+
+    def tune(self, serialno: str, settings: dict[str, str], trials: list[dict]):
+        with self._write() as db:
+            db.execute("INSERT OR REPLACE INTO tunings (serialno, settings, trials, time) VALUES (?, ?, ?, ?)",
+                       (serialno, json.dumps(settings), json.dumps(trials), time.time()))
+
+    def tuning(self, serialno: str) -> dict[str, str] | None:
+        row = self._db().execute("SELECT settings FROM tunings WHERE serialno = ?", (serialno,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def empty(self) -> bool:
+        return self._db().execute("SELECT 1 FROM endpoints LIMIT 1").fetchone() is None
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+import signal
+import threading
+from pathlib import Path
+
+
+def popen_kwargs() -> dict:
+    # own session and process group: signals reach scrcpy and everything it forks, and the
+    # terminal's Ctrl+C goes to the manager only
+    return {"start_new_session": True}
+
+
+def signal_group(pid: int, sig: int) -> bool:
+    try:
+        os.killpg(pid, sig)
+        return True
+    except (ProcessLookupError, PermissionError):
+        return False
+
+
+def signal_leftovers(pid: int, sig: int) -> bool:
+    """Signal what a reaped group leader left behind, unless `pid` went to another process since."""
+    # a group's id stays allocated while it has members, a live `pid` is someone else's group
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return signal_group(pid, sig)
+    except PermissionError:
+        pass
+    return False
+
+
+async def terminate(procs: list[asyncio.subprocess.Process], timeout: float = 5):
+    procs = [proc for proc in procs if proc.returncode is None]
+    if not procs:
+        return
+    for proc in procs:
+        signal_group(proc.pid, signal.SIGTERM)
+    waits = [asyncio.ensure_future(proc.wait()) for proc in procs]
+    _, pending = await asyncio.wait(waits, timeout=timeout)
+    if pending:
+        for proc in procs:
+            if proc.returncode is None:
+                signal_group(proc.pid, signal.SIGKILL)
+        await asyncio.wait(pending)
+
+
+def parse_cpus(value) -> set[int]:
+    if isinstance(value, int):
+        return {value}
+    if isinstance(value, (list, tuple, set)):
+        return {int(v) for v in value}
+    cpus = set()
+    for part in str(value).split(","):
+        part = part.strip()
+        if "-" in part:
+            lo, hi = part.split("-", 1)
+            cpus.update(range(int(lo), int(hi) + 1))
+        elif part:
+            cpus.add(int(part))
+    return cpus
+
+
+def parse_cpu_max(value, period: int = 100000) -> str:
+    value = str(value).strip()
+    if value.endswith("%"):
+        return f"{int(float(value[:-1]) * period / 100)} {period}"
+    return value
+
+
+class Resources:
+    def __init__(self, cpus: set[int] | None = None, nice: int | None = None,
+                 cpu_max: str | None = None, memory_max: str | None = None, cgroup: Path | None = None):
+        self.cpus = cpus
+        self.nice = nice
+        self.cpu_max = cpu_max
+        self.memory_max = memory_max
+        self.cgroup = cgroup
+
+    @classmethod
+    def from_config(cls, config, cgroup: Path | None = None, cpus: set[int] | None = None) -> "Resources":
+        limited = config.cpu_max is not False or config.memory_max is not False
+        return cls(cpus=parse_cpus(config.cpus) if config.cpus is not False else cpus,
+                   nice=int(config.nice) if config.nice is not False else None,
+                   cpu_max=parse_cpu_max(config.cpu_max) if config.cpu_max is not False else None,
+                   memory_max=str(config.memory_max) if config.memory_max is not False else None,
+                   cgroup=cgroup if limited else None)
+
+    def apply(self, pid: int):
+        if not self.cpus and self.nice is None:
+            return
+        # from the parent, a preexec_fn could deadlock the fork of this threaded process;
+        # affinity and nice are per thread, so every thread scrcpy has started so far gets them
+        try:
+            tids = [int(tid) for tid in os.listdir(f"/proc/{pid}/task")]
+        except OSError:
+            tids = [pid]
+        for tid in tids:
+            # unavailable cpus or no permission to lower nice: run anyway
+            if self.cpus:
+                try:
+                    os.sched_setaffinity(tid, self.cpus)
+                except OSError:
+                    pass
+            if self.nice is not None:
+                try:
+                    os.setpriority(os.PRIO_PROCESS, tid, self.nice)
+                except OSError:
+                    pass
+
+    def attach(self, pid: int):
+        self.apply(pid)
+        if self.cgroup is None:
+            return
+        try:
+            self.cgroup.mkdir(parents=False, exist_ok=True)
+            if self.cpu_max:
+                (self.cgroup / "cpu.max").write_text(self.cpu_max)
+            if self.memory_max:
+                (self.cgroup / "memory.max").write_text(self.memory_max)
+            (self.cgroup / "cgroup.procs").write_text(str(pid))
+        except OSError as e:
+            print(f"Could not apply cgroup limits in {self.cgroup}: {e}")
+
+    def release(self):
+        if self.cgroup is None:
+            return
+        try:
+            self.cgroup.rmdir()
+        except OSError:
+            pass  # still populated or never created
+
+
+class CpuBalancer:
+    def __init__(self, cpus: set[int] | None = None):
+        self.cpus = sorted(cpus or os.sched_getaffinity(0))
+        self.assigned: dict[str, set[int]] = {}
+        self._lock = threading.Lock()
+
+    def _least_loaded(self, width: int) -> set[int]:
+        load = {cpu: 0 for cpu in self.cpus}
+        for cpus in self.assigned.values():
+            for cpu in cpus:
+                load[cpu] = load.get(cpu, 0) + 1
+        return set(sorted(self.cpus, key=lambda cpu: (load[cpu], cpu))[:width])
+
+    def plan(self, keys: list[str]):
+        with self._lock:
+            for key in keys:
+                self.assigned.pop(key, None)
+            width = max(1, len(self.cpus) // max(1, len(self.assigned) + len(keys)))
+            for key in keys:
+                self.assigned[key] = self._least_loaded(width)
+
+    def get(self, key: str) -> set[int]:
+        with self._lock:
+            if key not in self.assigned:
+                self.assigned[key] = self._least_loaded(max(1, len(self.cpus) // (len(self.assigned) + 1)))
+            return self.assigned[key]
+
+    def release(self, key: str):
+        with self._lock:
+            self.assigned.pop(key, None)
@@ -13,10 +13,44 @@ if TYPE_CHECKING:
 class ScrcpyOptions:
     def __init__(self, config: ScrcpyConfig):
         self.config = config
-        self.options = self.generate_args()
+        self.options = self._compile(None)
+        self.profiles: dict[str, List[str]] = {}
 
+    def reload(self, config: ScrcpyConfig):
+        self.config = config
+        self.options = self._compile(None)
+        self.profiles = {}
+
+    def _compile(self, name: str | None) -> List[str]:
+        cache = getattr(self.config, "cache", None)
+        args = cache.args(name) if cache else None
+        if args is None:
+            args = self.generate_args(self.config.profile(name) if name else None)
+            if cache:
+                cache.put_args(name, args)
+        return args
+
+    def for_profile(self, name: str | None) -> List[str]:
+        if not name:
+            return self.options
+        # compiled once per config, windows switching back and forth reuse it
+        if name not in self.profiles:
+            self.profiles[name] = self._compile(name)
+        return self.profiles[name]
+
+
+    @staticmethod
+    def override(args: List[str], overrides: dict[str, str]) -> List[str]:
+        args = list(args)
+        for flag, value in overrides.items():
+            if flag in args:
+                args[args.index(flag) + 1] = value
+            else:
+                args.extend([flag, value])
+        return args
 
-    def generate_args(self) -> List[str]:
+    def generate_args(self, config: ScrcpyConfig | None = None) -> List[str]:
+        config = config or self.config
         args = []
 
         def append(flag, value=None):
@@ -28,57 +62,57 @@ class ScrcpyOptions:
                 args.extend([flag, str(value)])
 
         # Device
-        append("--stay-awake", self.config.Device.stay_awake)
-        append("--turn-screen-off", self.config.Device.turn_screen_off)
-        append("--show-touches", self.config.Device.show_touches)
-        append("--power-off-on-close", self.config.Device.power_off_on_close)
-        append("--no-power-on", self.config.Device.power_on_on_start)
+        append("--stay-awake", config.Device.stay_awake)
+        append("--turn-screen-off", config.Device.turn_screen_off)
+        append("--show-touches", config.Device.show_touches)
+        append("--power-off-on-close", config.Device.power_off_on_close)
+        append("--no-power-on", config.Device.power_on_on_start)
 
         # Window
-        append("--window-title", self.config.Window.title)
-        append("--window-borderless", self.config.Window.borderless)
-        append("--always-on-top", self.config.Window.always_on_top)
-        append("--fullscreen", self.config.Window.fullscreen)
-        append("--disable-screensaver", self.config.Window.disable_screensaver)
-        append("--window-height", self.config.Window.height)
-        append("--window-width", self.config.Window.width)
+        append("--window-title", config.Window.title)
+        append("--window-borderless", config.Window.borderless)
+        append("--always-on-top", config.Window.always_on_top)
+        append("--fullscreen", config.Window.fullscreen)
+        append("--disable-screensaver", config.Window.disable_screensaver)
+        append("--window-height", config.Window.height)
+        append("--window-width", config.Window.width)
 
         # Video
-        append("--max-size", self.config.Video.max_size)
-        append("--video-bit-rate", self.config.Video.bitrate)
-        append("--max-fps", self.config.Video.fps)
-        append("--print-fps", self.config.Video.print_fps)
-        append("--video-codec", self.config.Video.codec)
-        append("--video-encoder", self.config.Video.encoder)
-        append("--lock-video-orientation", self.config.Video.lock_orientation)
-        append("--orientation", self.config.Video.orientation)
-        append("--crop", self.config.Video.crop)
-        append("--display-id", self.config.Video.display_id)
-        append("--display-buffer", self.config.Video.display_buffer)
-        append("--v4l2-buffer", self.config.Video.v4l2_buffer)
-        append("--no-playback", self.config.Video.no_playback)
-        append("--no-video", self.config.Video.no_video)
+        append("--max-size", config.Video.max_size)
+        append("--video-bit-rate", config.Video.bitrate)
+        append("--max-fps", config.Video.fps)
+        append("--print-fps", config.Video.print_fps)
+        append("--video-codec", config.Video.codec)
+        append("--video-encoder", config.Video.encoder)
+        append("--lock-video-orientation", config.Video.lock_orientation)
+        append("--orientation", config.Video.orientation)
+        append("--crop", config.Video.crop)
+        append("--display-id", config.Video.display_id)
+        append("--display-buffer", config.Video.display_buffer)
+        append("--v4l2-buffer", config.Video.v4l2_buffer)
+        append("--no-playback", config.Video.no_playback)
+        append("--no-video", config.Video.no_video)
 
         # Audio
-        if self.config.Audio.no_audio:
-            append("--no-audio", self.config.Audio.no_audio)
-        if not self.config.Audio.no_audio:
-            append("--audio-source", self.config.Audio.source)
-            append("--audio-codec", self.config.Audio.codec)
-            append("--audio-encoder", self.config.Audio.encoder)
-            append("--audio-bit-rate", self.config.Audio.bitrate)
-            append("--audio-buffer", self.config.Audio.buffer)
-            append("--no-audio-playback", self.config.Audio.no_playback)
+        if config.Audio.no_audio:
+            append("--no-audio", config.Audio.no_audio)
+        if not config.Audio.no_audio:
+            append("--audio-source", config.Audio.source)
+            append("--audio-codec", config.Audio.codec)
+            append("--audio-encoder", config.Audio.encoder)
+            append("--audio-bit-rate", config.Audio.bitrate)
+            append("--audio-buffer", config.Audio.buffer)
+            append("--no-audio-playback", config.Audio.no_playback)
 
         # Camera
-        if self.config.Camera.as_video_output:
-            append("--video-source", self.config.Camera.video_output)
-            append("--camera-size", self.config.Camera.size)
-            append("--camera-fps", self.config.Camera.fps)
-            append("--v4l2-sink", self.config.Camera.v4l2_sink)
+        if config.Camera.as_video_output:
+            append("--video-source", config.Camera.video_output)
+            append("--camera-size", config.Camera.size)
+            append("--camera-fps", config.Camera.fps)
+            append("--v4l2-sink", config.Camera.v4l2_sink)
 
         # Mouse
-        append("--no-mouse-hover", self.config.Mouse.no_mouse_hover)
+        append("--no-mouse-hover", config.Mouse.no_mouse_hover)
 
         return args
 
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import json
+import re
+import threading
+import time
+from pathlib import Path
+
+PROP_LINE = re.compile(r"^\[([^\]]+)\]: \[(.*)\]$")
+FINGERPRINT = "ro.build.fingerprint"
+SERIALNO = "ro.serialno"
+IDENTITY_CMD = f"getprop {FINGERPRINT}; getprop {SERIALNO}"
+
+LAST_DEVICE_PROPS = {
+    'Manufacturer': 'ro.product.manufacturer',
+    'Android Version': 'ro.build.version.release',
+    'SDK Version': 'ro.build.version.sdk',
+    'Product Name': 'ro.product.name',
+    'Model': 'ro.product.model',
+}
+
+
+def parse_getprop(output: str) -> dict[str, str]:
+    props = {}
+    for line in output.splitlines():
+        m = PROP_LINE.match(line.strip())
+        if m:
+            props[m.group(1)] = m.group(2)
+    return props
+
+
+def same_device(props: dict[str, str], identity: str) -> bool:
+    """Whether IDENTITY_CMD's output belongs to the device `props` were read from."""
+    lines = [line.strip() for line in identity.splitlines()]
+    return lines[:2] == [props.get(FINGERPRINT, ""), props.get(SERIALNO, "")]
+
+
+class PropertyCache:
+    def __init__(self, path: Path | None = None, ttl: float = 24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self.entries: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def _key(serial: str, fingerprint: str) -> str:
+        return f"{serial}|{fingerprint}"
+
+    def load(self):
+        if not self.path or not self.path.exists():
+            return
+        try:
+            self.entries = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            self.entries = {}
+        self.evict()
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = json.dumps(self.entries)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(data)
+        tmp.replace(self.path)
+
+    def evict(self):
+        now = time.time()
+        with self._lock:
+            for key in [k for k, e in self.entries.items() if now - e["time"] > self.ttl]:
+                del self.entries[key]
+
+    def get(self, serial: str, fingerprint: str | None = None) -> dict[str, str] | None:
+        self.evict()
+        with self._lock:
+            if fingerprint is not None:
+                entry = self.entries.get(self._key(serial, fingerprint))
+            else:
+                matches = [e for e in self.entries.values() if e["serial"] == serial]
+                entry = max(matches, key=lambda e: e["time"], default=None)
+        return entry["props"] if entry else None
+
+    def put(self, serial: str, props: dict[str, str]):
+        fingerprint = props.get(FINGERPRINT, "")
+        with self._lock:
+            # a new fingerprint on the same serial means an OTA or a different phone behind that address
+            for key in [k for k, e in self.entries.items() if e["serial"] == serial]:
+                del self.entries[key]
+            self.entries[self._key(serial, fingerprint)] = {
+                "serial": serial, "fingerprint": fingerprint, "time": time.time(), "props": props}
+        self.save()
+
+    def invalidate(self, serial: str):
+        with self._lock:
+            for key in [k for k, e in self.entries.items() if e["serial"] == serial]:
+                del self.entries[key]
+        self.save()
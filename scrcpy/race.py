@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import contextvars
+import queue
+import threading
+import time
+from typing import Any, Callable
+
+STAGGER = 0.25
+
+
+class Attempt:
+    def __init__(self, name: str, run: Callable[[threading.Event], Any],
+                 undo: Callable[[Any, Any], None] | None = None):
+        self.name = name
+        self.run = run
+        self.undo = undo
+        self.error: Exception | None = None
+
+    def __repr__(self):
+        return f"Attempt({self.name})"
+
+
+def race(attempts: list[Attempt], stagger: float = STAGGER,
+         timeout: float | None = None) -> tuple[Attempt, Any] | None:
+    """Happy eyeballs: start attempts `stagger` apart (sooner when one fails), first result wins."""
+    cancelled = threading.Event()
+    results: queue.Queue = queue.Queue()
+    lock = threading.Lock()
+    winner: list = []
+
+    def worker(attempt: Attempt):
+        try:
+            result = attempt.run(cancelled)
+        except Exception as e:
+            attempt.error, result = e, None
+        with lock:
+            late = result is not None and bool(winner)
+            if result is not None and not late:
+                winner.append((attempt, result))
+                cancelled.set()
+        if late:
+            # blocking adb calls cannot be interrupted, so a loser that got through is rolled back
+            if attempt.undo:
+                try:
+                    attempt.undo(result, winner[0][1])
+                except Exception:
+                    pass
+            return
+        results.put((attempt, result))
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    waiting, running = list(attempts), 0
+    next_start = time.monotonic()
+    while waiting or running:
+        now = time.monotonic()
+        if waiting and now >= next_start:
+            # attempts run in the caller's context, e.g. under its trace span
+            threading.Thread(target=contextvars.copy_context().run, args=(worker, waiting.pop(0)),
+                             name="race", daemon=True).start()
+            running += 1
+            next_start = now + stagger
+            continue
+        waits = [t - now for t in (next_start if waiting else None, deadline) if t is not None]
+        try:
+            attempt, result = results.get(timeout=max(0.0, min(waits)) if waits else None)
+        except queue.Empty:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            continue
+        running -= 1
+        if result is not None:
+            return attempt, result
+        # a failed path hands its turn to the next one straight away
+        next_start = time.monotonic()
+    cancelled.set()
+    return None
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from .launcher import Resources
+from .supervisor import Supervisor
+
+
+class LaunchRequest:
+    def __init__(self, key: str, argv: list[str], group: str, priority: int = 100,
+                 resources: Resources | None = None):
+        self.key = key
+        self.argv = argv
+        self.group = group
+        self.priority = priority
+        self.resources = resources
+
+    def __repr__(self):
+        return f"LaunchRequest({self.key}, priority={self.priority})"
+
+
+class LaunchScheduler:
+    def __init__(self, supervisor: Supervisor, timeout: float = 15):
+        self.supervisor = supervisor
+        self.timeout = timeout
+        self.caps: dict[str, int] = {}
+        self._slots: dict[str, asyncio.Semaphore] = {}
+
+    def set_cap(self, group: str, cap: int):
+        cap = max(1, int(cap))
+        if self.caps.get(group) != cap:
+            self.caps[group] = cap
+            self._slots.pop(group, None)
+
+    def _slot(self, group: str) -> asyncio.Semaphore:
+        if group not in self._slots:
+            self._slots[group] = asyncio.Semaphore(self.caps.get(group, 1))
+        return self._slots[group]
+
+    async def _admit(self, request: LaunchRequest) -> bool:
+        # a slot frees up once the window is streaming or has failed, not when the process spawns
+        async with self._slot(request.group):
+            return await self.supervisor._launch(request.key, request.argv, self.timeout, request.resources)
+
+    async def _launch(self, requests: list[LaunchRequest]) -> dict[str, bool]:
+        # semaphore waiters are served FIFO, so creation order is admission order per group
+        ordered = sorted(requests, key=lambda r: r.priority)
+        tasks = [asyncio.ensure_future(self._admit(request)) for request in ordered]
+        results = await asyncio.gather(*tasks)
+        return {request.key: ok for request, ok in zip(ordered, results)}
+
+    def launch(self, requests: list[LaunchRequest]) -> dict[str, bool]:
+        return self.supervisor.call(self._launch(requests))
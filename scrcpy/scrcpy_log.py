@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import re
+import time
+from collections import deque
+from enum import Enum
+
+
+class LaunchFailure(Enum):
+    ENCODER = "encoder failure"
+    DISPLAY = "display creation failure"
+    APP_NOT_FOUND = "app not found"
+    DEVICE = "device not found"
+    CONNECTION = "connection failure"
+    OTHER = "error"
+
+
+DEVICE_LINE = re.compile(r"Device: \[(?P<manufacturer>[^\]]*)\] (?P<model>.+)")
+RENDERER_LINE = re.compile(r"Renderer: (?P<renderer>\S+)")
+TEXTURE_LINE = re.compile(r"Texture: (?P<width>\d+)x(?P<height>\d+)")
+DISPLAY_LINE = re.compile(r"New display: .*\(id=(?P<id>\d+)\)")
+FPS_LINE = re.compile(r"INFO: (?P<fps>\d+) fps")
+ERROR_LINE = re.compile(r"\b(ERROR|FATAL)\b")
+
+FAILURES = [
+    (LaunchFailure.ENCODER, re.compile(r"encod", re.I)),
+    (LaunchFailure.DISPLAY, re.compile(r"(virtual )?display", re.I)),
+    (LaunchFailure.APP_NOT_FOUND, re.compile(r"(no|not) (unique )?app|app .*not found", re.I)),
+    (LaunchFailure.DEVICE, re.compile(r"(could not find|no) .*device|device .*(not found|disconnected)", re.I)),
+    (LaunchFailure.CONNECTION, re.compile(r"connect|server|socket|tunnel", re.I)),
+]
+
+
+def classify(line: str) -> LaunchFailure:
+    message = ERROR_LINE.split(line, 1)[-1]  # drop the "[server]" prefix
+    for failure, pattern in FAILURES:
+        if pattern.search(message):
+            return failure
+    return LaunchFailure.OTHER
+
+
+class ScrcpyLog:
+    def __init__(self, expect_frames: bool = True, keep: int = 50):
+        self.expect_frames = expect_frames
+        self.lines: deque[str] = deque(maxlen=keep)
+        self.device = ''
+        self.renderer = ''
+        self.texture = ''
+        self.display_id: int | None = None
+        self.fps: int | None = None
+        self.fps_at = 0.0
+        self.failure: LaunchFailure | None = None
+        self.failure_line = ''
+        self.ready = False
+
+    @classmethod
+    def for_args(cls, argv: list[str]) -> "ScrcpyLog":
+        return cls(expect_frames=not {"--no-playback", "--no-video", "--no-window"} & set(argv))
+
+    def feed(self, line: str) -> str | None:
+        line = line.rstrip()
+        if not line:
+            return None
+        self.lines.append(line)
+        if m := FPS_LINE.search(line):
+            self.fps = int(m.group("fps"))
+            self.fps_at = time.monotonic()
+            return "fps"
+        if m := DEVICE_LINE.search(line):
+            self.device = f"{m.group('manufacturer')} {m.group('model')}".strip()
+        elif m := RENDERER_LINE.search(line):
+            self.renderer = m.group("renderer")
+        elif m := TEXTURE_LINE.search(line):
+            self.texture = f"{m.group('width')}x{m.group('height')}"
+        elif m := DISPLAY_LINE.search(line):
+            self.display_id = int(m.group("id"))
+        elif ERROR_LINE.search(line):
+            if self.failure is None:
+                self.failure = classify(line)
+                self.failure_line = line
+            return "error"
+
+        if not self.ready and self.device and (self.texture or not self.expect_frames):
+            self.ready = True
+            return "ready"
+        return None
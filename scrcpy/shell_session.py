@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+import itertools
+import os
+import queue
+import re
+import select
+import struct
+import subprocess
+import threading
+from concurrent.futures import Future
+
+from .adb_client import AdbClient, AdbClientError, SHELL_EXIT, SHELL_STDERR, SHELL_STDOUT
+
+SHELL_STDIN = 0
+MARKER = "__SCRCPY_MGR_DONE_"
+
+
+class ShellSessionError(Exception):
+    pass
+
+
+class ShellTimeout(ShellSessionError):
+    pass
+
+
+class _SocketChannel:
+    def __init__(self, client: AdbClient, serial: str):
+        self.sock = client.transport(serial)
+        self.sock.settimeout(None)
+        try:
+            client._request(self.sock, "shell,v2,raw:")
+        except Exception:
+            self.sock.close()
+            raise
+        self._pending = b""
+
+    def write(self, data: bytes):
+        self.sock.sendall(struct.pack("<BI", SHELL_STDIN, len(data)) + data)
+
+    def read(self) -> tuple[int, bytes]:
+        while True:
+            while len(self._pending) >= 5:
+                packet_id, size = struct.unpack("<BI", self._pending[:5])
+                if len(self._pending) < 5 + size:
+                    break
+                data = self._pending[5:5 + size]
+                self._pending = self._pending[5 + size:]
+                if packet_id in (SHELL_STDOUT, SHELL_STDERR) and data:
+                    return packet_id, data
+                if packet_id == SHELL_EXIT:
+                    return SHELL_EXIT, b""
+            try:
+                chunk = self.sock.recv(65536)
+            except OSError:
+                return SHELL_EXIT, b""
+            if not chunk:
+                return SHELL_EXIT, b""
+            self._pending += chunk
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class _ProcessChannel:
+    def __init__(self, serial: str):
+        self.proc = subprocess.Popen(["adb", "-s", serial, "shell"],
+                                     stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE)
+        self._streams = {self.proc.stdout.fileno(): SHELL_STDOUT, self.proc.stderr.fileno(): SHELL_STDERR}
+
+    def write(self, data: bytes):
+        self.proc.stdin.write(data)
+        self.proc.stdin.flush()
+
+    def read(self) -> tuple[int, bytes]:
+        while self._streams:
+            ready, _, _ = select.select(list(self._streams), [], [])
+            data = os.read(ready[0], 65536)
+            if data:
+                return self._streams[ready[0]], data
+            del self._streams[ready[0]]
+        return SHELL_EXIT, b""
+
+    def close(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+
+
+class ShellSession:
+    def __init__(self, serial: str, client: AdbClient | None = None,
+                 max_pending: int = 32, timeout: float = 10.0):
+        self.serial = serial
+        self.client = client
+        self.timeout = timeout
+        self.spawns = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._seq = itertools.count()
+        self._channel = None
+        self._buffers = {SHELL_STDOUT: b"", SHELL_STDERR: b""}
+        self._eof = False
+        self._cond = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._work, name=f"shell-{serial}", daemon=True)
+        self._worker.start()
+
+    def _open_channel(self):
+        if self.client is not None:
+            try:
+                return _SocketChannel(self.client, self.serial)
+            except AdbClientError:
+                pass  # no shell_v2 on the device or server not up yet
+        return _ProcessChannel(self.serial)
+
+    def _spawn(self):
+        self._drop_channel()
+        channel = self._open_channel()
+        with self._cond:
+            self._channel = channel
+            self._buffers = {SHELL_STDOUT: b"", SHELL_STDERR: b""}
+            self._eof = False
+        self.spawns += 1
+        threading.Thread(target=self._read_loop, args=(channel,),
+                         name=f"shell-reader-{self.serial}", daemon=True).start()
+
+    def _drop_channel(self):
+        with self._cond:
+            channel, self._channel = self._channel, None
+        if channel is not None:
+            channel.close()
+
+    def _read_loop(self, channel):
+        while True:
+            stream, data = channel.read()
+            with self._cond:
+                if self._channel is not channel:
+                    return
+                if not data:
+                    self._eof = True
+                    self._cond.notify_all()
+                    return
+                self._buffers[stream] += data
+                self._cond.notify_all()
+
+    def submit(self, cmd: str, timeout: float | None = None) -> Future:
+        if self._closed:
+            raise ShellSessionError(f"shell session for {self.serial} is closed")
+        future = Future()
+        try:
+            self._queue.put((cmd, timeout or self.timeout, future), timeout=timeout or self.timeout)
+        except queue.Full:
+            raise ShellSessionError(f"shell queue for {self.serial} is full")
+        return future
+
+    def run(self, cmd: str, timeout: float | None = None) -> tuple[int, str, str]:
+        return self.submit(cmd, timeout).result()
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            cmd, timeout, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self._execute(cmd, timeout))
+            except Exception as e:
+                future.set_exception(e)
+        self._drop_channel()
+
+    def _execute(self, cmd: str, timeout: float) -> tuple[int, str, str]:
+        marker = f"{MARKER}{next(self._seq)}__"
+        # stderr stays apart from what callers parse, its own marker closes it: each stream arrives in order
+        script = (f"{{ {cmd}\n}} </dev/null\n"
+                  f"printf '\\n{marker} %d\\n' $?; printf '\\n{marker}\\n' >&2\n").encode()
+        for attempt in range(2):
+            if self._channel is None or self._eof:
+                self._spawn()
+            try:
+                self._channel.write(script)
+                break
+            except OSError:
+                self._drop_channel()  # session died between commands, respawn and retry once
+                if attempt:
+                    raise ShellSessionError(f"shell session for {self.serial} could not be started")
+
+        pattern = re.compile(rb"\n" + re.escape(marker.encode()) + rb" (\d+)\n")
+        err_pattern = re.compile(rb"\n" + re.escape(marker.encode()) + rb"\n")
+
+        def done():
+            return (pattern.search(self._buffers[SHELL_STDOUT])
+                    and err_pattern.search(self._buffers[SHELL_STDERR])) or self._eof
+
+        with self._cond:
+            timed_out = not self._cond.wait_for(done, timeout)
+            match = pattern.search(self._buffers[SHELL_STDOUT])
+            err_match = err_pattern.search(self._buffers[SHELL_STDERR])
+            if match and err_match:
+                out, err = self._buffers[SHELL_STDOUT], self._buffers[SHELL_STDERR]
+                self._buffers = {SHELL_STDOUT: out[match.end():], SHELL_STDERR: err[err_match.end():]}
+                return (int(match.group(1)), out[:match.start()].decode("utf-8", "replace"),
+                        err[:err_match.start()].decode("utf-8", "replace"))
+        # the command is stuck or the session died mid-command; start fresh next time
+        self._drop_channel()
+        if timed_out:
+            raise ShellTimeout(f"'{cmd}' on {self.serial} timed out after {timeout}s")
+        raise ShellSessionError(f"shell session for {self.serial} died while running '{cmd}'")
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join(timeout=2)
+        self._drop_channel()
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import builtins
+import importlib.util
+import sys
+import time
+from contextlib import contextmanager
+
+
+class StartupProfile:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.imports: list[list] = []
+        self.phases: list[tuple[str, float]] = []
+        self._depth = 0
+        self._import = builtins.__import__
+        if enabled:
+            builtins.__import__ = self._timed_import
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        full = name
+        if level:
+            try:
+                full = importlib.util.resolve_name("." * level + name, (globals or {}).get("__package__"))
+            except (ImportError, ValueError):
+                pass
+        if full in sys.modules:
+            return self._import(name, globals, locals, fromlist, level)
+        entry = [self._depth, full, 0.0]
+        self.imports.append(entry)
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            entry[2] = time.perf_counter() - start
+            self._depth -= 1
+
+    def imported(self):
+        self.phases.append(("imports", time.perf_counter() - self.started))
+        if self.enabled:
+            builtins.__import__ = self._import
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def report(self, threshold: float = 0.001):
+        if not self.enabled:
+            return
+        print("Startup profile:")
+        for name, seconds in self.phases:
+            print(f"  {name:<24}{seconds * 1000:9.1f}ms")
+            if name == "imports":
+                for depth, module, spent in self.imports:
+                    if depth <= 1 and spent >= threshold:
+                        print(f"    {'  ' * depth}{module:<{22 - 2 * depth}}{spent * 1000:9.1f}ms")
+        print(f"  {'total':<24}{(time.perf_counter() - self.started) * 1000:9.1f}ms")
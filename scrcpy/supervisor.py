@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import contextvars
+import os
+import signal
+import sys
+import threading
+import time
+import warnings
+from enum import Enum
+from typing import Callable
+
+from . import launcher
+from .scrcpy_log import LaunchFailure, ScrcpyLog
+
+
+class WindowState(Enum):
+    STOPPED = "stopped"
+    STARTING = "starting"
+    RUNNING = "running"
+    EXITED = "exited"
+    BACKOFF = "backoff"
+
+
+class Window:
+    def __init__(self, key: str, argv: list[str], resources: launcher.Resources | None = None):
+        self.key = key
+        self.argv = argv
+        self.resources = resources
+        self.state = WindowState.STOPPED
+        self.proc: asyncio.subprocess.Process | None = None
+        self.ready: asyncio.Future | None = None
+        self.log = ScrcpyLog.for_args(argv)
+        self.log_task: asyncio.Task | None = None
+        self.ttff: float | None = None
+        self.returncode: int | None = None
+        self.started = 0.0
+        self.restarts = 0
+        self.failures = 0
+        self.stopping = False
+        self.backoff_task: asyncio.Task | None = None
+
+    @property
+    def pid(self) -> int | None:
+        return self.proc.pid if self.proc else None
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.returncode is None
+
+    def __repr__(self):
+        return f"Window({self.key}, {self.state.value}, pid={self.pid})"
+
+
+class Supervisor:
+    def __init__(self, auto_restart: bool = True, backoff: float = 1.0,
+                 max_backoff: float = 30.0, stable_after: float = 30.0, max_failures: int = 5):
+        self.auto_restart = auto_restart
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+        self.max_failures = max_failures
+        self.windows: dict[str, Window] = {}
+        self.listeners: list[Callable[[Window], None]] = []
+        self.log_listeners: list[Callable[[Window, str | None], None]] = []
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name="supervisor", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        if sys.version_info < (3, 12) and hasattr(os, "pidfd_open"):
+            # exit notifications straight from the loop instead of a waitpid thread per child
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", DeprecationWarning)
+                watcher = asyncio.PidfdChildWatcher()
+                watcher.attach_loop(self.loop)
+                asyncio.set_child_watcher(watcher)
+        self.loop.run_forever()
+
+    def call(self, coro, timeout: float | None = None):
+        # in the caller's context, e.g. the control request whose reply gets the launch messages
+        context = contextvars.copy_context()
+
+        async def run():
+            return await self.loop.create_task(coro, context=context)
+        return asyncio.run_coroutine_threadsafe(run(), self.loop).result(timeout)
+
+    def _set_state(self, window: Window, state: WindowState):
+        window.state = state
+        for listener in self.listeners:
+            try:
+                listener(window)
+            except Exception as e:
+                print(f"Window listener failed: {e}")
+
+    async def _spawn(self, window: Window):
+        window.stopping = False
+        window.returncode = None
+        window.ready = self.loop.create_future()
+        window.log = ScrcpyLog.for_args(window.argv)
+        window.ttff = None
+        window.proc = await asyncio.create_subprocess_exec(*window.argv,
+                                                           stdout=asyncio.subprocess.PIPE,
+                                                           stderr=asyncio.subprocess.STDOUT,
+                                                           **launcher.popen_kwargs())
+        if window.resources:
+            window.resources.attach(window.proc.pid)
+        window.started = time.monotonic()
+        self._set_state(window, WindowState.STARTING)
+        window.log_task = self.loop.create_task(self._read_log(window, window.proc))
+        self.loop.create_task(self._watch(window, window.proc))
+
+    async def _read_log(self, window: Window, proc):
+        log = window.log
+        # keep draining after readiness, a full pipe would stall scrcpy
+        async for raw in proc.stdout:
+            event = log.feed(raw.decode("utf-8", "replace"))
+            if event is None or window.proc is not proc:
+                continue
+            if event == "ready":
+                window.ttff = time.monotonic() - window.started
+                self._set_state(window, WindowState.RUNNING)
+                if not window.ready.done():
+                    window.ready.set_result(True)
+            elif event == "error":
+                print(f"[{window.key}] {log.lines[-1]}")
+            for listener in self.log_listeners:
+                # a failing listener must not stop the drain, scrcpy would block on a full pipe
+                try:
+                    listener(window, event)
+                except Exception as e:
+                    print(f"[{window.key}] log listener failed: {e}")
+
+    async def _watch(self, window: Window, proc):
+        code = await proc.wait()
+        try:
+            # let the reader catch the last error lines, unless a leftover child holds the pipe open
+            await asyncio.wait_for(asyncio.shield(window.log_task), 0.5)
+        except asyncio.TimeoutError:
+            pass
+        # reap whatever scrcpy left behind in its group
+        launcher.signal_leftovers(proc.pid, signal.SIGTERM)
+        if window.proc is not proc:
+            return
+        if window.resources:
+            window.resources.release()
+        window.returncode = code
+        if window.ready and not window.ready.done():
+            window.ready.set_result(False)
+        if window.stopping:
+            return
+        self._set_state(window, WindowState.EXITED)
+        # scrcpy exits 0 when the user closes the window, only crashes are restarted
+        if code == 0 or not self.auto_restart or window.log.failure is LaunchFailure.APP_NOT_FOUND:
+            return
+        ran = time.monotonic() - window.started
+        window.failures = 1 if ran >= self.stable_after else window.failures + 1
+        if window.failures > self.max_failures:
+            print(f"Window '{window.key}' keeps crashing (exit {code}), giving up.")
+            return
+        delay = min(self.backoff * 2 ** (window.failures - 1), self.max_backoff)
+        print(f"Window '{window.key}' exited with code {code}, restarting in {delay:.1f}s...")
+        self._set_state(window, WindowState.BACKOFF)
+        window.backoff_task = self.loop.create_task(self._restart_later(window, delay))
+
+    async def _restart_later(self, window: Window, delay: float):
+        await asyncio.sleep(delay)
+        if window.stopping:
+            return
+        window.restarts += 1
+        try:
+            await self._spawn(window)
+        except OSError as e:
+            print(f"Failed to restart {window.key}: {e}")
+            self._set_state(window, WindowState.EXITED)
+
+    async def _launch(self, key: str, argv: list[str], timeout: float = 15,
+                      resources: launcher.Resources | None = None) -> bool:
+        window = self.windows.get(key)
+        if window is not None:
+            await self._stop(window)
+            window.argv = argv
+            window.resources = resources
+            window.failures = 0
+        else:
+            window = self.windows[key] = Window(key, argv, resources)
+        print(f"Waiting up to {timeout}s for window '{key}' to appear...")
+        try:
+            await self._spawn(window)
+        except OSError as e:
+            print(f"Failed to start {key}: {e}")
+            self._set_state(window, WindowState.EXITED)
+            return False
+        try:
+            ready = await asyncio.wait_for(asyncio.shield(window.ready), timeout)
+        except asyncio.TimeoutError:
+            ready = False
+        if ready:
+            print(f"Window '{key}' is streaming after {window.ttff:.2f}s.")
+        elif window.log.failure:
+            print(f"Window '{key}' failed to start: {window.log.failure.value}. You can retry manually.")
+        else:
+            print(f"Window '{key}' did not start within {timeout}s. You can retry manually.")
+        return ready
+
+    async def _stop(self, window: Window, timeout: float = 5):
+        await self._stop_windows([window], timeout)
+
+    async def _stop_windows(self, windows: list[Window], timeout: float):
+        for window in windows:
+            window.stopping = True
+            if window.backoff_task:
+                window.backoff_task.cancel()
+                window.backoff_task = None
+        # one deadline for the whole batch, not one per window
+        await launcher.terminate([window.proc for window in windows if window.proc], timeout)
+        for window in windows:
+            if window.resources:
+                window.resources.release()
+            if window.state is not WindowState.STOPPED:
+                self._set_state(window, WindowState.STOPPED)
+
+    async def _stop_many(self, keys: list[str], timeout: float):
+        await self._stop_windows([self.windows[key] for key in keys if key in self.windows], timeout)
+
+    def stop(self, key: str, timeout: float = 5):
+        self.stop_many([key], timeout)
+
+    def stop_many(self, keys: list[str], timeout: float = 5):
+        self.call(self._stop_many(keys, timeout))
+
+    def forget(self, key: str):
+        self.stop(key)
+        self.loop.call_soon_threadsafe(self.windows.pop, key, None)
+
+    def shutdown(self, timeout: float = 5):
+        self.stop_many(list(self.windows), timeout)
+        self.loop.call_soon_threadsafe(self.loop.stop)
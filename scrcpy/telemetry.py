@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING
+
+from .supervisor import Supervisor, Window, WindowState
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def proc_usage(pid: int) -> tuple[int, int] | None:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as f:
+            resident = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    # fields start at state (3rd field of stat): utime and stime are the 14th and 15th
+    return int(fields[11]) + int(fields[12]), resident * PAGE_SIZE
+
+
+def label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class WindowMetrics:
+    def __init__(self, samples: int):
+        self.fps: deque[tuple[float, int]] = deque(maxlen=samples)
+        self.cpu: deque[tuple[float, float]] = deque(maxlen=samples)
+        self.rss: deque[tuple[float, int]] = deque(maxlen=samples)
+        self.ttff: deque[tuple[float, float]] = deque(maxlen=samples)
+        self.starts = 0
+        self.state = WindowState.STOPPED.value
+        self.pid: int | None = None
+        self._ticks: tuple[float, int] | None = None
+
+    @property
+    def restarts(self) -> int:
+        return max(0, self.starts - 1)
+
+    def copy(self) -> "WindowMetrics":
+        metrics = WindowMetrics(self.fps.maxlen)
+        for series in ("fps", "cpu", "rss", "ttff"):
+            getattr(metrics, series).extend(getattr(self, series))
+        metrics.starts, metrics.state, metrics.pid = self.starts, self.state, self.pid
+        return metrics
+
+
+class Telemetry:
+    def __init__(self, supervisor: Supervisor, samples: int = 300, interval: float = 2.0):
+        self.supervisor = supervisor
+        self.samples = samples
+        self.interval = interval
+        self.windows: dict[str, WindowMetrics] = {}
+        self.phases: dict[str, deque[tuple[float, float]]] = {}
+        self.server: "ThreadingHTTPServer | None" = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        # written from the supervisor loop, the sampler, tracer spans of any thread; read by HTTP handlers
+        self._lock = threading.Lock()
+        supervisor.listeners.append(self._on_state)
+        supervisor.log_listeners.append(self._on_log)
+
+    def _metrics(self, key: str) -> WindowMetrics:
+        metrics = self.windows.get(key)
+        if metrics is None:
+            metrics = self.windows[key] = WindowMetrics(self.samples)
+        return metrics
+
+    def _on_state(self, window: Window):
+        with self._lock:
+            metrics = self._metrics(window.key)
+            metrics.state = window.state.value
+            if window.state is WindowState.STARTING:
+                metrics.starts += 1
+                metrics.pid = window.pid
+                metrics._ticks = None
+            elif window.state is WindowState.RUNNING and window.ttff is not None:
+                metrics.ttff.append((time.time(), window.ttff))
+
+    def _on_log(self, window: Window, event: str | None):
+        if event == "fps":
+            with self._lock:
+                self._metrics(window.key).fps.append((time.time(), window.log.fps))
+
+    def _phase(self, name: str, duration: float):
+        with self._lock:
+            self.phases.setdefault(name, deque(maxlen=self.samples)).append((time.time(), duration))
+
+    def on_span(self, span):
+        # tracer listener: connection phases end up in the phase summary too
+        if span.kind == "phase":
+            self._phase(span.name, span.duration)
+
+    def sample(self):
+        now, mono = time.time(), time.monotonic()
+        with self._lock:
+            live = [(metrics, metrics.pid) for metrics in self.windows.values()
+                    if metrics.state in (WindowState.STARTING.value, WindowState.RUNNING.value) and metrics.pid]
+        for metrics, pid in live:
+            usage = proc_usage(pid)
+            if usage is None:
+                continue
+            ticks, rss = usage
+            with self._lock:
+                if metrics.pid != pid:
+                    continue  # restarted while we read /proc
+                if metrics._ticks is not None:
+                    last_mono, last_ticks = metrics._ticks
+                    cpu = 100.0 * (ticks - last_ticks) / CLOCK_TICKS / max(mono - last_mono, 1e-6)
+                    metrics.cpu.append((now, cpu))
+                metrics._ticks = (mono, ticks)
+                metrics.rss.append((now, rss))
+
+    def _snapshot(self) -> tuple[list[tuple[str, WindowMetrics]], list[tuple[str, list[tuple[float, float]]]]]:
+        with self._lock:
+            return (sorted((key, metrics.copy()) for key, metrics in self.windows.items()),
+                    sorted((name, list(samples)) for name, samples in self.phases.items()))
+
+    def _run(self, stop: threading.Event):
+        while not stop.wait(self.interval):
+            self.sample()
+
+    def start(self, port: int | None = None):
+        if self._thread is None:
+            # a fresh event: a sampler that is still winding down must not be revived
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(self._stop,), name="telemetry", daemon=True)
+            self._thread.start()
+        if port and self.server is None:
+            self.serve(port)
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+        if self.server:
+            self.server.shutdown()
+            self.server = None
+
+    def prometheus(self) -> str:
+        lines = []
+
+        def family(name, kind, help_text, rows):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(rows)
+
+        windows, phases = self._snapshot()
+        family("scrcpy_window_up", "gauge", "1 while the window is starting or running.",
+               [f'scrcpy_window_up{{window="{label(k)}",state="{m.state}"}} '
+                f'{int(m.state in ("starting", "running"))}' for k, m in windows])
+        family("scrcpy_window_restarts_total", "counter", "Times the window was started again.",
+               [f'scrcpy_window_restarts_total{{window="{label(k)}"}} {m.restarts}' for k, m in windows])
+        family("scrcpy_window_fps", "gauge", "Last fps reported by --print-fps.",
+               [f'scrcpy_window_fps{{window="{label(k)}"}} {m.fps[-1][1]}' for k, m in windows if m.fps])
+        family("scrcpy_window_time_to_first_frame_seconds", "gauge", "Launch to first texture of the last start.",
+               [f'scrcpy_window_time_to_first_frame_seconds{{window="{label(k)}"}} {m.ttff[-1][1]:.3f}'
+                for k, m in windows if m.ttff])
+        family("scrcpy_window_cpu_percent", "gauge", "Host CPU used by the scrcpy process.",
+               [f'scrcpy_window_cpu_percent{{window="{label(k)}"}} {m.cpu[-1][1]:.1f}' for k, m in windows if m.cpu])
+        family("scrcpy_window_rss_bytes", "gauge", "Resident memory of the scrcpy process.",
+               [f'scrcpy_window_rss_bytes{{window="{label(k)}"}} {m.rss[-1][1]}' for k, m in windows if m.rss])
+        rows = []
+        for name, samples in phases:
+            durations = [d for _, d in samples]
+            rows.append(f'scrcpy_connect_phase_seconds_sum{{phase="{label(name)}"}} {sum(durations):.3f}')
+            rows.append(f'scrcpy_connect_phase_seconds_count{{phase="{label(name)}"}} {len(durations)}')
+        family("scrcpy_connect_phase_seconds", "summary", "Duration of _connect_device phases.", rows)
+        return "\n".join(lines) + "\n"
+
+    def jsonl(self) -> str:
+        records = []
+        windows, phases = self._snapshot()
+        for key, metrics in windows:
+            for series in ("fps", "cpu", "rss", "ttff"):
+                for ts, value in getattr(metrics, series):
+                    records.append({"ts": ts, "window": key, "metric": series, "value": value})
+            records.append({"ts": time.time(), "window": key, "metric": "restarts", "value": metrics.restarts})
+        for name, samples in phases:
+            for ts, value in samples:
+                records.append({"ts": ts, "phase": name, "metric": "connect_phase", "value": value})
+        records.sort(key=lambda r: r["ts"])
+        return "".join(json.dumps(r) + "\n" for r in records)
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            f.write(self.jsonl())
+
+    def serve(self, port: int):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, kind = telemetry.prometheus(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.jsonl":
+                    body, kind = telemetry.jsonl(), "application/x-ndjson"
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", kind)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        except OSError as e:
+            print(f"Could not serve metrics on 127.0.0.1:{port}: {e}")
+            return
+        threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True).start()
+        print(f"Metrics on http://127.0.0.1:{port}/metrics")
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+import contextvars
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import subprocess
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable
+
+_current: contextvars.ContextVar["Span | None"] = contextvars.ContextVar("span", default=None)
+_ids = itertools.count(1)
+
+
+def bind(fn: Callable) -> Callable:
+    """Run `fn` under the caller's current span, e.g. in a thread pool."""
+    span = _current.get()
+
+    def run(*args, **kwargs):
+        token = _current.set(span)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+
+class Span:
+    def __init__(self, trace: str, span: int, parent: int | None, name: str, kind: str, attrs: dict):
+        self.trace = trace
+        self.span = span
+        self.parent = parent
+        self.name = name
+        self.kind = kind
+        self.attrs = attrs
+        self.ts = time.time()
+        self.start = time.monotonic()
+        self.end: float | None = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.monotonic()) - self.start
+
+    def record(self) -> dict:
+        return {"trace": self.trace, "span": self.span, "parent": self.parent, "name": self.name,
+                "kind": self.kind, "ts": round(self.ts, 3), "start": round(self.start, 6),
+                "end": round(self.end, 6), "duration": round(self.duration, 6), **self.attrs}
+
+
+class Tracer:
+    def __init__(self, path: Path | None = None, max_bytes: int = 1 << 20, backups: int = 3):
+        self.path: Path | None = None
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.listeners: list[Callable[[Span], None]] = []
+        self._logger: logging.Logger | None = None
+        if path:
+            self.open(path)
+
+    def open(self, path: Path):
+        path = Path(path)
+        if path == self.path:
+            return
+        self.close()
+        self.path = path
+        # not registered with logging: the root logger and its handlers never see spans
+        self._logger = logging.Logger("scrcpy.trace")
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=self.max_bytes,
+                                                       backupCount=self.backups, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self._logger.addHandler(handler)
+
+    def close(self):
+        if self._logger:
+            for handler in self._logger.handlers:
+                handler.close()
+        self._logger = None
+
+    @contextmanager
+    def trace(self, name: str, **attrs):
+        # pid in the id: several managers may share one config dir and log
+        trace_id = f"{os.getpid():x}-{next(_ids)}"
+        with self._span(trace_id, None, name, "connect", attrs) as span:
+            yield span
+
+    @contextmanager
+    def span(self, name: str, kind: str = "phase", **attrs):
+        parent = _current.get()
+        with self._span(parent.trace if parent else None, parent, name, kind, attrs) as span:
+            yield span
+
+    @contextmanager
+    def _span(self, trace_id, parent, name, kind, attrs):
+        span = Span(trace_id, next(_ids), parent.span if parent else None, name, kind, attrs)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.attrs["error"] = str(e) or type(e).__name__
+            raise
+        finally:
+            _current.reset(token)
+            span.end = time.monotonic()
+            self._emit(span)
+
+    def _emit(self, span: Span):
+        for listener in self.listeners:
+            try:
+                listener(span)
+            except Exception:
+                pass
+        # adb calls outside a connect (e.g. the adaptive link probe) would only bury the connects
+        if self._logger and span.trace is not None:
+            self._logger.info(json.dumps(span.record()))
+
+    def command(self, argv: list[str], **attrs):
+        words = argv[1:]
+        if words[:1] == ["-s"]:
+            words = words[2:]
+        return self.span(" ".join(argv[:1] + words[:1]), kind="adb", cmd=" ".join(argv), **attrs)
+
+    def run(self, argv: list[str], **kwargs) -> subprocess.CompletedProcess:
+        """subprocess.run with the command, exit code and output size recorded as a span."""
+        with self.command(argv) as span:
+            result = subprocess.run(argv, **kwargs)
+            span.attrs["code"] = result.returncode
+            span.attrs["bytes"] = sum(len(out) for out in (result.stdout, result.stderr) if out)
+            return result
+
+    def records(self) -> list[dict]:
+        if not self.path:
+            return []
+        files = [self.path.with_name(f"{self.path.name}.{n}") for n in range(self.backups, 0, -1)]
+        records = []
+        for path in [*files, self.path]:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            records.append(json.loads(line))
+                        except ValueError:
+                            continue
+            except OSError:
+                continue
+        return records
+
+    def slowest(self, count: int = 5, top: int = 5) -> list[dict]:
+        traces: dict[str, list[dict]] = {}
+        for record in self.records():
+            traces.setdefault(record["trace"], []).append(record)
+        roots = [r for spans in traces.values() for r in spans if r["parent"] is None]
+        roots.sort(key=lambda r: r["ts"])
+        summary = []
+        for root in roots[-count:]:
+            spans = [s for s in traces[root["trace"]] if s is not root]
+            spans.sort(key=lambda s: s["duration"], reverse=True)
+            summary.append({"root": root, "slowest": spans[:top], "spans": len(spans)})
+        return summary
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT), str(ROOT / "bench")]
+
+from fake_adb_server import FakeAdbServer  # noqa: E402
+
+
+@pytest.fixture
+def adb_server():
+    server = FakeAdbServer(0, devices=2).start()
+    yield server
+    server.close()
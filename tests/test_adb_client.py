@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import socket
+
+import pytest
+
+from scrcpy.adb_client import AdbClient, AdbClientError, AdbServerUnavailable, parse_devices
+
+
+def test_parse_devices():
+    output = ("List of devices attached\n"
+              "FAKE0001               device usb:1-1 product:fake model:Fake_1 transport_id:1\n"
+              "192.168.1.50:5555      offline\n")
+    assert parse_devices(output) == [
+        ("FAKE0001", "device", {"usb": "1-1", "product": "fake", "model": "Fake_1", "transport_id": "1"}),
+        ("192.168.1.50:5555", "offline", {}),
+    ]
+
+
+def test_parse_devices_empty():
+    assert parse_devices("List of devices attached\n\n") == []
+
+
+def test_host_commands(adb_server):
+    client = AdbClient(port=adb_server.port)
+    assert client.version() == 0x29
+    assert [serial for serial, state, _ in client.device_list()] == ["FAKE0001", "FAKE0002"]
+    # adbd only listens on the network once switched to TCP mode
+    assert client.connect("192.168.1.50:5555").startswith("failed to connect")
+    assert client.tcpip(5555, "FAKE0001") == "restarting in TCP mode port: 5555\n"
+    assert client.connect("192.168.1.50:5555") == "connected to 192.168.1.50:5555"
+    assert "192.168.1.50:5555" in [serial for serial, _, _ in client.device_list()]
+
+
+def test_shell_returns_exit_code(adb_server):
+    client = AdbClient(port=adb_server.port)
+    code, out, err = client.shell("FAKE0002", "ip addr show wlan0")
+    assert code == 0
+    assert "inet 192.168.1.51/24" in out
+    assert err == ""
+
+
+def test_unknown_service_fails(adb_server):
+    with pytest.raises(AdbClientError, match="unknown host service"):
+        AdbClient(port=adb_server.port).host_command("host:nonsense")
+
+
+def test_server_unavailable():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    with pytest.raises(AdbServerUnavailable):
+        AdbClient(port=port, timeout=1).version()
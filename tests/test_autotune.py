@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from scrcpy.autotune import Trial, best, grid, motion_cmd, pareto, screen_size
+
+
+def _trial(fps: float | None, cpu: float | None, bitrate: str = "8M") -> Trial:
+    trial = Trial("h264", bitrate, "1920")
+    trial.fps, trial.cpu = fps, cpu
+    return trial
+
+
+def test_pareto_drops_dominated_trials():
+    fast, cheap, worse = _trial(60, 30), _trial(45, 10), _trial(45, 35)
+    assert pareto([fast, cheap, worse]) == [fast, cheap]
+
+
+def test_pareto_ignores_unscored_trials():
+    assert pareto([_trial(None, None), _trial(60, None)]) == []
+
+
+def test_best_takes_the_cheapest_within_tolerance():
+    fast, close, slow = _trial(60, 30), _trial(58, 20), _trial(40, 5)
+    assert best([fast, close, slow], tolerance=0.05) is close
+    assert best([fast, close, slow], tolerance=0.0) is fast
+    assert best([]) is None
+
+
+def test_grid_keeps_hardware_codecs():
+    encoders = {"video": [{"codec": "h264", "hardware": True}, {"codec": "av1", "hardware": False}]}
+    trials = grid(["h264", "av1"], ["4M", "8M"], [1024], encoders)
+    assert [(t.codec, t.bitrate, t.max_size) for t in trials] == [("h264", "4M", "1024"), ("h264", "8M", "1024")]
+
+
+def test_trial_str():
+    assert str(_trial(59.5, None)) == "h264 8M 1920: 59.5 fps, CPU unknown"
+    failed = _trial(None, None)
+    failed.error = "no fps reported"
+    assert str(failed) == "h264 8M 1920: failed: no fps reported"
+
+
+def test_screen_size_prefers_override():
+    assert screen_size("Physical size: 1080x2400\nOverride size: 720x1600\n") == (720, 1600)
+    assert screen_size("") == (1080, 1920)
+    assert motion_cmd(1000, 2000, 1.0).startswith("for i in $(seq 2); do input swipe 500 1500 500 500 300;")
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from scrcpy.config_watch import ConfigWatcher
+
+
+def _watch(tmp_path):
+    config = tmp_path / "config.yml"
+    config.write_text("App: {}\n")
+    reloaded = threading.Event()
+    watcher = ConfigWatcher(config, reloaded.set, debounce=0.1)
+    watcher.start()
+    return config, reloaded, watcher
+
+
+def test_edit_reloads(tmp_path):
+    config, reloaded, watcher = _watch(tmp_path)
+    try:
+        config.write_text("App: {tab_mode: true}\n")
+        assert reloaded.wait(2)
+    finally:
+        watcher.stop()
+
+
+def test_neighbours_and_touches_are_ignored(tmp_path):
+    config, reloaded, watcher = _watch(tmp_path)
+    try:
+        (tmp_path / "trace.log").write_text("{}\n")
+        config.write_text(config.read_text())
+        assert not reloaded.wait(0.5)
+    finally:
+        watcher.stop()
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from scrcpy.control import parse_command
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("all", {"op": "all", "device": None}),
+    ("dc 192.168.1.50:5555", {"op": "dc", "device": "192.168.1.50:5555"}),
+    ("AUTOTUNE", {"op": "autotune", "device": None}),
+    ("devices", {"op": "status"}),
+    ("trace 5", {"op": "trace", "count": 5}),
+    ("trace", {"op": "trace", "count": None}),
+    ("profile", {"op": "profile", "target": None, "name": None}),
+    ("profile Main Camera background", {"op": "profile", "target": "Main Camera", "name": "background"}),
+    ("Main Camera", {"op": "restart", "target": "Main Camera"}),
+])
+def test_parse_command(line, expected):
+    assert parse_command(line) == expected
+
+
+def test_profile_needs_a_name():
+    with pytest.raises(ValueError, match="Usage: profile"):
+        parse_command("profile background")
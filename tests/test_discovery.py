@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from fake_adb_server import FakeAdbd
+from scrcpy.discovery import A_AUTH, A_CNXN, HEADER, Discovery, cnxn_packet, is_adb_reply
+
+
+def _header(command: int, magic: int | None = None) -> bytes:
+    return HEADER.pack(command, 1, 0, 0, 0, command ^ 0xFFFFFFFF if magic is None else magic)
+
+
+def test_is_adb_reply():
+    assert is_adb_reply(_header(A_AUTH))
+    assert is_adb_reply(_header(A_CNXN))
+    assert is_adb_reply(cnxn_packet()[:HEADER.size])
+
+
+def test_is_adb_reply_rejects_other_services():
+    assert not is_adb_reply(_header(A_AUTH, magic=0))
+    assert not is_adb_reply(b"HTTP/1.1 400 Bad Request\r\n\r\n")
+    assert not is_adb_reply(_header(A_AUTH)[:-1])
+
+
+@pytest.fixture
+def phone():
+    # loopback aliases stand in for a subnet: 127.0.0.9 is a phone, 127.0.0.10 an http server
+    adbd = FakeAdbd("127.0.0.9", 0).start()
+    port = adbd.sock.getsockname()[1]
+    http = FakeAdbd("127.0.0.10", port, reply=b"HTTP/1.1 400 Bad Request\r\n\r\n" + bytes(8)).start()
+    yield adbd
+    adbd.close()
+    http.close()
+
+
+def test_scan_finds_adbd(phone, tmp_path):
+    port = phone.sock.getsockname()[1]
+    discovery = Discovery(port, tmp_path / "discovery.json", networks=["127.0.0.8/29"])
+    assert discovery.scan() == [f"127.0.0.9:{port}"]
+    assert discovery.entries["127.0.0.10"]["adb"] is False
+
+
+def test_scan_skips_known_silent_hosts(phone, tmp_path):
+    port = phone.sock.getsockname()[1]
+    Discovery(port, tmp_path / "discovery.json", networks=["127.0.0.8/29"]).scan()
+    # a fresh instance reads the cache: only the phone is probed again
+    discovery = Discovery(port, tmp_path / "discovery.json", networks=["127.0.0.8/29"])
+    assert discovery.pending(discovery.hosts()) == ["127.0.0.9"]
+    connections = phone.connections
+    assert discovery.scan() == [f"127.0.0.9:{port}"]
+    assert phone.connections == connections + 1
+
+
+def test_cache_for_another_port_is_ignored(phone, tmp_path):
+    port = phone.sock.getsockname()[1]
+    Discovery(port, tmp_path / "discovery.json", networks=["127.0.0.8/29"]).scan()
+    assert Discovery(port + 1, tmp_path / "discovery.json").entries == {}
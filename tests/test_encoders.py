@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from fake_adb_server import MEDIA_CODECS
+from fake_scrcpy import ENCODERS
+from scrcpy.encoders import (AUDIO_FALLBACK, VIDEO_FALLBACK, EncoderCache, choose_encoder, parse_list_encoders,
+                             parse_session_limits)
+
+
+def test_parse_list_encoders():
+    encoders = parse_list_encoders(ENCODERS)
+    assert [e["name"] for e in encoders["video"]] == [
+        "c2.fake.avc.encoder", "c2.android.avc.encoder", "c2.fake.hevc.encoder", "c2.android.hevc.encoder"]
+    assert encoders["video"][0] == {"codec": "h264", "name": "c2.fake.avc.encoder", "hardware": True,
+                                    "vendor": True}
+    assert not any(e["hardware"] for e in encoders["audio"])
+
+
+def test_parse_list_encoders_without_hw_flags():
+    # scrcpy < 2.2
+    encoders = parse_list_encoders("    --video-codec=h264 --video-encoder='OMX.qcom.video.encoder.avc'\n"
+                                   "    --video-codec=h264 --video-encoder='OMX.google.h264.encoder'\n")
+    assert [(e["name"], e["hardware"]) for e in encoders["video"]] == [
+        ("OMX.qcom.video.encoder.avc", True), ("OMX.google.h264.encoder", False)]
+
+
+def test_choose_encoder_prefers_hardware():
+    video = parse_list_encoders(ENCODERS)["video"]
+    assert choose_encoder(video, "h264", VIDEO_FALLBACK) == ("h264", "c2.fake.avc.encoder")
+    assert choose_encoder(video, "h265", VIDEO_FALLBACK) == ("h265", "c2.fake.hevc.encoder")
+
+
+def test_choose_encoder_falls_back_to_another_codec():
+    video = parse_list_encoders(ENCODERS)["video"]
+    assert choose_encoder(video, "av1", VIDEO_FALLBACK) == ("h264", "c2.fake.avc.encoder")
+    assert choose_encoder([], "h264", VIDEO_FALLBACK) is None
+
+
+def test_choose_encoder_keeps_the_codec_without_hardware():
+    audio = parse_list_encoders(ENCODERS)["audio"]
+    assert choose_encoder(audio, "opus", AUDIO_FALLBACK) == ("opus", "c2.android.opus.encoder")
+    assert choose_encoder(audio, "aac", AUDIO_FALLBACK) == ("aac", "c2.android.aac.encoder")
+    video = [{"codec": "h264", "name": "c2.qti.avc.encoder", "hardware": True, "vendor": True},
+             {"codec": "av1", "name": "c2.android.av1.encoder", "hardware": False, "vendor": False}]
+    assert choose_encoder(video, "av1", VIDEO_FALLBACK) == ("av1", "c2.android.av1.encoder")
+
+
+def test_parse_session_limits():
+    assert parse_session_limits(MEDIA_CODECS.format(n=3)) == {"video/avc": 3, "video/hevc": 3}
+
+
+def test_encoder_cache_roundtrip(tmp_path):
+    encoders = parse_list_encoders(ENCODERS)
+    EncoderCache(tmp_path / "encoders.json").put("fake/fingerprint", encoders)
+    assert EncoderCache(tmp_path / "encoders.json").get("fake/fingerprint") == encoders
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+import threading
+
+import pytest
+
+from scrcpy.history import ConnectionHistory
+
+
+def test_ranked_prefers_working_endpoints(tmp_path):
+    history = ConnectionHistory(tmp_path / "connections.db")
+    history.attempt("192.168.1.50:5555", ok=False)
+    history.attempt("192.168.1.51:5555", ok=True, seconds=0.2)
+    assert history.ranked("tcp")[0]["socket"] == "192.168.1.51:5555"
+    history.close()
+
+
+def test_failed_write_rolls_back(tmp_path):
+    history = ConnectionHistory(tmp_path / "connections.db")
+    with pytest.raises(sqlite3.OperationalError):
+        with history._write() as db:
+            db.execute("INSERT INTO missing VALUES (1)")
+    # the connection is usable again, no transaction left open
+    history.attempt("192.168.1.50:5555", ok=True, seconds=0.1)
+    assert not history._db().in_transaction
+    history.close()
+
+
+def test_close_closes_every_thread(tmp_path):
+    history = ConnectionHistory(tmp_path / "connections.db")
+    ready, done = threading.Event(), threading.Event()
+
+    def worker():
+        history.attempt("192.168.1.50:5555", ok=True, seconds=0.1)
+        ready.set()
+        done.wait(2)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    ready.wait(2)
+    dbs = list(history._dbs.values())
+    assert len(dbs) == 2
+    history.close()
+    done.set()
+    thread.join()
+    for db in dbs:
+        with pytest.raises(sqlite3.ProgrammingError):
+            db.execute("SELECT 1")
+    # reopened on the next use
+    assert history.ranked("tcp")
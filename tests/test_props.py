@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from scrcpy.props import FINGERPRINT, SERIALNO, PropertyCache, parse_getprop, same_device
+
+PROPS = {FINGERPRINT: "fake/fake/fake:14/UP1A/1:user/release-keys", SERIALNO: "FAKE0001"}
+
+
+def test_parse_getprop():
+    output = "[ro.product.model]: [Pixel 8]\n[ro.empty]: []\nnot a prop\n"
+    assert parse_getprop(output) == {"ro.product.model": "Pixel 8", "ro.empty": ""}
+
+
+def test_same_device():
+    assert same_device(PROPS, f"{PROPS[FINGERPRINT]}\n{PROPS[SERIALNO]}\n")
+    # same build on another unit behind a reused address
+    assert not same_device(PROPS, f"{PROPS[FINGERPRINT]}\nFAKE0002\n")
+    assert not same_device(PROPS, "")
+
+
+def test_cache_roundtrip(tmp_path):
+    PropertyCache(tmp_path / "props.json").put("FAKE0001", PROPS)
+    cache = PropertyCache(tmp_path / "props.json")
+    assert cache.get("FAKE0001") == PROPS
+    cache.invalidate("FAKE0001")
+    assert cache.get("FAKE0001") is None
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+from scrcpy.adb_client import AdbClient
+from scrcpy.shell_session import ShellSession
+
+
+def test_commands_share_one_session(adb_server):
+    session = ShellSession("FAKE0002", AdbClient(port=adb_server.port))
+    try:
+        assert session.run("getprop ro.serialno") == (0, "FAKE0002\n", "")
+        code, out, err = session.run("ip -f inet addr show wlan0")
+        assert "inet 192.168.1.51/24" in out and err == ""
+        assert session.spawns == 1
+    finally:
+        session.close()